@@ -1,19 +1,34 @@
 import numpy as np
 import datetime as dt
+import os
 import re
+import hashlib
+import logging
+import weakref
 import xugrid as xu
 import xarray as xr
+import pandas as pd
 import matplotlib.pyplot as plt
 from dfm_tools.xarray_helpers import Dataset_varswithdim
 from dfm_tools.xugrid_helpers import get_vertical_dimensions, decode_default_fillvals
 
 __all__ = ["polyline_mapslice",
+           "Transect",
+           "get_transects",
+           "slice_transects",
+           "PointExtractor",
            "reconstruct_zw_zcc",
+           "clear_zw_zcc_cache",
            "get_Dataset_atdepths",
            "rasterize_ugrid",
+           "Rasterizer",
+           "ConservativeRegridder",
+           "rasterize_ugrid_tiled",
            "plot_ztdata",
     ]
 
+logger = logging.getLogger(__name__)
+
 def calc_dist_pythagoras(x1,x2,y1,y2):
     distance = np.sqrt((x2 - x1)**2 + (y2 - y1)**2)
     return distance
@@ -39,10 +54,40 @@ def calc_dist_haversine(lon1,lon2,lat1,lat2):
     return distance
 
 
-def intersect_edges_withsort(uds,edges): #TODO: move sorting to xugrid? https://deltares.github.io/xugrid/api/xugrid.Ugrid2d.intersect_edges.html
+def intersect_edges_bbox(grid, edges):
+    """
+    grid.intersect_edges() with a bounding box prefilter. The intersection is only done for a 
+    subgrid of the faces that overlap with the bounding box of the edges, so a celltree is only 
+    built for these faces. This is much faster for large grids and short lines. The face indices 
+    of the subgrid are mapped back to the face indices of the grid.
+    """
+    xmin, ymin = edges.min(axis=(0,1))
+    xmax, ymax = edges.max(axis=(0,1))
+    face_bounds = grid.face_bounds
+    bool_inbbox = ((face_bounds[:,0] <= xmax) & (face_bounds[:,2] >= xmin) & 
+                   (face_bounds[:,1] <= ymax) & (face_bounds[:,3] >= ymin))
+    face_index_bbox = np.flatnonzero(bool_inbbox)
+    if len(face_index_bbox) == 0:
+        return np.array([], dtype=int), np.array([], dtype=int), np.empty((0,2,2))
+    if len(face_index_bbox) == grid.n_face:
+        return grid.intersect_edges(edges)
     
-    edge_index, face_index, intersections = uds.grid.intersect_edges(edges) #TODO: is fast, but maybe speed can be increased with bounding box?
+    # all nodes are kept, so no renumbering of the face_node_connectivity is required
+    grid_bbox = xu.Ugrid2d(node_x=grid.node_x, node_y=grid.node_y, fill_value=grid.fill_value,
+                           face_node_connectivity=grid.face_node_connectivity[face_index_bbox])
+    edge_index, face_index, intersections = grid_bbox.intersect_edges(edges)
+    return edge_index, face_index_bbox[face_index], intersections
+
+
+def intersect_edges_withsort(uds,edges): #TODO: move sorting to xugrid? https://deltares.github.io/xugrid/api/xugrid.Ugrid2d.intersect_edges.html
     
+    grid = uds.grid if hasattr(uds, "grid") else uds
+    edge_index, face_index, intersections = intersect_edges_bbox(grid, edges)
+    edge_index, face_index, intersections = sort_intersections(edges, edge_index, face_index, intersections)
+    return edge_index, face_index, intersections
+
+
+def sort_intersections(edges, edge_index, face_index, intersections):
     #ordering of face_index is wrong (visible with cb3 with long line_array), so sort on distance from startpoint (in x/y units)
     
     #compute distance from start of line to start of each linepart
@@ -63,10 +108,22 @@ def intersect_edges_withsort(uds,edges): #TODO: move sorting to xugrid? https://
     return edge_index, face_index, intersections
 
 
-def get_xzcoords_onintersection(uds, face_index, crs_dist_starts, crs_dist_stops):
+def get_crs_verts_x(crs_dist_starts, crs_dist_stops, nlay):
+    """
+    horizontal vertex coordinates (distance along the line) of all cross-section cells,
+    these are equal for all layers and timesteps.
+    """
+    crs_dist_starts_matrix = np.repeat(crs_dist_starts[np.newaxis],nlay,axis=0)
+    crs_dist_stops_matrix = np.repeat(crs_dist_stops[np.newaxis],nlay,axis=0)
+    crs_verts_x_all = np.array([[crs_dist_starts_matrix.ravel(),crs_dist_stops_matrix.ravel(),crs_dist_stops_matrix.ravel(),crs_dist_starts_matrix.ravel()]]).T
+    return crs_verts_x_all
+
+
+def get_xzcoords_onintersection(uds, face_index, crs_dist_starts, crs_dist_stops, crs_verts_x=None):
     #TODO: remove hardcoding of variable names
-    if 'time' in uds.dims: #TODO: maybe make time dependent grid?
-        raise Exception('time dimension present in uds, provide uds.isel(time=timestep) instead. This is necessary to retrieve correct waterlevel or fullgrid output')
+    if 'time' in uds.dims:
+        raise Exception('time dimension present in uds, provide uds.isel(time=timestep) instead. This is necessary to retrieve correct waterlevel or fullgrid output. '
+                        'Use dfmt.Transect().slice_time() to lazily slice all timesteps at once.')
     
     dimn_layer, dimn_interfaces = get_vertical_dimensions(uds)
     gridname = uds.grid.name
@@ -92,10 +149,19 @@ def get_xzcoords_onintersection(uds, face_index, crs_dist_starts, crs_dist_stops
         data_frommap_bl_sel = uds_sel[f'{gridname}_flowelem_bl'].to_numpy()
         zvals_interface = np.linspace(data_frommap_bl_sel,data_frommap_wl3_sel,nlay+1)
 
-    #derive crs_verts
-    crs_dist_starts_matrix = np.repeat(crs_dist_starts[np.newaxis],nlay,axis=0)
-    crs_dist_stops_matrix = np.repeat(crs_dist_stops[np.newaxis],nlay,axis=0)
-    crs_verts_x_all = np.array([[crs_dist_starts_matrix.ravel(),crs_dist_stops_matrix.ravel(),crs_dist_stops_matrix.ravel(),crs_dist_starts_matrix.ravel()]]).T
+    #derive crs_verts, the horizontal part can be precomputed (e.g. by dfmt.Transect)
+    if crs_verts_x is None:
+        crs_verts_x = get_crs_verts_x(crs_dist_starts, crs_dist_stops, nlay)
+    xr_crs_ugrid = get_crs_ugrid(uds_sel, zvals_interface=zvals_interface, crs_verts_x=crs_verts_x, dimn_layer=dimn_layer)
+    return xr_crs_ugrid
+
+
+def get_crs_ugrid(uds_sel, zvals_interface, crs_verts_x, dimn_layer):
+    """
+    construct the cross-section ugrid dataset from the dataset sliced on the crossed faces (ncrossed_faces dimension),
+    the interface z-values with shape (ninterfaces, ncrossed_faces) and the horizontal vertex coordinates.
+    """
+    crs_verts_x_all = crs_verts_x
     crs_verts_z_all = np.ma.array([zvals_interface[1:,:].ravel(),zvals_interface[1:,:].ravel(),zvals_interface[:-1,:].ravel(),zvals_interface[:-1,:].ravel()]).T[:,:,np.newaxis]
     crs_verts = np.ma.concatenate([crs_verts_x_all, crs_verts_z_all], axis=2)
     
@@ -119,9 +185,32 @@ def get_xzcoords_onintersection(uds, face_index, crs_dist_starts, crs_dist_stops
     return xr_crs_ugrid
 
 
+def get_crs_dataset(ds_sel, crs_dist_starts, crs_dist_stops, gridname, dimn_layer, dimn_interfaces):
+    """
+    add the distances along the line and the time-varying z-values of the bottom and top of each cell as coordinates
+    to the dataset sliced on the crossed faces (ncrossed_faces dimension), used by dfmt.Transect().slice_time().
+    """
+    if dimn_layer in ds_sel.dims: #3D model
+        zw_filled = ds_sel[f'{gridname}_flowelem_zw'].bfill(dim=dimn_interfaces) #fill nan values (below bed) with equal values
+        z_bottom = zw_filled.isel({dimn_interfaces:slice(None,-1)}).rename({dimn_interfaces:dimn_layer})
+        z_top = zw_filled.isel({dimn_interfaces:slice(1,None)}).rename({dimn_interfaces:dimn_layer})
+    else: #2D model, no layers
+        z_bottom = ds_sel[f'{gridname}_flowelem_bl'] #TODO: add escape for missing wl/bl vars
+        z_top = ds_sel[f'{gridname}_s1']
+    z_bottom, z_top = xr.broadcast(z_bottom, z_top)
+    
+    ds_crs = ds_sel.assign_coords(crs_dist_start=('ncrossed_faces', crs_dist_starts),
+                                  crs_dist_stop=('ncrossed_faces', crs_dist_stops),
+                                  crs_z_bottom=z_bottom.variable,
+                                  crs_z_top=z_top.variable)
+    ds_crs = ds_crs.transpose('time', dimn_layer, 'ncrossed_faces', ..., missing_dims='ignore')
+    return ds_crs
+
+
 def polyline_mapslice(uds:xu.UgridDataset, line_array:np.array) -> xu.UgridDataset:
     """
     Slice trough mapdata, combine: intersect_edges_withsort, calculation of distances and conversion to ugrid dataset.
+    To slice multiple timesteps or datasets along the same line, use dfmt.Transect to compute the intersection only once.
 
     Parameters
     ----------
@@ -144,28 +233,475 @@ def polyline_mapslice(uds:xu.UgridDataset, line_array:np.array) -> xu.UgridDatas
 
     """
     
-    #compute intersection coordinates of crossings between edges and faces and their respective indices
-    edges = np.stack([line_array[:-1],line_array[1:]],axis=1)
-    edge_index, face_index, intersections = intersect_edges_withsort(uds=uds, edges=edges)
-    if len(edge_index) == 0:
-        raise ValueError('polyline does not cross mapdata')
+    transect = Transect(uds.grid, line_array)
+    xr_crs_ugrid = transect.slice(uds)
+    return xr_crs_ugrid
+
+
+class Transect:
+    """
+    Intersection of a polyline with a ugrid grid, that can be applied to any number of datasets 
+    (e.g. timesteps or variables) on that grid. The intersected faces, their sorted distances along the 
+    line and the horizontal vertex layout are only computed once upon initialization. The intersection is
+    prefiltered with the bounding box of the line, so a celltree is only built for the faces within it.
+    
+    Examples
+    --------
+    >>> transect = dfmt.Transect(uds.grid, line_array)
+    >>> for timestep in range(10):
+    >>>     uds_crs = transect.slice(uds.isel(time=timestep))
+    """
+    def __init__(self, grid, line_array:np.array):
+        """
+        Parameters
+        ----------
+        grid : xu.Ugrid2d, xu.UgridDataset or xu.UgridDataArray
+            grid to intersect the line with.
+        line_array : np.array
+            array with shape (npoints, 2) with the x/y coordinates of the line.
+
+        Raises
+        ------
+        ValueError
+            if the polyline does not cross the grid.
+        """
+        if isinstance(grid, (xu.UgridDataset, xu.UgridDataArray)):
+            grid = grid.grid
+        line_array = np.asarray(line_array)
+        
+        #compute intersection coordinates of crossings between edges and faces and their respective indices
+        edges = np.stack([line_array[:-1],line_array[1:]],axis=1)
+        edge_index, face_index, intersections = intersect_edges_withsort(uds=grid, edges=edges)
+        self._set_intersections(grid, line_array, edge_index, face_index, intersections)
+    
+    @classmethod
+    def from_intersections(cls, grid, line_array:np.array, edge_index:np.array, face_index:np.array, intersections:np.array):
+        """
+        Create a transect from the sorted intersections of the line with the grid, like returned by 
+        intersect_edges_withsort(). This is used to intersect multiple lines at once in get_transects().
+        """
+        transect = cls.__new__(cls)
+        transect._set_intersections(grid, np.asarray(line_array), edge_index, face_index, intersections)
+        return transect
+    
+    def _set_intersections(self, grid, line_array, edge_index, face_index, intersections):
+        if len(edge_index) == 0:
+            raise ValueError('polyline does not cross mapdata')
+        self.grid = grid
+        self.line_array = line_array
+        edges = np.stack([line_array[:-1],line_array[1:]],axis=1)
+        
+        if grid.is_geographic:
+            calc_dist = calc_dist_haversine
+        else:
+            calc_dist = calc_dist_pythagoras
+        
+        #compute pyt/haversine start/stop distances for all intersections
+        edge_len = calc_dist(edges[:,0,0], edges[:,1,0], edges[:,0,1], edges[:,1,1])
+        edge_len_cum = np.cumsum(edge_len)
+        edge_len_cum0 = np.concatenate([[0],edge_len_cum[:-1]])
+        crs_dist_starts = calc_dist(edges[edge_index,0,0], intersections[:,0,0], edges[edge_index,0,1], intersections[:,0,1]) + edge_len_cum0[edge_index]
+        crs_dist_stops  = calc_dist(edges[edge_index,0,0], intersections[:,1,0], edges[edge_index,0,1], intersections[:,1,1]) + edge_len_cum0[edge_index]
+        
+        self.edge_index = edge_index
+        self.face_index = face_index
+        self.intersections = intersections
+        self.crs_dist_starts = crs_dist_starts
+        self.crs_dist_stops = crs_dist_stops
+        self._crs_verts_x = {}
+    
+    def __len__(self):
+        return len(self.face_index)
+    
+    def get_crs_verts_x(self, nlay:int):
+        """
+        horizontal vertex layout for nlay layers, cached per amount of layers
+        """
+        if nlay not in self._crs_verts_x:
+            self._crs_verts_x[nlay] = get_crs_verts_x(self.crs_dist_starts, self.crs_dist_stops, nlay)
+        return self._crs_verts_x[nlay]
+    
+    def slice(self, uds:xu.UgridDataset) -> xu.UgridDataset:
+        """
+        Slice a dataset on the grid of this transect. The dataset cannot contain a time dimension,
+        provide uds.isel(time=timestep) instead.
+
+        Parameters
+        ----------
+        uds : xu.UgridDataset
+            dataset with the same grid as the transect.
+
+        Raises
+        ------
+        ValueError
+            if the amount of faces of the dataset does not match the grid of the transect.
+
+        Returns
+        -------
+        xr_crs_ugrid : xu.UgridDataset
+            dataset with the cross-section grid (distance along line versus z).
+
+        """
+        if uds.grid.n_face != self.grid.n_face:
+            raise ValueError(f'the dataset has {uds.grid.n_face} faces, but the transect was derived for a grid with {self.grid.n_face} faces')
+        
+        dimn_layer, _ = get_vertical_dimensions(uds)
+        if dimn_layer in uds.dims:
+            nlay = uds.sizes[dimn_layer]
+        else:
+            nlay = 1
+        
+        #derive vertices from cross section (distance from first point)
+        xr_crs_ugrid = get_xzcoords_onintersection(uds=uds, face_index=self.face_index, 
+                                                   crs_dist_starts=self.crs_dist_starts, 
+                                                   crs_dist_stops=self.crs_dist_stops, 
+                                                   crs_verts_x=self.get_crs_verts_x(nlay))
+        return xr_crs_ugrid
+    
+    def slice_time(self, uds:xu.UgridDataset) -> xr.Dataset:
+        """
+        Lazily slice a dataset including the time dimension, without looping over the timesteps.
+        The result is a xr.Dataset with (time, layer, ncrossed_faces) variables and time-varying z-vertices 
+        in the crs_z_bottom and crs_z_top coordinates. The distances along the line are available in the 
+        crs_dist_start and crs_dist_stop coordinates. All variables are dask arrays if uds is chunked, so all 
+        timesteps are computed in one graph. Use Transect.to_ugrid() on a single timestep for plotting.
+
+        Parameters
+        ----------
+        uds : xu.UgridDataset
+            dataset with the same grid as the transect, with or without time dimension.
+
+        Raises
+        ------
+        ValueError
+            if the amount of faces of the dataset does not match the grid of the transect.
+
+        Returns
+        -------
+        ds_crs : xr.Dataset
+            dataset with the variables on the crossed faces.
+
+        """
+        if uds.grid.n_face != self.grid.n_face:
+            raise ValueError(f'the dataset has {uds.grid.n_face} faces, but the transect was derived for a grid with {self.grid.n_face} faces')
+        
+        dimn_layer, dimn_interfaces = get_vertical_dimensions(uds)
+        gridname = uds.grid.name
+        
+        #construct fullgrid info (zcc/zw) for 3D models
+        if dimn_layer in uds.dims:
+            uds = reconstruct_zw_zcc(uds)
+        
+        #drop all variables that do not contain a face dimension, then select only all sliced faceidx
+        xu_facedim = uds.grid.face_dimension
+        face_index_xr = xr.DataArray(self.face_index,dims=('ncrossed_faces'))
+        ds_sel = Dataset_varswithdim(uds.obj,dimname=xu_facedim).isel({xu_facedim:face_index_xr})
+        
+        ds_crs = get_crs_dataset(ds_sel, crs_dist_starts=self.crs_dist_starts, crs_dist_stops=self.crs_dist_stops,
+                                 gridname=gridname, dimn_layer=dimn_layer, dimn_interfaces=dimn_interfaces)
+        return ds_crs
     
-    if uds.grids[0].is_geographic:
-        calc_dist = calc_dist_haversine
+    def to_ugrid(self, ds_crs:xr.Dataset) -> xu.UgridDataset:
+        """
+        Convert a single timestep of the result of Transect.slice_time() to a cross-section ugrid dataset 
+        (distance along line versus z), like returned by Transect.slice().
+
+        Parameters
+        ----------
+        ds_crs : xr.Dataset
+            result of Transect.slice_time() without time dimension, e.g. ds_crs.isel(time=timestep).
+
+        Raises
+        ------
+        ValueError
+            if a time dimension is present.
+
+        Returns
+        -------
+        xr_crs_ugrid : xu.UgridDataset
+            dataset with the cross-section grid.
+
+        """
+        if 'time' in ds_crs.dims:
+            raise ValueError('time dimension present in ds_crs, provide ds_crs.isel(time=timestep) instead')
+        
+        z_bottom = ds_crs['crs_z_bottom']
+        z_top = ds_crs['crs_z_top']
+        dims_layer = [dim for dim in z_bottom.dims if dim != 'ncrossed_faces']
+        if len(dims_layer) == 0: #2D model, no layers
+            dimn_layer = None
+            nlay = 1
+            zvals_interface = np.stack([z_bottom.to_numpy(), z_top.to_numpy()])
+        else: #3D model
+            dimn_layer = dims_layer[0]
+            nlay = ds_crs.sizes[dimn_layer]
+            z_bottom = z_bottom.transpose(dimn_layer,'ncrossed_faces').to_numpy()
+            z_top = z_top.transpose(dimn_layer,'ncrossed_faces').to_numpy()
+            zvals_interface = np.concatenate([z_bottom, z_top[-1:]], axis=0)
+        
+        varns_crs = ['crs_dist_start', 'crs_dist_stop', 'crs_z_bottom', 'crs_z_top']
+        ds_sel = ds_crs.drop_vars(varns_crs)
+        if dimn_layer is not None:
+            ds_sel = ds_sel.transpose(dimn_layer, 'ncrossed_faces', ...)
+        xr_crs_ugrid = get_crs_ugrid(ds_sel, zvals_interface=zvals_interface, 
+                                     crs_verts_x=self.get_crs_verts_x(nlay), dimn_layer=dimn_layer)
+        return xr_crs_ugrid
+
+
+def get_transects(grid, lines) -> dict:
+    """
+    Intersect many lines with the grid at once, with a single intersection of all line segments.
+
+    Parameters
+    ----------
+    grid : xu.Ugrid2d, xu.UgridDataset or xu.UgridDataArray
+        grid to intersect the lines with.
+    lines : gpd.GeoDataFrame, hcdfm.PolyFile or dict
+        GeoDataFrame with LineString geometries (named after the "name" column if present, otherwise the index),
+        a PolyFile or a dictionary with names and arrays with shape (npoints, 2).
+
+    Raises
+    ------
+    ValueError
+        if none of the lines cross the grid.
+
+    Returns
+    -------
+    transects : dict
+        dictionary with the names of the crossing lines and their dfmt.Transect. Lines that do not cross the grid are skipped.
+
+    """
+    import geopandas as gpd
+    import hydrolib.core.dflowfm as hcdfm
+    from dfm_tools.hydrolib_helpers import PolyFile_to_geodataframe_linestrings
+    
+    if isinstance(grid, (xu.UgridDataset, xu.UgridDataArray)):
+        grid = grid.grid
+    if isinstance(lines, hcdfm.PolyFile):
+        lines = PolyFile_to_geodataframe_linestrings(lines)
+    if isinstance(lines, gpd.GeoDataFrame):
+        if 'name' in lines.columns:
+            names = lines['name'].astype(str)
+        else:
+            names = lines.index.astype(str)
+        lines = {name:np.array(geom.coords)[:,:2] for name, geom in zip(names, lines.geometry)}
+    
+    #intersect all line segments at once
+    edges_list = [np.stack([line_array[:-1],line_array[1:]],axis=1) for line_array in lines.values()]
+    nedges = np.array([len(edges) for edges in edges_list])
+    edges_offset = np.concatenate([[0],np.cumsum(nedges)[:-1]])
+    edges_all = np.concatenate(edges_list, axis=0)
+    edge_index_all, face_index_all, intersections_all = intersect_edges_bbox(grid, edges_all)
+    line_index_all = np.searchsorted(edges_offset, edge_index_all, side='right') - 1
+    
+    transects = {}
+    for iline, (name, line_array) in enumerate(lines.items()):
+        bool_line = line_index_all == iline
+        if not bool_line.any():
+            print(f'line "{name}" does not cross mapdata, skipping it')
+            continue
+        edge_index, face_index, intersections = sort_intersections(edges_list[iline], edge_index_all[bool_line] - edges_offset[iline],
+                                                                   face_index_all[bool_line], intersections_all[bool_line])
+        transects[name] = Transect.from_intersections(grid, line_array, edge_index, face_index, intersections)
+    if len(transects) == 0:
+        raise ValueError('none of the polylines cross mapdata')
+    return transects
+
+
+def slice_transects(uds:xu.UgridDataset, lines) -> xr.Dataset:
+    """
+    Lazily slice a dataset along many lines at once, like dfmt.Transect().slice_time() but with one 
+    intersection of all lines and one selection of the union of the crossed faces. The result is a 
+    xr.Dataset with (time, layer, ncrossed_faces) variables of all transects, concatenated along the 
+    ncrossed_faces dimension. The indexed "transect" coordinate contains the name of the transect for 
+    each crossed face, so a single transect can be selected with ds_crs.sel(transect=name).
+    
+    Examples
+    --------
+    >>> transects = dfmt.get_transects(uds.grid, gdf_lines)
+    >>> ds_crs = dfmt.slice_transects(uds, transects)
+    >>> uds_crs = transects[name].to_ugrid(ds_crs.sel(transect=name).isel(time=-1))
+
+    Parameters
+    ----------
+    uds : xu.UgridDataset
+        dataset to slice, with or without time dimension.
+    lines : gpd.GeoDataFrame, hcdfm.PolyFile or dict
+        lines like supported by dfmt.get_transects() or a dictionary of dfmt.Transect as returned by it.
+
+    Raises
+    ------
+    ValueError
+        if the amount of faces of the dataset does not match the grid of the transects.
+
+    Returns
+    -------
+    ds_crs : xr.Dataset
+        dataset with the variables on the crossed faces of all transects.
+
+    """
+    if isinstance(lines, dict) and all(isinstance(transect, Transect) for transect in lines.values()):
+        transects = lines
     else:
-        calc_dist = calc_dist_pythagoras
+        transects = get_transects(uds.grid, lines)
+    for transect in transects.values():
+        if uds.grid.n_face != transect.grid.n_face:
+            raise ValueError(f'the dataset has {uds.grid.n_face} faces, but the transects were derived for a grid with {transect.grid.n_face} faces')
     
-    #compute pyt/haversine start/stop distances for all intersections
-    edge_len = calc_dist(edges[:,0,0], edges[:,1,0], edges[:,0,1], edges[:,1,1])
-    edge_len_cum = np.cumsum(edge_len)
-    edge_len_cum0 = np.concatenate([[0],edge_len_cum[:-1]])
-    crs_dist_starts = calc_dist(edges[edge_index,0,0], intersections[:,0,0], edges[edge_index,0,1], intersections[:,0,1]) + edge_len_cum0[edge_index]
-    crs_dist_stops  = calc_dist(edges[edge_index,0,0], intersections[:,1,0], edges[edge_index,0,1], intersections[:,1,1]) + edge_len_cum0[edge_index]
+    dimn_layer, dimn_interfaces = get_vertical_dimensions(uds)
+    gridname = uds.grid.name
     
-    #derive vertices from cross section (distance from first point)
-    xr_crs_ugrid = get_xzcoords_onintersection(uds=uds, face_index=face_index, crs_dist_starts=crs_dist_starts, crs_dist_stops=crs_dist_stops)
+    #construct fullgrid info (zcc/zw) for 3D models
+    if dimn_layer in uds.dims:
+        uds = reconstruct_zw_zcc(uds)
     
-    return xr_crs_ugrid
+    #select the union of the crossed faces only once
+    xu_facedim = uds.grid.face_dimension
+    face_index_all = np.concatenate([transect.face_index for transect in transects.values()])
+    face_index_union, face_index_inverse = np.unique(face_index_all, return_inverse=True)
+    ds_union = Dataset_varswithdim(uds.obj,dimname=xu_facedim).isel({xu_facedim:face_index_union})
+    ds_sel = ds_union.isel({xu_facedim:xr.DataArray(face_index_inverse,dims=('ncrossed_faces'))})
+    
+    crs_dist_starts = np.concatenate([transect.crs_dist_starts for transect in transects.values()])
+    crs_dist_stops = np.concatenate([transect.crs_dist_stops for transect in transects.values()])
+    ds_crs = get_crs_dataset(ds_sel, crs_dist_starts=crs_dist_starts, crs_dist_stops=crs_dist_stops,
+                             gridname=gridname, dimn_layer=dimn_layer, dimn_interfaces=dimn_interfaces)
+    transect_names = np.concatenate([np.repeat(name, len(transect)) for name, transect in transects.items()])
+    ds_crs = ds_crs.assign_coords(transect=('ncrossed_faces', transect_names)).set_xindex('transect')
+    return ds_crs
+
+
+class PointExtractor:
+    """
+    Faces that contain points (e.g. virtual observation stations), that can be used to extract 
+    timeseries from any number of datasets on that grid. The faces are located only once upon initialization. 
+    Extracting selects the faces at once for all points, so the amount of dask tasks does not scale 
+    with the amount of points. The result is a his-like dataset with a stations dimension, 
+    that can be used in for instance dfmt.get_Dataset_atdepths() and dfmt.plot_ztdata().
+    For long timeseries, reading is much faster if the dataset is opened with large time chunks, for instance with
+    dfmt.open_partitioned_dataset(file_nc, chunks="time series").
+    
+    Examples
+    --------
+    >>> extractor = dfmt.PointExtractor(uds.grid, x=gdf.geometry.x, y=gdf.geometry.y, names=gdf["name"])
+    >>> ds_his = extractor.extract(uds[["mesh2d_s1","mesh2d_tem1"]])
+    """
+    def __init__(self, grid, x, y, names=None):
+        """
+        Parameters
+        ----------
+        grid : xu.Ugrid2d, xu.UgridDataset or xu.UgridDataArray
+            grid to locate the points in.
+        x : array-like
+            x-coordinates of the points.
+        y : array-like
+            y-coordinates of the points.
+        names : array-like, optional
+            names of the points. The default is None, which results in the point numbers as names.
+        """
+        if isinstance(grid, (xu.UgridDataset, xu.UgridDataArray)):
+            grid = grid.grid
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if names is None:
+            names = np.arange(len(x)).astype(str)
+        names = np.asarray(names).astype(str)
+        if not (len(x) == len(y) == len(names)):
+            raise ValueError(f'x, y and names should have the same length, got {len(x)}, {len(y)} and {len(names)}')
+        
+        face_index = grid.locate_points(np.column_stack([x, y]))
+        if (face_index == -1).all():
+            raise ValueError('none of the points are located in mapdata')
+        if (face_index == -1).any():
+            print(f'{(face_index == -1).sum()} point(s) outside of mapdata, these will contain nan values: {names[face_index == -1].tolist()}')
+        
+        self.x = x
+        self.y = y
+        self.names = names
+        self.face_index = face_index
+        self.face_dimension = grid.face_dimension
+        self.n_face = grid.n_face
+    
+    def __len__(self):
+        return len(self.face_index)
+    
+    def extract(self, uds:xu.UgridDataset, zcoordinates:bool = True, time_chunk:int = None) -> xr.Dataset:
+        """
+        Lazily extract all face variables of uds at the points.
+
+        Parameters
+        ----------
+        uds : xu.UgridDataset
+            dataset on the grid the points were located in.
+        zcoordinates : bool, optional
+            add the z-coordinates of the layer interfaces and centers (zcoordinate_w/zcoordinate_c) for 3D models. 
+            This requires the variables that are used by dfmt.reconstruct_zw_zcc(). The default is True.
+        time_chunk : int, optional
+            rechunk the result to this amount of timesteps (and a single chunk for all stations), which reduces the amount of tasks when computing 
+            or writing the result of datasets with small time chunks. The default is None.
+
+        Raises
+        ------
+        ValueError
+            if the number of faces of uds does not correspond to the extractor.
+
+        Returns
+        -------
+        ds_his : xr.Dataset
+            his-like dataset with time, stations and laydim/laydimw dimensions.
+
+        """
+        if not isinstance(uds, xu.UgridDataset):
+            raise TypeError(f'PointExtractor.extract() expected xu.UgridDataset, got {type(uds)} instead')
+        if uds.grid.n_face != self.n_face:
+            raise ValueError(f'the dataset has {uds.grid.n_face} faces, but the points were located in a grid with {self.n_face} faces')
+        
+        facedim = self.face_dimension
+        gridname = uds.grid.name
+        dimn_layer, dimn_interfaces = get_vertical_dimensions(uds)
+        
+        valid = self.face_index != -1
+        station_index = np.zeros(len(self), dtype=int)
+        if zcoordinates and dimn_layer in uds.dims:
+            #construct fullgrid info (zcc/zw) for 3D models, only for the unique selected faces
+            face_index_unique, face_index_inverse = np.unique(self.face_index[valid], return_inverse=True)
+            uds_faces = uds.isel({facedim:face_index_unique})
+            try:
+                uds_faces = reconstruct_zw_zcc(uds_faces, use_cache=False)
+            except KeyError as e:
+                logger.warning(f'zcoordinates could not be reconstructed, continuing without them: {e}')
+            ds_faces = uds_faces.obj
+            station_index[valid] = face_index_inverse
+        else:
+            ds_faces = uds.obj
+            station_index[valid] = self.face_index[valid]
+        
+        #select the points with one selection per chunk (e.g. per partition), points outside of the grid get nan values
+        station_index_xr = xr.DataArray(station_index, dims='stations')
+        ds_his = Dataset_varswithdim(ds_faces, dimname=facedim)
+        #drop face coordinates like face_x/face_y, these are replaced by the station coordinates
+        varns_zw_zcc = [f'{gridname}_flowelem_zw', f'{gridname}_flowelem_zcc']
+        ds_his = ds_his.drop_vars([varn for varn in ds_his.coords if facedim in ds_his[varn].dims and varn not in varns_zw_zcc])
+        ds_his = ds_his.isel({facedim:station_index_xr})
+        if not valid.all():
+            ds_his = ds_his.where(xr.DataArray(valid, dims='stations'))
+        
+        #rename to his-like variables and dimensions
+        rename_dict = {f'{gridname}_s1':'waterlevel',
+                       f'{gridname}_flowelem_bl':'bedlevel',
+                       f'{gridname}_flowelem_zw':'zcoordinate_w',
+                       f'{gridname}_flowelem_zcc':'zcoordinate_c',
+                       dimn_layer:'laydim',
+                       dimn_interfaces:'laydimw'}
+        rename_dict = {k:v for k,v in rename_dict.items() if k in ds_his.variables or k in ds_his.dims}
+        ds_his = ds_his.rename(rename_dict)
+        ds_his = ds_his.assign_coords(station_name=('stations', self.names),
+                                      station_x_coordinate=('stations', self.x),
+                                      station_y_coordinate=('stations', self.y))
+        ds_his = ds_his.transpose('time', 'stations', ..., missing_dims='ignore')
+        if time_chunk is not None and 'time' in ds_his.dims:
+            ds_his = ds_his.chunk({'time':time_chunk, 'stations':-1})
+        return ds_his
 
 
 def get_formula_terms(uds, varn_contains):
@@ -225,8 +761,10 @@ def reconstruct_zw_zcc_fromz(uds):
     #deriving zinterface values, first expanding zint to wl.max(), then clipping zw to bl/wl
     zvals_interface = uds[f'{gridname}_interface_z']
     # make sure mesh2d_interface_z.max()>=wl.max() (is clipped to wl again in next step)
-    if zvals_interface[-1] < uds_eta.max():
-        zvals_interface[-1] = uds_eta.max()
+    # this is done without modifying the interface_z variable of the input dataset in place
+    ninterfaces = zvals_interface.sizes[dimn_interfaces]
+    bool_top = xr.DataArray(np.arange(ninterfaces) == ninterfaces-1, dims=dimn_interfaces)
+    zvals_interface = zvals_interface.where(~bool_top, zvals_interface.clip(min=uds_eta.max()))
     zw = (uds_z0+zvals_interface).clip(min=uds_bl, max=uds_eta)
        
     # correction: set interfaces below bed to nan (keeping the interface at the bed with shift)
@@ -295,15 +833,116 @@ def reconstruct_zw_zcc_fromzsigma(uds):
     return uds
 
 
-def reconstruct_zw_zcc(uds:xu.UgridDataset):
+# reconstructed zw/zcc variables, keyed on the id of the input dataset. The entry is removed when the input dataset is garbage collected
+_ZW_ZCC_CACHE = {}
+
+
+def clear_zw_zcc_cache(uds:xu.UgridDataset = None):
+    """
+    Invalidate the cached zw/zcc values of reconstruct_zw_zcc(). Assigning new values to the 
+    variables that zw/zcc are derived from already invalidates the cached values, but this is 
+    necessary if the underlying numpy arrays were modified in place (like ``uds['mesh2d_s1'].values[:] = 0``).
+
+    Parameters
+    ----------
+    uds : xu.UgridDataset, optional
+        Dataset to invalidate the cached values of. The default is None, which clears the entire cache.
+
+    """
+    if uds is None:
+        _ZW_ZCC_CACHE.clear()
+        return
+    if isinstance(uds, xu.UgridDataset):
+        uds = uds.obj
+    _ZW_ZCC_CACHE.pop(id(uds), None)
+
+
+def _get_zw_zcc_layertype(uds:xu.UgridDataset):
+    gridname = uds.grid.name
+    if len(uds.filter_by_attrs(standard_name='ocean_sigma_z_coordinate')) != 0:
+        layertype = 'zsigma'
+    elif len(uds.filter_by_attrs(standard_name='ocean_sigma_coordinate')) != 0:
+        layertype = 'sigma'
+    elif f'{gridname}_layer_z' in uds.variables:
+        layertype = 'z'
+    else:
+        raise KeyError(f'layers present, but unknown layertype, expected one of variables: {gridname}_flowelem_zw, {gridname}_layer_sigma, {gridname}_layer_z')
+    return layertype
+
+
+def _get_zw_zcc_sources(ds:xr.Dataset, gridname:str):
+    """
+    Tokens of the variables (and their coordinates) that zw/zcc are derived from, to detect 
+    modifications of the input dataset. Dask arrays are immutable, so these are compared by identity. 
+    Numpy arrays can be modified in place (like with ``uds['mesh2d_s1'] += 1``), so a hash of their 
+    values is compared instead. Index variables are compared via their (immutable) pandas index.
+    """
+    varnames = [f'{gridname}_s1', f'{gridname}_flowelem_bl', f'{gridname}_layer_z', f'{gridname}_interface_z']
+    for varn in ds.variables:
+        if 'formula_terms' in ds[varn].attrs:
+            tokens = re.split('[:\\s]+', ds[varn].attrs['formula_terms'])
+            varnames += [varn] + tokens[1::2]
+    varnames = [varn for varn in varnames if varn in ds.variables]
+    varnames += [varn for varn_source in varnames for varn in ds[varn_source].coords]
+    
+    sources = {}
+    for varn in set(varnames):
+        variable = ds.variables[varn]
+        if varn in ds.indexes:
+            sources[varn] = ds.indexes[varn]
+        elif variable.chunks is not None:
+            sources[varn] = variable.data
+        else:
+            data_np = np.ascontiguousarray(variable.to_numpy())
+            data_hash = hashlib.sha256(str((data_np.shape, data_np.dtype)).encode())
+            data_hash.update(data_np.view(np.uint8))
+            sources[varn] = data_hash.digest()
+    return sources
+
+
+def _get_zw_zcc_cache(ds:xr.Dataset, sources:dict):
+    cache_entry = _ZW_ZCC_CACHE.get(id(ds))
+    if cache_entry is None:
+        return None
+    ds_ref, sources_cached, da_zw, da_zcc = cache_entry
+    if ds_ref() is not ds:
+        return None
+    if sources.keys() != sources_cached.keys():
+        return None
+    for varn, token in sources.items():
+        token_cached = sources_cached[varn]
+        if isinstance(token, pd.Index):
+            token_equal = token.equals(token_cached)
+        elif isinstance(token, bytes):
+            token_equal = token == token_cached
+        else:
+            token_equal = token is token_cached
+        if not token_equal:
+            return None
+    return da_zw, da_zcc
+
+
+def _set_zw_zcc_cache(ds:xr.Dataset, sources:dict, da_zw:xr.DataArray, da_zcc:xr.DataArray):
+    key = id(ds)
+    if key not in _ZW_ZCC_CACHE:
+        weakref.finalize(ds, _ZW_ZCC_CACHE.pop, key, None)
+    _ZW_ZCC_CACHE[key] = (weakref.ref(ds), sources, da_zw, da_zcc)
+
+
+def reconstruct_zw_zcc(uds:xu.UgridDataset, use_cache:bool = True):
     """
     reconstruct full grid output (time/face-varying z-values) for all layertypes,
-    calls the respective reconstruction function
+    calls the respective reconstruction function. The input dataset is not modified. 
+    The reconstructed zw/zcc variables are cached for the lifetime of the input dataset, so repeated 
+    calls (for instance for multiple depths or transects) do not rebuild them. The cached values are 
+    not used anymore if the variables they are derived from were modified in the input dataset.
 
     Parameters
     ----------
     uds : xu.UgridDataset
         DESCRIPTION.
+    use_cache : bool, optional
+        Retrieve the reconstructed zw/zcc variables from the cache if available and store them otherwise. The default is True.
 
     Raises
     ------
@@ -319,25 +958,153 @@ def reconstruct_zw_zcc(uds:xu.UgridDataset):
     
     gridname = uds.grid.name
     varname_zint = f'{gridname}_flowelem_zw'
+    varname_zcc = f'{gridname}_flowelem_zcc'
     
     #reconstruct zw/zcc variables (if not in file) and treat as fullgrid mapfile from here
     if varname_zint in uds.variables: #fullgrid info already available, so continuing
         print(f'zw/zcc (fullgrid) values already present in Dataset in variable {varname_zint}')
-    elif len(uds.filter_by_attrs(standard_name='ocean_sigma_z_coordinate')) != 0:
+        return uds
+    
+    layertype = _get_zw_zcc_layertype(uds)
+    ds_input = uds.obj
+    sources = _get_zw_zcc_sources(ds_input, gridname)
+    zw_zcc_cached = _get_zw_zcc_cache(ds_input, sources) if use_cache else None
+    if zw_zcc_cached is not None:
+        print('zw/zcc (fullgrid) values retrieved from cache')
+        da_zw, da_zcc = zw_zcc_cached
+        ds = ds_input
+        if layertype == 'zsigma':
+            # consistent with reconstruct_zw_zcc_fromzsigma()
+            ds = decode_default_fillvals(ds)
+        ds = ds.assign_coords({varname_zint:da_zw, varname_zcc:da_zcc})
+        return xu.UgridDataset(ds, grids=uds.grids)
+    
+    # shallow copy to avoid adding the zw/zcc variables to the input dataset
+    uds = xu.UgridDataset(ds_input.copy(), grids=uds.grids)
+    if layertype == 'zsigma':
         print('zsigma-layer model, computing zw/zcc (fullgrid) values and treat as fullgrid model from here')
         uds = reconstruct_zw_zcc_fromzsigma(uds)
-    elif len(uds.filter_by_attrs(standard_name='ocean_sigma_coordinate')) != 0:
+    elif layertype == 'sigma':
         print('sigma-layer model, computing zw/zcc (fullgrid) values and treat as fullgrid model from here')
         uds = reconstruct_zw_zcc_fromsigma(uds)
-    elif f'{gridname}_layer_z' in uds.variables:
+    elif layertype == 'z':
         print('z-layer model, computing zw/zcc (fullgrid) values and treat as fullgrid model from here')
         uds = reconstruct_zw_zcc_fromz(uds)
-    else:
-        raise KeyError(f'layers present, but unknown layertype, expected one of variables: {gridname}_flowelem_zw, {gridname}_layer_sigma, {gridname}_layer_z')
+    
+    if use_cache:
+        _set_zw_zcc_cache(ds_input, sources, uds.obj[varname_zint], uds.obj[varname_zcc])
     return uds
 
     
-def get_Dataset_atdepths(data_xr:xu.UgridDataset, depths, reference:str ='z0'):    
+def _take_along_last_axis(values, index):
+    return np.take_along_axis(values, index, axis=-1)
+
+
+def take_along_dim(da:xr.DataArray, index:xr.DataArray, dim:str, dim_index:str) -> xr.DataArray:
+    """
+    vectorised (lazy) gather of da along dim with the integer values in index. The dimension dim 
+    of da is replaced by the dimension dim_index of index, the other dimensions are broadcasted.
+    """
+    da_take = xr.apply_ufunc(_take_along_last_axis, da, index,
+                             input_core_dims=[[dim],[dim_index]],
+                             output_core_dims=[[dim_index]],
+                             dask='parallelized', output_dtypes=[da.dtype],
+                             keep_attrs=True)
+    return da_take
+
+
+def get_layer_index_atdepths(zw:xr.DataArray, depths_xr:xr.DataArray, dimname_layw:str, depth_vardimname:str) -> dict:
+    """
+    Derive the index of the layer that contains each depth from the z-interface values (zw), without
+    constructing a boolean for every layer of every variable. A depth exactly on an interface is contained 
+    by both adjacent layers, so the lower and upper layer index are returned, together with booleans that 
+    indicate whether these layers contain the depth. Layers with nan interfaces (below bed or above waterlevel) 
+    never contain the depth.
+    """
+    nint = zw.sizes[dimname_layw]
+    bool_belowdepth = zw <= depths_xr
+    bool_abovedepth = zw >= depths_xr
+    
+    # last interface below/on depth, this is the bottom interface of the lower layer
+    index_lower = nint - 1 - bool_belowdepth.isel({dimname_layw:slice(None,None,-1)}).argmax(dim=dimname_layw)
+    # first interface above/on depth, this is the top interface of the upper layer
+    index_upper = bool_abovedepth.argmax(dim=dimname_layw) - 1
+    
+    # check whether the other interface of these layers is also on the correct side of the depth
+    zw_lower_top = take_along_dim(zw, (index_lower + 1).clip(max=nint-1), dim=dimname_layw, dim_index=depth_vardimname)
+    zw_upper_bot = take_along_dim(zw, index_upper.clip(min=0), dim=dimname_layw, dim_index=depth_vardimname)
+    valid_lower = bool_belowdepth.any(dim=dimname_layw) & (index_lower < nint-1) & (zw_lower_top >= depths_xr)
+    valid_upper = bool_abovedepth.any(dim=dimname_layw) & (index_upper >= 0) & (zw_upper_bot <= depths_xr)
+    
+    layer_index = {"index_lower":index_lower.clip(max=nint-2), "valid_lower":valid_lower,
+                   "index_upper":index_upper.clip(min=0), "valid_upper":valid_upper}
+    return layer_index
+
+
+def gather_atdepths(da:xr.DataArray, layer_index:dict, dimname_layc:str, depth_vardimname:str) -> xr.DataArray:
+    """
+    gather the values of da at the layer indexes derived with get_layer_index_atdepths(). If a depth is
+    exactly on an interface, the maximum of the two adjacent layers is taken.
+    """
+    da_lower = take_along_dim(da, layer_index["index_lower"], dim=dimname_layc, dim_index=depth_vardimname)
+    da_upper = take_along_dim(da, layer_index["index_upper"], dim=dimname_layc, dim_index=depth_vardimname)
+    da_lower = da_lower.where(layer_index["valid_lower"])
+    da_upper = da_upper.where(layer_index["valid_upper"])
+    da_atdepths = np.fmax(da_lower, da_upper)
+    da_atdepths.attrs = da.attrs
+    return da_atdepths
+
+
+def get_layer_weights_atdepths(zw:xr.DataArray, zcc:xr.DataArray, depths_xr:xr.DataArray, dimname_layw:str, dimname_layc:str, depth_vardimname:str) -> dict:
+    """
+    Derive the indexes of the layer centers (zcc) below and above each depth and the linear interpolation 
+    weight of the upper layer. These are computed once and can be applied to all variables with interp_atdepths().
+    Between the bed and the lowest center or between the highest center and the waterlevel, the value of the 
+    nearest center is used. Depths below bed or above waterlevel are not valid, these are derived from the 
+    z-interface values (zw). Layers with nan centers (below bed or above waterlevel) are skipped.
+    """
+    nlay = zcc.sizes[dimname_layc]
+    bool_belowdepth = zcc <= depths_xr
+    bool_abovedepth = zcc >= depths_xr
+    any_belowdepth = bool_belowdepth.any(dim=dimname_layc)
+    any_abovedepth = bool_abovedepth.any(dim=dimname_layc)
+    
+    # last center below/on depth and first center above/on depth
+    index_lower = nlay - 1 - bool_belowdepth.isel({dimname_layc:slice(None,None,-1)}).argmax(dim=dimname_layc)
+    index_upper = bool_abovedepth.argmax(dim=dimname_layc)
+    # use the nearest center if there is no center below or above the depth
+    index_lower, index_upper = (index_lower.where(any_belowdepth, index_upper),
+                                index_upper.where(any_abovedepth, index_lower))
+    
+    zcc_lower = take_along_dim(zcc, index_lower, dim=dimname_layc, dim_index=depth_vardimname)
+    zcc_upper = take_along_dim(zcc, index_upper, dim=dimname_layc, dim_index=depth_vardimname)
+    zcc_diff = zcc_upper - zcc_lower
+    weight_upper = ((depths_xr - zcc_lower) / zcc_diff.where(zcc_diff > 0)).fillna(0)
+    
+    # only depths between bed and waterlevel are valid
+    valid = (zw <= depths_xr).any(dim=dimname_layw) & (zw >= depths_xr).any(dim=dimname_layw)
+    valid = valid & (any_belowdepth | any_abovedepth)
+    
+    layer_weights = {"index_lower":index_lower, "index_upper":index_upper,
+                     "weight_upper":weight_upper, "valid":valid}
+    return layer_weights
+
+
+def interp_atdepths(da:xr.DataArray, layer_weights:dict, dimname_layc:str, depth_vardimname:str) -> xr.DataArray:
+    """
+    linearly interpolate the values of da between the layer centers with the indexes and weights 
+    derived with get_layer_weights_atdepths().
+    """
+    da_lower = take_along_dim(da, layer_weights["index_lower"], dim=dimname_layc, dim_index=depth_vardimname)
+    da_upper = take_along_dim(da, layer_weights["index_upper"], dim=dimname_layc, dim_index=depth_vardimname)
+    weight_upper = layer_weights["weight_upper"]
+    da_atdepths = da_lower * (1 - weight_upper) + da_upper * weight_upper
+    da_atdepths = da_atdepths.where(layer_weights["valid"])
+    da_atdepths.attrs = da.attrs
+    return da_atdepths
+
+
+def get_Dataset_atdepths(data_xr:xu.UgridDataset, depths, reference:str ='z0', method:str = 'layer'):    
     """
     Lazily depth-slice a dataset with layers. Performance can be increased by using a subset of variables or subsetting the dataset in any dimension.
     This can be done for instance with ds.isel(time=-1) or uds.ugrid.sel(x=slice(),y=slice()) to subset a ugrid dataset in space.
@@ -352,14 +1119,18 @@ def get_Dataset_atdepths(data_xr:xu.UgridDataset, depths, reference:str ='z0'):
         int/float or list/array of int/float. Depths w.r.t. reference level. If reference=='waterlevel', depth>0 returns only nans. If reference=='bedlevel', depth<0 returns only nans. Depths are sorted and only uniques are kept.
     reference : str, optional
         compute depth w.r.t. z0/waterlevel/bed. The default is 'z0'.
-    zlayer_z0_selnearest : bool, optional
-        Use xr.interp() to interpolate zlayer model to z-value. Only possible for reference='z' (not 'waterlevel' or 'bedlevel'). Only used if "mesh2d_layer_z" is present (zlayer model)
-        This is faster but results in values interpolated between zcc (z cell centers), so it is different than slicing.. The default is False.
+    method : str, optional
+        'layer' takes the value of the layer that contains the depth (the maximum of both layers if the depth is exactly on an interface).
+        'linear' interpolates linearly between the z cell centers (zcc) around the depth, the value of the nearest center is used 
+        between the bed and the lowest center and between the highest center and the waterlevel. The indexes and weights are 
+        derived once and applied to all variables and depths. The default is 'layer'.
 
     Raises
     ------
-    Exception
-        DESCRIPTION.
+    ValueError
+        If method is not 'layer' or 'linear'.
+    KeyError
+        If the reference is unknown or the variable that is required for the reference is not present.
 
     Returns
     -------
@@ -368,6 +1139,9 @@ def get_Dataset_atdepths(data_xr:xu.UgridDataset, depths, reference:str ='z0'):
 
     """
     
+    if method not in ['layer','linear']:
+        raise ValueError(f'unknown method "{method}" (possible are layer and linear)')
+    
     depth_vardimname = f'depth_from_{reference}'
     
     dimn_layer, dimn_interfaces = get_vertical_dimensions(data_xr)
@@ -375,12 +1149,14 @@ def get_Dataset_atdepths(data_xr:xu.UgridDataset, depths, reference:str ='z0'):
     if dimn_layer is not None: #D-FlowFM mapfile
         gridname = data_xr.grid.name
         varname_zint = f'{gridname}_flowelem_zw'
+        varname_zcc = f'{gridname}_flowelem_zcc'
         dimname_layc = dimn_layer
         dimname_layw = dimn_interfaces
         varname_wl = f'{gridname}_s1'
         varname_bl = f'{gridname}_flowelem_bl'
     elif 'laydim' in data_xr.dims: #D-FlowFM hisfile
         varname_zint = 'zcoordinate_w'
+        varname_zcc = 'zcoordinate_c'
         dimname_layc = 'laydim'
         dimname_layw = 'laydimw'
         varname_wl = 'waterlevel'
@@ -408,37 +1184,62 @@ def get_Dataset_atdepths(data_xr:xu.UgridDataset, depths, reference:str ='z0'):
     
     #correct reference level
     if reference=='z0':
-        zw_reference = data_xr[varname_zint]
+        z_reference = 0
     elif reference=='waterlevel':
         if varname_wl not in data_xr.variables:
             raise KeyError(f'get_Dataset_atdepths() called with reference=waterlevel, but {varname_wl} variable not present')
-        data_wl = data_xr[varname_wl]
-        zw_reference = data_xr[varname_zint] - data_wl
+        z_reference = data_xr[varname_wl]
     elif reference=='bedlevel':
         if varname_bl not in data_xr.variables:
             raise KeyError(f'get_Dataset_atdepths() called with reference=bedlevel, but {varname_bl} variable not present') #TODO: in case of zsigma/sigma it can also be -mesh2d_bldepth
-        data_bl = data_xr[varname_bl]
-        zw_reference = data_xr[varname_zint] - data_bl
+        z_reference = data_xr[varname_bl]
     else:
         raise KeyError(f'unknown reference "{reference}" (possible are z0, waterlevel and bedlevel') #TODO: make enum?
+    zw_reference = data_xr[varname_zint] - z_reference
     
     print('>> subsetting data on fixed depth in fullgrid z-data: ',end='')
     dtstart = dt.datetime.now()
     
-    #get layerbool via z-interface value (zw), check which celltop-interfaces are above/on depth and which which cellbottom-interfaces are below/on depth
-    bool_topinterface_abovedepth = zw_reference.isel({dimname_layw:slice(1,None)}) >= depths_xr
-    bool_botinterface_belowdepth = zw_reference.isel({dimname_layw:slice(None,-1)}) <= depths_xr
-    bool_topbotinterface_arounddepth = bool_topinterface_abovedepth & bool_botinterface_belowdepth #this bool also automatically excludes all values below bed and above wl
-    bool_topbotinterface_arounddepth = bool_topbotinterface_arounddepth.rename({dimname_layw:dimname_layc}) #correct dimname for interfaces to centers
+    #derive the index of the layer around each depth once via z-interface value (zw), so all variables can be gathered with it
+    if isinstance(zw_reference, xu.UgridDataArray):
+        zw_reference = zw_reference.obj
+    if depth_vardimname in depths_xr.dims:
+        depths_xr_1d = depths_xr
+    else:
+        depths_xr_1d = depths_xr.expand_dims(depth_vardimname)
+    if method == 'layer':
+        layer_index = get_layer_index_atdepths(zw_reference, depths_xr=depths_xr_1d, dimname_layw=dimname_layw, depth_vardimname=depth_vardimname)
+    else:
+        #derive the indexes and weights of the centers around each depth once via z-center value (zcc)
+        if varname_zcc in data_xr.variables:
+            zcc_reference = data_xr[varname_zcc] - z_reference
+        else:
+            zcc_reference = zw_reference.rolling({dimname_layw:2}).mean()
+            zcc_reference = zcc_reference.isel({dimname_layw:slice(1,None)}).rename({dimname_layw:dimname_layc})
+        if isinstance(zcc_reference, xu.UgridDataArray):
+            zcc_reference = zcc_reference.obj
+        layer_weights = get_layer_weights_atdepths(zw_reference, zcc_reference, depths_xr=depths_xr_1d, dimname_layw=dimname_layw, 
+                                                   dimname_layc=dimname_layc, depth_vardimname=depth_vardimname)
     
     #subset variables that have no, time, face and/or layer dims, slice only variables with all three dims (and add to subset)
-    bool_dims = [x for x in bool_topbotinterface_arounddepth.dims if x!=depth_vardimname] #exclude depth_vardimname (present if multiple depths supplied), since it is not present in pre-slice variables
+    bool_dims = [dimname_layc if x==dimname_layw else x for x in zw_reference.dims] #the dimensions of zw with interfaces replaced by centers
     variables_toslice = [var for var in data_xr.data_vars if set(bool_dims).issubset(data_xr[var].dims)]
     
-    #actual slicing with .where().max()
-    ds_atdepths = data_xr[variables_toslice].where(bool_topbotinterface_arounddepth).max(dim=dimname_layc,keep_attrs=True) #set all layers but one to nan, followed by an arbitrary reduce (max in this case) #TODO: check if attributes should be passed/altered
-    #TODO: suppress warning (upon plotting/load/etc): "C:\Users\veenstra\Anaconda3\envs\dfm_tools_env\lib\site-packages\dask\array\reductions.py:640: RuntimeWarning: All-NaN slice encountered" >> already merged in xarray: https://github.com/dask/dask/pull/9916
-    ds_atdepths = ds_atdepths.drop_dims([dimname_layw,dimname_layc],errors='ignore') #dropping interface dim if it exists, since it does not correspond to new depths dim
+    #actual slicing by gathering (and interpolating) the values of the layers around the depths
+    if isinstance(data_xr, xu.UgridDataset):
+        ds_toslice = data_xr.obj[variables_toslice]
+    else:
+        ds_toslice = data_xr[variables_toslice]
+    ds_atdepths = ds_toslice.drop_dims([dimname_layw,dimname_layc],errors='ignore') #dropping interface dim if it exists, since it does not correspond to new depths dim
+    for varn in variables_toslice:
+        if method == 'layer':
+            ds_atdepths[varn] = gather_atdepths(ds_toslice[varn], layer_index=layer_index, dimname_layc=dimname_layc, depth_vardimname=depth_vardimname)
+        else:
+            ds_atdepths[varn] = interp_atdepths(ds_toslice[varn], layer_weights=layer_weights, dimname_layc=dimname_layc, depth_vardimname=depth_vardimname)
+    if depth_vardimname not in depths_xr.dims:
+        ds_atdepths = ds_atdepths.isel({depth_vardimname:0}, drop=True)
+    if isinstance(data_xr, xu.UgridDataset):
+        ds_atdepths = xu.UgridDataset(ds_atdepths, grids=data_xr.grids)
     
     #add depth as coordinate var
     ds_atdepths[depth_vardimname] = depths_xr
@@ -485,15 +1286,7 @@ def rasterize_ugrid(uds:xu.UgridDataset, ds_like:xr.Dataset = None, resolution:f
         raise TypeError(f'rasterize_ugrid expected xu.core.wrap.UgridDataset or xu.core.wrap.UgridDataArray, got {type(uds)} instead')
     
     if ds_like is None:
-        xmin, ymin, xmax, ymax = uds.grid.bounds
-        dx = xmax - xmin
-        dy = ymax - ymin
-        if resolution is None: # check if a rasterization resolution is passed, otherwise default to 200 raster cells otherwise for the smallest axis.
-            resolution = min(dx, dy) / 200
-        d = abs(resolution)
-        regx = np.arange(xmin + 0.5 * d, xmax, d)
-        regy = np.arange(ymin + 0.5 * d, ymax, d)
-        ds_like = xr.DataArray(np.empty((len(regy), len(regx))), {"y": regy, "x": regx}, ["y", "x"])
+        ds_like = get_raster_like(uds.grid, resolution=resolution)
     
     print(f'>> rasterizing ugrid {face_str} to shape=({len(ds_like.y)},{len(ds_like.x)}): ',end='')
     dtstart = dt.datetime.now()
@@ -503,6 +1296,444 @@ def rasterize_ugrid(uds:xu.UgridDataset, ds_like:xr.Dataset = None, resolution:f
     return ds
 
 
+def get_raster_like(grid, resolution:float = None):
+    """
+    generate a raster Dataset with only x/y coordinates (so no memory is allocated for 
+    the raster itself) that covers the bounds of the grid.
+    If resolution is not passed, a raster is generated of at least 200x200
+    """
+    xmin, ymin, xmax, ymax = grid.bounds
+    dx = xmax - xmin
+    dy = ymax - ymin
+    if resolution is None: # check if a rasterization resolution is passed, otherwise default to 200 raster cells otherwise for the smallest axis.
+        resolution = min(dx, dy) / 200
+    d = abs(resolution)
+    regx = np.arange(xmin + 0.5 * d, xmax, d)
+    regy = np.arange(ymin + 0.5 * d, ymax, d)
+    ds_like = xr.Dataset(coords={"y": regy, "x": regx})
+    return ds_like
+
+
+def _gather_raster(values, face_index, valid):
+    values_raster = values[..., face_index]
+    if values_raster.dtype.kind in "biu":
+        values_raster = values_raster.astype(np.float64)
+    return np.where(valid, values_raster, np.nan)
+
+
+def _get_raster_dims(dims, facedim):
+    #put the raster dimensions at the position of the face dimension
+    raster_dims = []
+    for dim in dims:
+        raster_dims.extend(["y","x"] if dim==facedim else [dim])
+    return tuple(raster_dims)
+
+
+class Rasterizer:
+    """
+    Face index per raster cell (pixel) of a ugrid grid, that can be applied to any number of datasets 
+    (e.g. timesteps or variables) on that grid. The face lookup is only done once upon initialization, 
+    applying it is a gather of the face values which is lazy for dask arrays (e.g. time-chunked datasets).
+    The face index can be saved to disk with to_netcdf() and loaded with from_netcdf().
+    
+    Examples
+    --------
+    >>> rasterizer = dfmt.Rasterizer(uds.grid, resolution=0.1)
+    >>> ds_raster = rasterizer.rasterize(uds[["mesh2d_s1","mesh2d_tem1"]].chunk({"time":24}))
+    """
+    def __init__(self, grid, ds_like:xr.Dataset = None, resolution:float = None):
+        """
+        Parameters
+        ----------
+        grid : xu.Ugrid2d, xu.UgridDataset or xu.UgridDataArray
+            grid to rasterize.
+        ds_like : xr.Dataset, optional
+            xr.Dataset with x and y variables to rasterize the grid to. The default is None.
+        resolution : float, optional
+            Only used if ds_like is not supplied. The default is None, which results in a raster of at least 200x200.
+        """
+        if isinstance(grid, (xu.UgridDataset, xu.UgridDataArray)):
+            grid = grid.grid
+        if ds_like is None:
+            ds_like = get_raster_like(grid, resolution=resolution)
+        
+        print(f'>> deriving face index of raster with shape=({len(ds_like.y)},{len(ds_like.x)}): ',end='')
+        dtstart = dt.datetime.now()
+        x, y, face_index = grid.rasterize_like(x=ds_like["x"].to_numpy(), y=ds_like["y"].to_numpy())
+        print(f'{(dt.datetime.now()-dtstart).total_seconds():.2f} sec')
+        
+        self.x = x
+        self.y = y
+        self.face_index = face_index
+        self.face_dimension = grid.face_dimension
+        self.n_face = grid.n_face
+    
+    @property
+    def shape(self):
+        return self.face_index.shape
+    
+    def to_netcdf(self, file_nc):
+        """
+        save the face index per raster cell to a netcdf file, so it can be reused with from_netcdf().
+        """
+        ds = xr.Dataset()
+        ds["face_index"] = xr.DataArray(self.face_index, coords={"y":self.y, "x":self.x}, dims=["y","x"],
+                                        attrs={"long_name":"face index per raster cell, -1 outside of grid"})
+        ds.attrs["face_dimension"] = self.face_dimension
+        ds.attrs["n_face"] = self.n_face
+        ds.to_netcdf(file_nc)
+    
+    @classmethod
+    def from_netcdf(cls, file_nc):
+        """
+        load the face index per raster cell that was saved with to_netcdf().
+        """
+        with xr.open_dataset(file_nc) as ds:
+            ds = ds.load()
+        rasterizer = cls.__new__(cls)
+        rasterizer.x = ds["x"].to_numpy()
+        rasterizer.y = ds["y"].to_numpy()
+        rasterizer.face_index = ds["face_index"].to_numpy()
+        rasterizer.face_dimension = ds.attrs["face_dimension"]
+        rasterizer.n_face = int(ds.attrs["n_face"])
+        return rasterizer
+    
+    def _rasterize_dataarray(self, da:xr.DataArray) -> xr.DataArray:
+        facedim = self.face_dimension
+        #drop face coordinates like face_x/face_y, these are replaced by the x/y coordinates of the raster
+        da = da.drop_vars([coord for coord in da.coords if facedim in da[coord].dims])
+        if da.chunks is not None:
+            da = da.chunk({facedim:-1})
+        dtype = np.float64 if da.dtype.kind in "biu" else da.dtype
+        da_raster = xr.apply_ufunc(_gather_raster, da,
+                                   kwargs={"face_index":self.face_index, "valid":self.face_index != -1},
+                                   input_core_dims=[[facedim]],
+                                   output_core_dims=[["y","x"]],
+                                   dask='parallelized', output_dtypes=[dtype],
+                                   dask_gufunc_kwargs={"output_sizes":{"y":len(self.y), "x":len(self.x)}},
+                                   keep_attrs=True)
+        da_raster = da_raster.transpose(*_get_raster_dims(da.dims, facedim))
+        return da_raster
+    
+    def rasterize(self, uds):
+        """
+        rasterize all face variables of uds (lazily if the variables are dask arrays).
+
+        Parameters
+        ----------
+        uds : xu.UgridDataset or xu.UgridDataArray
+            dataset or dataarray on the grid the rasterizer was derived for.
+
+        Raises
+        ------
+        ValueError
+            if the number of faces of uds does not correspond to the rasterizer.
+
+        Returns
+        -------
+        xr.Dataset or xr.DataArray
+            rasterized face variables with x/y coordinates. Other variables are kept.
+
+        """
+        if not isinstance(uds, (xu.UgridDataset, xu.UgridDataArray)):
+            raise TypeError(f'Rasterizer.rasterize() expected xu.UgridDataset or xu.UgridDataArray, got {type(uds)} instead')
+        if uds.grid.n_face != self.n_face:
+            raise ValueError(f'the dataset has {uds.grid.n_face} faces, but the rasterizer was derived for a grid with {self.n_face} faces')
+        
+        facedim = self.face_dimension
+        if isinstance(uds, xu.UgridDataArray):
+            ds_raster = self._rasterize_dataarray(uds.obj)
+        else:
+            ds = uds.obj
+            #drop node/edge/face variables, only the face variables are rasterized
+            ds_raster = ds.drop_dims([dim for dim in uds.grid.dims if dim in ds.dims])
+            for varn in ds.data_vars:
+                if facedim in ds[varn].dims:
+                    ds_raster[varn] = self._rasterize_dataarray(ds[varn])
+        ds_raster = ds_raster.assign_coords(x=self.x, y=self.y)
+        return ds_raster
+
+
+class ConservativeRegridder:
+    """
+    Area-weighted (conservative) regridding of ugrid face variables to a regular grid, as opposed to the 
+    nearest-face sampling of dfmt.Rasterizer(). The overlap areas of the faces with the raster cells are computed 
+    once upon initialization and stored in a sparse matrix (with xu.OverlapRegridder). Applying it results 
+    in the area-weighted mean of the overlapping faces per raster cell (nan values are skipped), 
+    which is lazy for dask arrays (e.g. time-chunked datasets). The weights can be saved to disk 
+    with to_netcdf() and loaded with from_netcdf().
+    
+    Examples
+    --------
+    >>> regridder = dfmt.ConservativeRegridder(uds.grid, resolution=0.1)
+    >>> regridder.to_netcdf("weights.nc")
+    >>> ds_regrid = regridder.regrid(uds[["mesh2d_s1","mesh2d_tem1"]].chunk({"time":24}))
+    >>> ds_monthly = ds_regrid.resample(time="MS").mean()
+    """
+    def __init__(self, grid, ds_like:xr.Dataset = None, resolution:float = None):
+        """
+        Parameters
+        ----------
+        grid : xu.Ugrid2d, xu.UgridDataset or xu.UgridDataArray
+            grid to regrid from.
+        ds_like : xr.Dataset, optional
+            xr.Dataset with equidistant x and y variables (the cell centers) to regrid the grid to. The default is None.
+        resolution : float, optional
+            Only used if ds_like is not supplied. The default is None, which results in a raster of at least 200x200.
+        """
+        if isinstance(grid, (xu.UgridDataset, xu.UgridDataArray)):
+            grid = grid.grid
+        if ds_like is None:
+            ds_like = get_raster_like(grid, resolution=resolution)
+        ds_like = xr.Dataset(coords={"y":ds_like["y"].to_numpy(), "x":ds_like["x"].to_numpy()})
+        
+        print(f'>> computing overlap of grid with raster with shape=({len(ds_like.y)},{len(ds_like.x)}): ',end='')
+        dtstart = dt.datetime.now()
+        self._regridder = xu.OverlapRegridder(source=grid, target=ds_like, method="mean")
+        print(f'{(dt.datetime.now()-dtstart).total_seconds():.2f} sec')
+        
+        self.x = ds_like["x"].to_numpy()
+        self.y = ds_like["y"].to_numpy()
+        self.shape = (len(self.y), len(self.x))
+        self.face_dimension = grid.face_dimension
+        self.n_face = grid.n_face
+    
+    def to_netcdf(self, file_nc):
+        """
+        save the sparse overlap matrix and the raster coordinates to a netcdf file, 
+        so it can be reused with from_netcdf().
+        """
+        ds = self._regridder.to_dataset()
+        ds = ds.assign_coords({"y":self.y, "x":self.x})
+        ds.attrs["face_dimension"] = self.face_dimension
+        ds.attrs["n_face"] = self.n_face
+        ds.to_netcdf(file_nc)
+    
+    @classmethod
+    def from_netcdf(cls, file_nc):
+        """
+        load the sparse overlap matrix that was saved with to_netcdf().
+        """
+        with xr.open_dataset(file_nc) as ds:
+            ds = ds.load()
+        regridder = cls.__new__(cls)
+        regridder.x = ds["x"].to_numpy()
+        regridder.y = ds["y"].to_numpy()
+        regridder.shape = (len(regridder.y), len(regridder.x))
+        ds_like = xr.Dataset(coords={"y":regridder.y, "x":regridder.x})
+        ds_weights = ds.drop_vars(["x","y"])
+        regridder._regridder = xu.OverlapRegridder.from_weights(ds_weights, target=ds_like)
+        regridder.face_dimension = ds.attrs["face_dimension"]
+        regridder.n_face = int(ds.attrs["n_face"])
+        return regridder
+    
+    def regrid(self, uds):
+        """
+        regrid all face variables of uds (lazily if the variables are dask arrays).
+
+        Parameters
+        ----------
+        uds : xu.UgridDataset or xu.UgridDataArray
+            dataset or dataarray on the grid the regridder was derived for.
+
+        Raises
+        ------
+        ValueError
+            if the number of faces of uds does not correspond to the regridder.
+
+        Returns
+        -------
+        xr.Dataset or xr.DataArray
+            regridded face variables with x/y coordinates. Other variables are kept.
+
+        """
+        if not isinstance(uds, (xu.UgridDataset, xu.UgridDataArray)):
+            raise TypeError(f'ConservativeRegridder.regrid() expected xu.UgridDataset or xu.UgridDataArray, got {type(uds)} instead')
+        if uds.grid.n_face != self.n_face:
+            raise ValueError(f'the dataset has {uds.grid.n_face} faces, but the regridder was derived for a grid with {self.n_face} faces')
+        
+        def regrid_dataarray(uda):
+            da_regrid = self._regridder.regrid(uda)
+            return da_regrid.transpose(*_get_raster_dims(uda.dims, self.face_dimension))
+        
+        if isinstance(uds, xu.UgridDataArray):
+            return regrid_dataarray(uds)
+        
+        ds = uds.obj
+        ds_regrid = ds.drop_dims([dim for dim in uds.grid.dims if dim in ds.dims])
+        for varn in ds.data_vars:
+            if self.face_dimension in ds[varn].dims:
+                ds_regrid[varn] = regrid_dataarray(uds[varn])
+        return ds_regrid
+
+
+def rasterize_ugrid_tiled(uds:xu.UgridDataset, file_out:str, ds_like:xr.Dataset = None, resolution:float = None, 
+                          tile_size:int = 1024, max_memory_mb:float = 1000, overwrite:bool = False) -> xr.Dataset:
+    """
+    Rasterize the face variables of a ugrid dataset to a zarr store or netcdf file in spatial tiles, 
+    for rasters that do not fit in memory. For each tile, the face index is only derived for the raster 
+    cells of that tile. Time-dependent variables are processed in batches of timesteps, per batch the 
+    faces of all tiles are read at once, so the source data is only read once also if it is not chunked 
+    along the face dimension. The memory usage is bounded by tile_size and max_memory_mb. 
+    The output is chunked per tile.
+
+    Parameters
+    ----------
+    uds : xu.UgridDataset
+        dataset with face variables, can be lazy (e.g. from dfmt.open_partitioned_dataset()).
+    file_out : str
+        path of the output. A netcdf file (with tiled chunks) is written if it ends with ".nc", otherwise a zarr store.
+    ds_like : xr.Dataset, optional
+        xr.Dataset with x and y variables to rasterize uds to. The default is None.
+    resolution : float, optional
+        Only used if ds_like is not supplied. The default is None, which results in a raster of at least 200x200.
+    tile_size : int, optional
+        Number of raster cells in x and y direction per tile. The default is 1024.
+    max_memory_mb : float, optional
+        Approximate maximum size of the timestep batches per tile that are read and written at once, in megabytes. The default is 1000.
+    overwrite : bool, optional
+        Overwrite an existing output, otherwise a FileExistsError is raised. The default is False.
+
+    Returns
+    -------
+    xr.Dataset
+        The lazily opened output.
+
+    """
+    import netCDF4
+    import zarr
+    import dask.array
+    
+    if isinstance(uds, xu.UgridDataArray):
+        uds = xu.UgridDataset(uds.obj.to_dataset(), grids=[uds.grid])
+    if not isinstance(uds, xu.UgridDataset):
+        raise TypeError(f'rasterize_ugrid_tiled expected xu.UgridDataset or xu.UgridDataArray, got {type(uds)} instead')
+    if os.path.exists(file_out) and not overwrite:
+        raise FileExistsError(f'"{file_out}" already exists, use overwrite=True to replace it')
+    is_netcdf = str(file_out).endswith(".nc")
+    
+    grid = uds.grid
+    facedim = grid.face_dimension
+    ds = uds.obj
+    face_vars = [varn for varn in ds.data_vars if facedim in ds[varn].dims]
+    ds = ds[face_vars]
+    ds = ds.drop_vars([varn for varn in ds.coords if set(ds[varn].dims).intersection(grid.dims)])
+    
+    if ds_like is None:
+        ds_like = get_raster_like(grid, resolution=resolution)
+    x = ds_like["x"].to_numpy()
+    y = ds_like["y"].to_numpy()
+    
+    # derive the faces in each tile once, the faces of all tiles are concatenated (sorted per tile). This way each 
+    # batch of timesteps is read with one selection of faces instead of once per tile, which is relevant for datasets 
+    # with one chunk along the face dimension (e.g. merged partitions). The face index per raster cell of the tiles is 
+    # only kept in memory if it fits in the memory budget, otherwise it is derived again for each batch of timesteps.
+    ny_tiles = int(np.ceil(len(y) / tile_size))
+    nx_tiles = int(np.ceil(len(x) / tile_size))
+    keep_face_index = len(y) * len(x) * 4 <= max_memory_mb * 1024**2
+    def get_tile_face_index(region):
+        _, _, face_index = grid.rasterize_like(x=x[region["x"]], y=y[region["y"]])
+        valid = face_index != -1
+        faces_tile, face_index_tile = np.unique(face_index[valid], return_inverse=True)
+        face_index[valid] = face_index_tile
+        return faces_tile, face_index.astype(np.int32)
+    tiles = []
+    faces_tiles_list = [np.array([], dtype=int)]
+    for iy in range(0, len(y), tile_size):
+        for ix in range(0, len(x), tile_size):
+            region = {"y":slice(iy, min(iy + tile_size, len(y))), "x":slice(ix, min(ix + tile_size, len(x)))}
+            faces_tile, face_index_tile = get_tile_face_index(region)
+            if len(faces_tile) == 0:
+                # tiles outside of the grid remain nan
+                continue
+            tiles.append((region, face_index_tile if keep_face_index else None))
+            faces_tiles_list.append(faces_tile)
+    faces_tiles = np.concatenate(faces_tiles_list)
+    tiles_offset = np.cumsum([len(faces_tile) for faces_tile in faces_tiles_list])
+    
+    # limit the amount of timesteps per batch to the memory budget, this includes the selected faces of all tiles and one tile
+    time_dim = "time"
+    ntimes = ds.sizes.get(time_dim, 1)
+    time_vars = [varn for varn in face_vars if time_dim in ds[varn].dims]
+    static_vars = [varn for varn in face_vars if time_dim not in ds[varn].dims]
+    bytes_per_timestep = (tile_size**2 + len(faces_tiles)) * sum(ds[varn].nbytes / ds.sizes[facedim] for varn in time_vars) / ntimes
+    ntimes_batch = int(np.clip(max_memory_mb * 1024**2 // max(bytes_per_timestep, 1), 1, ntimes))
+    
+    # create the output with empty variables, chunked per tile
+    ds_out = xr.Dataset(coords={"y":y, "x":x}).assign_coords(ds.coords)
+    ds_out.attrs = ds.attrs
+    sizes_out = dict(ds.sizes) | {"y":len(y), "x":len(x)}
+    chunks_out = {dim:size for dim, size in sizes_out.items()} | {"y":tile_size, "x":tile_size, time_dim:ntimes_batch}
+    dtypes_out = {}
+    for varn in face_vars:
+        dims_out = _get_raster_dims(ds[varn].dims, facedim)
+        dtypes_out[varn] = np.float64 if ds[varn].dtype.kind in "biu" else ds[varn].dtype
+        shape_out = tuple(sizes_out[dim] for dim in dims_out)
+        chunks_var = tuple(min(chunks_out[dim], sizes_out[dim]) for dim in dims_out)
+        data_empty = dask.array.full(shape_out, np.nan, dtype=dtypes_out[varn], chunks=chunks_var)
+        ds_out[varn] = xr.Variable(dims_out, data_empty, attrs=ds[varn].attrs)
+    
+    if is_netcdf:
+        ds_out.drop_vars(face_vars).to_netcdf(file_out, mode="w")
+        with netCDF4.Dataset(file_out, "a") as nc:
+            for dim, size in sizes_out.items():
+                if dim not in nc.dimensions:
+                    nc.createDimension(dim, size)
+            for varn in face_vars:
+                var = ds_out[varn]
+                ncvar = nc.createVariable(varn, var.dtype, var.dims, zlib=True, fill_value=np.nan,
+                                          chunksizes=[chunks[0] for chunks in var.chunks])
+                ncvar.setncatts({k:v for k,v in var.attrs.items() if k != "_FillValue"})
+    else:
+        ds_out.to_zarr(file_out, mode="w", compute=False, consolidated=False)
+        ds_out.drop_vars(face_vars).to_zarr(file_out, mode="r+", consolidated=False)
+    
+    def write_tile(ds_tile, region):
+        if is_netcdf:
+            with netCDF4.Dataset(file_out, "a") as nc:
+                for varn in ds_tile.data_vars:
+                    nc.variables[varn][tuple(region.get(dim, slice(None)) for dim in ds_tile[varn].dims)] = ds_tile[varn].to_numpy()
+        else:
+            ds_tile.to_zarr(file_out, region={dim:region[dim] for dim in ds_tile.dims if dim in region}, consolidated=False)
+    
+    print(f'>> rasterizing {len(face_vars)} face variables to shape=({len(y)},{len(x)}) in {ny_tiles*nx_tiles} tiles and batches of {ntimes_batch} timesteps: ',end='')
+    dtstart = dt.datetime.now()
+    batches = [(varn_list, time_region) for varn_list, time_region in 
+               [(static_vars, None)] + [(time_vars, slice(itime, min(itime + ntimes_batch, ntimes))) for itime in range(0, ntimes, ntimes_batch)]
+               if len(varn_list) > 0 and len(tiles) > 0]
+    for varn_list, time_region in batches:
+        # read the faces of all tiles at once for this batch
+        ds_batch = ds.drop_vars(ds.coords)[varn_list]
+        if time_region is not None:
+            ds_batch = ds_batch.isel({time_dim:time_region})
+        ds_batch = ds_batch.isel({facedim:faces_tiles}).load()
+        for itile, (region, face_index) in enumerate(tiles):
+            if face_index is None:
+                _, face_index = get_tile_face_index(region)
+            valid = face_index != -1
+            ds_faces = ds_batch.isel({facedim:slice(tiles_offset[itile], tiles_offset[itile+1])})
+            region_batch = region.copy()
+            if time_region is not None:
+                region_batch[time_dim] = time_region
+            ds_tile = xr.Dataset()
+            for varn in varn_list:
+                da = ds_faces[varn]
+                dims_nonface = [dim for dim in da.dims if dim != facedim]
+                values = _gather_raster(da.transpose(*dims_nonface, facedim).to_numpy(), face_index, valid)
+                da_tile = xr.DataArray(values.astype(dtypes_out[varn]), dims=dims_nonface + ["y","x"])
+                ds_tile[varn] = da_tile.transpose(*_get_raster_dims(da.dims, facedim))
+            write_tile(ds_tile, region_batch)
+        print('.',end='')
+    print(f': {(dt.datetime.now()-dtstart).total_seconds():.2f} sec')
+    
+    if is_netcdf:
+        ds_raster = xr.open_dataset(file_out, chunks={})
+    else:
+        zarr.consolidate_metadata(file_out)
+        ds_raster = xr.open_zarr(file_out)
+    return ds_raster
+
+
 def plot_ztdata(data_xr_sel, varname, ax=None, only_contour=False, **kwargs):
     """
     
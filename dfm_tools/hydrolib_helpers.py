@@ -1,9 +1,12 @@
+import os
+import mmap
 import pandas as pd
 import cftime
 import numpy as np
 import xarray as xr
 from cftime import date2num
 import hydrolib.core.dflowfm as hcdfm
+from hydrolib.core.dflowfm.ini.parser import Parser, ParserConfig
 import datetime as dt
 import geopandas
 from shapely.geometry import LineString
@@ -15,6 +18,7 @@ __all__ = ["Dataset_to_T3D",
            "geodataframe_to_PolyFile",
            "DataFrame_to_TimModel",
            "ForcingModel_to_plipointsDataset",
+           "ForcingFileIndex",
            "forcinglike_to_Dataset",
            "pointlike_to_DataFrame",
            "TimModel_to_DataFrame",
@@ -303,30 +307,25 @@ def DataFrame_to_TimModel(tim_pd, refdate:(dt.datetime, pd.Timestamp, str)):
 
 
 def ForcingModel_to_plipointsDataset(forcingmodel:hcdfm.ForcingModel, npoints=None, convertnan=False) -> xr.Dataset:
+    """
+    Convert a hcdfm.ForcingModel to a plipointsDataset. Instead of a ForcingModel, 
+    the path of a bc file can also be provided. In that case the file is read directly 
+    with dfmt.ForcingFileIndex(), which is much faster than parsing it with hydrolib-core.
+    """
+    if isinstance(forcingmodel, (str, os.PathLike)):
+        forcingfile_index = ForcingFileIndex(forcingmodel)
+        ds = forcingfile_index.to_plipointsDataset(npoints=npoints, convertnan=convertnan)
+        return ds
+    
     if not isinstance(forcingmodel, hcdfm.ForcingModel):
         raise TypeError('ForcingModel_to_plipointsDataset expects type hcdfm.ForcingModel, not type {type(forcingobj)}')
 
     ncbnd_construct = get_ncbnd_construct()
     dimn_point = ncbnd_construct['dimn_point']
-    varn_pointname = ncbnd_construct['varn_pointname']
     plipointsDataset_list = []
     for forcinglike in forcingmodel.forcing[:npoints]:
         ds_onepoint = forcinglike_to_Dataset(forcinglike, convertnan=convertnan)
-        
-        #set longname attr
-        for datavar in ds_onepoint.data_vars:
-            longname = datavar
-            if datavar in ['ux','uy']: #TODO: hardcoded behaviour is consitent with maybe_convert_fews_to_dfmt() and elsewhere in dfm_tools, but not desireable
-                longname = 'uxuyadvectionvelocitybnd'
-            ds_onepoint[datavar] = ds_onepoint[datavar].assign_attrs({'long_name': longname})
-        
-        # expand pointdim and add pointname as var
-        ds_onepoint = ds_onepoint.expand_dims(dimn_point)
-        datavar0 = list(ds_onepoint.data_vars)[0]
-        pointname = ds_onepoint[datavar0].attrs['locationname']
-        ds_onepoint[varn_pointname] = xr.DataArray([pointname],dims=dimn_point)
-        ds_onepoint = ds_onepoint.set_coords(varn_pointname)
-        
+        ds_onepoint = _forcing_Dataset_to_onepoint(ds_onepoint)
         plipointsDataset_list.append(ds_onepoint)
     ds = xr.concat(plipointsDataset_list, dim=dimn_point)
     
@@ -335,6 +334,227 @@ def ForcingModel_to_plipointsDataset(forcingmodel:hcdfm.ForcingModel, npoints=No
     return ds
 
 
+def _forcing_Dataset_to_onepoint(ds_onepoint):
+    """
+    set long_name attrs, expand the point dimension and add the pointname 
+    to a Dataset from forcinglike_to_Dataset()
+    """
+    ncbnd_construct = get_ncbnd_construct()
+    dimn_point = ncbnd_construct['dimn_point']
+    varn_pointname = ncbnd_construct['varn_pointname']
+    
+    #set longname attr
+    for datavar in ds_onepoint.data_vars:
+        longname = datavar
+        if datavar in ['ux','uy']: #TODO: hardcoded behaviour is consitent with maybe_convert_fews_to_dfmt() and elsewhere in dfm_tools, but not desireable
+            longname = 'uxuyadvectionvelocitybnd'
+        ds_onepoint[datavar] = ds_onepoint[datavar].assign_attrs({'long_name': longname})
+    
+    # expand pointdim and add pointname as var
+    ds_onepoint = ds_onepoint.expand_dims(dimn_point)
+    datavar0 = list(ds_onepoint.data_vars)[0]
+    pointname = ds_onepoint[datavar0].attrs['locationname']
+    ds_onepoint[varn_pointname] = xr.DataArray([pointname],dims=dimn_point)
+    ds_onepoint = ds_onepoint.set_coords(varn_pointname)
+    return ds_onepoint
+
+
+class ForcingFileIndex:
+    """
+    Offset index of the [Forcing] blocks in a bc file, for fast (lazy) reading 
+    of large bc files without parsing all datablocks with hydrolib-core. 
+    The headers are parsed with hydrolib-core, the datablocks are directly 
+    parsed into numpy arrays.
+    
+    Example:
+        forcingfile_index = dfmt.ForcingFileIndex(file_bc)
+        ds_onepoint = forcingfile_index.get_Dataset(forcingfile_index.names.index('bnd_0001'))
+        ds = forcingfile_index.to_plipointsDataset()
+    """
+    
+    def __init__(self, file_bc):
+        """
+        Scan the bc file once for the byte offsets of the header and datablock of each [Forcing] block.
+
+        Parameters
+        ----------
+        file_bc : str or Path
+            Path of the bc file.
+
+        """
+        self.file_bc = file_bc
+        self.names = []
+        self._offsets = []
+        self._headers_noname = []
+        
+        if os.path.getsize(file_bc) == 0:
+            return
+        with open(file_bc, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # find the section headers, the datablocks contain no brackets so this is fast
+            section_starts = []
+            section_isforcing = []
+            bracket_pos = mm.find(b'[')
+            while bracket_pos != -1:
+                line_start = mm.rfind(b'\n', 0, bracket_pos) + 1
+                if mm[line_start:bracket_pos].strip() == b'':
+                    section_starts.append(line_start)
+                    section_isforcing.append(mm[bracket_pos:bracket_pos+9].lower() == b'[forcing]')
+                bracket_pos = mm.find(b'[', bracket_pos + 1)
+            section_stops = section_starts[1:] + [len(mm)]
+            for block_start, block_stop, is_forcing in zip(section_starts, section_stops, section_isforcing):
+                if not is_forcing:
+                    continue
+                name = None
+                header_noname = []
+                line_start = block_start
+                while line_start < block_stop:
+                    line_stop = mm.find(b'\n', line_start, block_stop)
+                    line_stop = block_stop if line_stop == -1 else line_stop + 1
+                    line = mm[line_start:line_stop]
+                    line_strip = line.strip()
+                    is_header = (line_strip == b'' or line_strip.startswith((b'#', b'[')) or b'=' in line_strip)
+                    if not is_header:
+                        break
+                    key, _, value = line_strip.partition(b'=')
+                    if key.strip().lower() == b'name':
+                        name = value.strip().decode()
+                    else:
+                        header_noname.append(line_strip)
+                    line_start = line_stop
+                self.names.append(name)
+                self._offsets.append((block_start, line_start, block_stop))
+                self._headers_noname.append(b'\n'.join(header_noname))
+    
+    def __len__(self):
+        return len(self._offsets)
+    
+    def _read_bytes(self, start, stop):
+        with open(self.file_bc, 'rb') as f:
+            f.seek(start)
+            data_bytes = f.read(stop - start)
+        return data_bytes
+    
+    def get_forcing(self, iblock):
+        """
+        Parse the header of a [Forcing] block with hydrolib-core, returns a 
+        forcing object (like T3D/TimeSeries/Astronomic) with an empty datablock.
+        """
+        block_start, data_start, _ = self._offsets[iblock]
+        header_lines = self._read_bytes(block_start, data_start).decode('utf8').splitlines()
+        parser = Parser(ParserConfig(parse_datablocks=True, parse_comments=False))
+        for line in header_lines:
+            parser.feed_line(line)
+        forcingmodel_header = hcdfm.ForcingModel(**parser.finalize().flatten(True, False))
+        forcingobj = forcingmodel_header.forcing[0]
+        return forcingobj
+    
+    def get_datablock(self, iblock):
+        """
+        Parse the datablock of a [Forcing] block to a 2D numpy array. This is the 
+        same as np.array(forcingobj.datablock), so it is of dtype str if the 
+        datablock contains strings (like the astronomic components).
+        """
+        _, data_start, block_stop = self._offsets[iblock]
+        data_lines = self._read_bytes(data_start, block_stop).decode('utf8').strip().splitlines()
+        data_lines = [line for line in data_lines if line.strip() != '' and not line.lstrip().startswith('#')]
+        if len(data_lines) == 0:
+            return np.empty((0,0))
+        ncols = len(data_lines[0].split())
+        data_tokens = ' '.join(data_lines).split()
+        try:
+            datablock = np.array(data_tokens, dtype=float)
+        except ValueError:
+            # non-numeric values, convert like hydrolib-core and np.array(forcingobj.datablock)
+            datablock_list = [[_str_to_float_or_str(x) for x in line.split()] for line in data_lines]
+            return np.array(datablock_list)
+        datablock = datablock.reshape(-1, ncols)
+        return datablock
+    
+    def get_Dataset(self, iblock, convertnan=False):
+        """
+        Read one [Forcing] block into an xarray Dataset, the same as forcinglike_to_Dataset().
+        """
+        forcingobj = self.get_forcing(iblock)
+        datablock = self.get_datablock(iblock)
+        ds_onepoint = _forcinglike_to_Dataset(forcingobj, datablock_all=datablock, convertnan=convertnan)
+        return ds_onepoint
+    
+    def to_plipointsDataset(self, npoints=None, convertnan=False):
+        """
+        Read the [Forcing] blocks into a plipointsDataset, the same as ForcingModel_to_plipointsDataset(). 
+        If all blocks have the same header (except for the name) and the same times/components, the 
+        datablocks are stacked into one (point, time, depth) array, instead of concatenating a Dataset per point.
+        """
+        ncbnd_construct = get_ncbnd_construct()
+        dimn_point = ncbnd_construct['dimn_point']
+        dimn_depth = ncbnd_construct['dimn_depth']
+        varn_depth = ncbnd_construct['varn_depth']
+        varn_pointname = ncbnd_construct['varn_pointname']
+        
+        iblock_list = list(range(len(self)))[:npoints]
+        if len(iblock_list) == 0:
+            raise ValueError(f'no [Forcing] blocks in "{self.file_bc}"')
+        datablock_list = [self.get_datablock(iblock) for iblock in iblock_list]
+        
+        firstcol_equal = False
+        headers_equal = all(self._headers_noname[iblock] == self._headers_noname[0] for iblock in iblock_list)
+        shapes_equal = all(datablock.shape == datablock_list[0].shape for datablock in datablock_list)
+        if headers_equal and shapes_equal:
+            datablock_all = np.stack(datablock_list)
+            # time column (or astronomic components) should be equal for all blocks
+            firstcol_equal = (datablock_all[:,:,0] == datablock_all[:1,:,0]).all()
+        
+        if not (headers_equal and shapes_equal and firstcol_equal):
+            plipointsDataset_list = []
+            for iblock, datablock in zip(iblock_list, datablock_list):
+                forcingobj = self.get_forcing(iblock)
+                ds_onepoint = _forcinglike_to_Dataset(forcingobj, datablock_all=datablock, convertnan=convertnan)
+                ds_onepoint = _forcing_Dataset_to_onepoint(ds_onepoint)
+                plipointsDataset_list.append(ds_onepoint)
+            ds = xr.concat(plipointsDataset_list, dim=dimn_point)
+            ds = maybe_convert_fews_to_dfmt(ds)
+            return ds
+        
+        # construct the dataset of the first block and fill it with the data of all blocks
+        forcingobj = self.get_forcing(iblock_list[0])
+        ds_first = _forcinglike_to_Dataset(forcingobj, datablock_all=datablock_list[0], convertnan=False)
+        ds_first = _forcing_Dataset_to_onepoint(ds_first)
+        ds = ds_first.isel({dimn_point:np.zeros(len(iblock_list), dtype=int)})
+        ds[varn_pointname] = ds[varn_pointname].copy(data=np.array([self.names[iblock] for iblock in iblock_list]))
+        
+        datablock_data = datablock_all[:,:,1:]
+        if datablock_data.dtype.kind not in 'fiu':
+            datablock_data = datablock_data.astype(float) #convert str to float in case of "astronomic component"
+        quantity_list = list(ds.data_vars)
+        nquan = len(quantity_list)
+        for iQ, var_quantity in enumerate(quantity_list):
+            datablock_data_onequan = datablock_data[:,:,iQ::nquan].reshape(ds[var_quantity].shape)
+            data_xr_var = ds[var_quantity].copy(data=datablock_data_onequan)
+            if convertnan and dimn_depth in data_xr_var.dims: #convert ffilled/bfilled values back to nan
+                deepestlayeridx = data_xr_var[varn_depth].to_numpy().argmin()
+                if deepestlayeridx==0: #sorted from deep to shallow layers
+                    bool_eq_above = data_xr_var==data_xr_var.shift({varn_depth:-1})
+                else: #sorted from shallow to deep layers
+                    bool_eq_above = data_xr_var==data_xr_var.shift({varn_depth:1})
+                bool_eq_bottom = data_xr_var==data_xr_var.isel({varn_depth:deepestlayeridx})
+                bool_nandepths = (bool_eq_above & bool_eq_bottom).all(dim='time')
+                data_xr_var = data_xr_var.where(~bool_nandepths)
+            ds[var_quantity] = data_xr_var
+        
+        ds = maybe_convert_fews_to_dfmt(ds)
+        return ds
+
+
+def _str_to_float_or_str(value):
+    """
+    convert a datablock value like hydrolib-core does (float if possible, otherwise str)
+    """
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
 def forcinglike_to_Dataset(forcingobj, convertnan=False):
     """
     convert a hydrolib forcing like object (like Timeseries, T3D, Harmonic, etc) to an xarray Dataset with one or more variables.
@@ -342,15 +562,25 @@ def forcinglike_to_Dataset(forcingobj, convertnan=False):
     convertnan: convert depths with the same values over time as the deepest layer to nan (these were created with .bfill() or .ffill()).
     """
     
+    #check if forcingmodel instead of T3D/TimeSeries is provided
+    if isinstance(forcingobj, hcdfm.ForcingModel):
+        raise TypeError('instead of supplying a ForcingModel, provide a ForcingObject (Timeseries/T3D etc), by doing something like ForcingModel.forcing[0], or use dfmt.ForcingModel_to_plipointsDataset() instead')
+    
+    datablock_all = np.array(forcingobj.datablock)
+    data_xr = _forcinglike_to_Dataset(forcingobj, datablock_all=datablock_all, convertnan=convertnan)
+    return data_xr
+
+
+def _forcinglike_to_Dataset(forcingobj, datablock_all, convertnan=False):
+    """
+    forcinglike_to_Dataset() with the datablock provided as a separate numpy array
+    """
+    
     ncbnd_construct = get_ncbnd_construct()
     dimn_depth = ncbnd_construct['dimn_depth']
     varn_depth = ncbnd_construct['varn_depth']
     attrs_depth = ncbnd_construct['attrs_depth']
     
-    #check if forcingmodel instead of T3D/TimeSeries is provided
-    if isinstance(forcingobj, hcdfm.ForcingModel):
-        raise TypeError('instead of supplying a ForcingModel, provide a ForcingObject (Timeseries/T3D etc), by doing something like ForcingModel.forcing[0], or use dfmt.ForcingModel_to_plipointsDataset() instead')
-    
     allowed_instances = (hcdfm.T3D, hcdfm.TimeSeries, hcdfm.Astronomic)
     if not isinstance(forcingobj, allowed_instances):
         raise TypeError(f'supplied input is not one of: {allowed_instances}')
@@ -374,7 +604,6 @@ def forcinglike_to_Dataset(forcingobj, convertnan=False):
     elif isinstance(forcingobj, hcdfm.Astronomic):
         dims = ('astronomic_component')
     
-    datablock_all = np.array(forcingobj.datablock)
     datablock_data = datablock_all[:,1:] #select all columns except first one (which is the time column)
     if isinstance(forcingobj, hcdfm.Astronomic):
         datablock_data = datablock_data.astype(float) #convert str to float in case of "astronomic component"
@@ -1,14 +1,17 @@
 import os
 import glob
+import hashlib
 import datetime as dt
 import numpy as np
 import pandas as pd
 import xarray as xr
 import xugrid as xu
 from pathlib import Path
+from functools import partial
 from scipy.spatial import KDTree
 import logging
 import hydrolib.core.dflowfm as hcdfm
+from cftime import date2num
 import geopandas
 
 from dfm_tools.hydrolib_helpers import (Dataset_to_TimeSeries, 
@@ -28,6 +31,7 @@ __all__ = ["get_conversion_dict",
            "interp_uds_to_plipoints",
            "interp_hisnc_to_plipoints",
            "plipointsDataset_to_ForcingModel",
+           "plipointsDataset_to_bc",
     ]
 
 logger = logging.getLogger(__name__)
@@ -143,20 +147,20 @@ def ext_add_boundary_object_per_polyline(ext_new:hcdfm.ExtModel, boundary_object
         ext_new.boundary.append(boundary_object)
 
 
-def interpolate_tide_to_bc(ext_new: hcdfm.ExtModel, tidemodel, file_pli, component_list=None, load=True):
+def interpolate_tide_to_bc(ext_new: hcdfm.ExtModel, tidemodel, file_pli, component_list=None, load=True, weights_cache=None):
     # read polyfile as geodataframe
     polyfile_object = hcdfm.PolyFile(file_pli)
     gdf_points = PolyFile_to_geodataframe_points(polyfile_object)
     
     # interpolate tidal components to plipoints
     data_interp = interpolate_tide_to_plipoints(tidemodel=tidemodel, gdf_points=gdf_points, 
-                                                component_list=component_list, load=load)
+                                                component_list=component_list, load=load,
+                                                weights_cache=weights_cache)
     
-    # convert interpolated xarray.Dataset to hydrolib ForcingModel and save as bc file
-    ForcingModel_object = plipointsDataset_to_ForcingModel(plipointsDataset=data_interp)
+    # write interpolated xarray.Dataset to bc file
     dir_output = os.path.dirname(file_pli)
     file_bc_out = os.path.join(dir_output,f'tide_{tidemodel}.bc')
-    ForcingModel_object.save(filepath=file_bc_out)
+    ForcingModel_object = plipointsDataset_to_bc(plipointsDataset=data_interp, file_bc=file_bc_out)
     
     # generate hydrolib-core Boundary object to be appended to the ext file
     boundary_object = hcdfm.Boundary(quantity='waterlevelbnd', #the FM quantity for tide is also waterlevelbnd
@@ -199,7 +203,7 @@ def components_translate_upper(component_list):
     return component_list
 
 
-def interpolate_tide_to_plipoints(tidemodel, gdf_points, component_list=None, load=True):
+def interpolate_tide_to_plipoints(tidemodel, gdf_points, component_list=None, load=True, weights_cache=None):
     """
     empty docstring
     """
@@ -280,7 +284,7 @@ def interpolate_tide_to_plipoints(tidemodel, gdf_points, component_list=None, lo
     data_xrsel['compnames'] = xr.DataArray(component_list,dims=('compno'))
     data_xrsel = data_xrsel.set_index({'compno':'compnames'})
     
-    data_interp = interp_regularnc_to_plipointsDataset(data_xr_reg=data_xrsel, gdf_points=gdf_points, load=load)
+    data_interp = interp_regularnc_to_plipointsDataset(data_xr_reg=data_xrsel, gdf_points=gdf_points, load=load, weights_cache=weights_cache)
     data_interp['phase_new'] = np.rad2deg(np.arctan2(data_interp['wl_imag'],data_interp['wl_real']))
     return data_interp
 
@@ -363,9 +367,81 @@ def ds_apply_conversion_dict(data_xr, conversion_dict, quantity):
     return data_xr
 
 
-def open_prepare_dataset(dir_pattern, quantity, tstart, tstop, conversion_dict=None, refdate_str=None, chunks=None):
+def _bbox_indices_1d(coord_vals, coord_min, coord_max):
     """
-    empty docstring
+    Indices of the coordinate values within coord_min and coord_max, including 
+    the first value below and above them. This is the stencil that is needed for 
+    linear and nearest interpolation to all locations within coord_min and coord_max. 
+    The indices are returned in the original order of the (unsorted) coordinate values.
+    """
+    coord_order = np.argsort(coord_vals, kind='stable')
+    coord_sorted = coord_vals[coord_order]
+    idx_start = max(np.searchsorted(coord_sorted, coord_min, side='left') - 1, 0)
+    idx_stop = min(np.searchsorted(coord_sorted, coord_max, side='right') + 1, len(coord_sorted))
+    indices = np.sort(coord_order[idx_start:idx_stop])
+    return indices
+
+
+def _preprocess_bbox(ds, bbox):
+    """
+    Subset a regular source dataset to the cells that are needed for interpolation 
+    to locations within bbox (minx, miny, maxx, maxy). This is applied per file in 
+    open_prepare_dataset(), so before the longitude conversion in ds_apply_conventions(). 
+    Source longitudes in 0 to 360 degrees are therefore compared in -180 to 180 degrees, 
+    the selection can contain both ends of the source longitude range in that case.
+    """
+    minx, miny, maxx, maxy = bbox
+    isel_dict = {}
+    for coordnames, coord_min, coord_max in [(['longitude','lon'], minx, maxx), (['latitude','lat'], miny, maxy)]:
+        coordnames_present = [x for x in coordnames if x in ds.dims and x in ds.coords]
+        if len(coordnames_present) == 0:
+            continue
+        coordname = coordnames_present[0]
+        coord_vals = ds[coordname].to_numpy()
+        if coordname in ['longitude','lon']:
+            coord_vals = (coord_vals + 180) % 360 - 180
+        indices = _bbox_indices_1d(coord_vals, coord_min, coord_max)
+        if len(indices) < 2:
+            # bbox outside of source domain, do not subset so interpolation raises a proper error
+            continue
+        isel_dict[coordname] = indices
+    ds = ds.isel(isel_dict)
+    return ds
+
+
+def open_prepare_dataset(dir_pattern, quantity, tstart, tstop, conversion_dict=None, refdate_str=None, chunks=None, bbox=None):
+    """
+    Open a regular source dataset (like CMEMS) with xr.open_mfdataset, apply 
+    dfm_tools conventions and unit conversions and select the time range.
+
+    Parameters
+    ----------
+    dir_pattern : str or Path
+        Path or glob pattern of the netcdf file(s).
+    quantity : str
+        The delft3dfm quantity, like salinitybnd.
+    tstart : str, pd.Timestamp
+        Start time of the selection.
+    tstop : str, pd.Timestamp
+        Stop time of the selection.
+    conversion_dict : dict, optional
+        Conversion dictionary, the default is None (dfmt.get_conversion_dict()).
+    refdate_str : str, optional
+        Reference date to set to the time encoding. The default is None.
+    chunks : dict, optional
+        Passed on to xr.open_mfdataset. The default is None.
+    bbox : tuple, optional
+        Bounding box (minx, miny, maxx, maxy) of the locations the data will be 
+        interpolated to, like gdf_points.total_bounds. If provided, each file is 
+        subsetted to the cells that are needed for interpolation within this bbox 
+        upon opening, so the dataset only contains the boundary footprint instead 
+        of the entire source domain. The default is None.
+
+    Returns
+    -------
+    data_xr_vars : xr.Dataset
+        Dataset with the quantity variable.
+
     """
     
     if conversion_dict is None:
@@ -374,7 +450,12 @@ def open_prepare_dataset(dir_pattern, quantity, tstart, tstop, conversion_dict=N
     file_list_nc = glob.glob(str(dir_pattern))
     print(f'loading mfdataset of {len(file_list_nc)} files with pattern(s) {dir_pattern}')
     
-    data_xr = xr.open_mfdataset(file_list_nc, chunks=chunks, join="exact") #TODO: does chunks argument solve "PerformanceWarning: Slicing is producing a large chunk."? {'time':1} is not a convenient chunking to use for timeseries extraction
+    if bbox is None:
+        preprocess = None
+    else:
+        preprocess = partial(_preprocess_bbox, bbox=bbox)
+    
+    data_xr = xr.open_mfdataset(file_list_nc, chunks=chunks, join="exact", preprocess=preprocess) #TODO: does chunks argument solve "PerformanceWarning: Slicing is producing a large chunk."? {'time':1} is not a convenient chunking to use for timeseries extraction
     
     data_xr = ds_apply_conventions(data_xr=data_xr)
     data_xr = ds_apply_conversion_dict(data_xr=data_xr, conversion_dict=conversion_dict, quantity=quantity)
@@ -398,45 +479,244 @@ def open_prepare_dataset(dir_pattern, quantity, tstart, tstop, conversion_dict=N
     return data_xr_vars
 
 
-def interp_regularnc_to_plipointsDataset(data_xr_reg, gdf_points, load=True):
+def _interp_weights_1d(grid, values):
+    """
+    Lower grid index and normalized distance to it for linear interpolation 
+    of values on a strictly monotonic 1D grid. This mirrors the index search 
+    of scipy.interpolate.RegularGridInterpolator (used by xarray interp), 
+    including the handling of descending grids and values on grid nodes.
+    """
+    grid = np.asarray(grid, dtype=float)
+    values = np.asarray(values, dtype=float)
+    descending = grid.size > 1 and grid[1] < grid[0]
+    if descending:
+        grid = np.flip(grid)
+    index = np.searchsorted(grid, values, side='right') - 1
+    index = np.clip(index, 0, grid.size - 2)
+    distance = (values - grid[index]) / (grid[index + 1] - grid[index])
+    return index, distance, descending
+
+
+def _get_interp_weights_regular(data_xr_reg, da_plipoints):
+    """
+    Sparse interpolation weights from a regular longitude/latitude grid to 
+    the plipoints. The bilinear weights of the four surrounding cells and 
+    the nearest cell are stored per point, together with the unique cells 
+    that are needed, so all variables can be interpolated with one gather.
+    """
+    ncbnd_construct = get_ncbnd_construct()
+    dimn_point = ncbnd_construct['dimn_point']
+    varn_pointx = ncbnd_construct['varn_pointx']
+    varn_pointy = ncbnd_construct['varn_pointy']
+    
+    lonvar_vals = data_xr_reg['longitude'].to_numpy()
+    latvar_vals = data_xr_reg['latitude'].to_numpy()
+    pointx = da_plipoints[varn_pointx].to_numpy()
+    pointy = da_plipoints[varn_pointy].to_numpy()
+    
+    # generate a proper error with outofbounds requested coordinates
+    bool_reqlon_outbounds = (pointx < lonvar_vals.min()) | (pointx > lonvar_vals.max())
+    bool_reqlat_outbounds = (pointy < latvar_vals.min()) | (pointy > latvar_vals.max())
+    bool_outbounds = bool_reqlon_outbounds | bool_reqlat_outbounds
+    if bool_outbounds.any():
+        reqlatlon_pd = pd.DataFrame({'longitude':pointx,'latitude':pointy,'lon outbounds':bool_reqlon_outbounds,'lat outbounds':bool_reqlat_outbounds})
+        reqlatlon_pd_outbounds = reqlatlon_pd.loc[bool_outbounds]
+        raise ValueError(f'{len(reqlatlon_pd_outbounds)} of requested pli points are out of bounds (valid longitude range {lonvar_vals.min()} to {lonvar_vals.max()}, valid latitude range {latvar_vals.min()} to {latvar_vals.max()}):\n{reqlatlon_pd_outbounds}')
+    
+    idx_lon, dist_lon, desc_lon = _interp_weights_1d(lonvar_vals, pointx)
+    idx_lat, dist_lat, desc_lat = _interp_weights_1d(latvar_vals, pointy)
+    
+    # corners and weights in the order of the scipy hypercube (longitude is 
+    # the first interpolation dimension) to get identical linear results
+    corner_lon = np.stack([idx_lon, idx_lon, idx_lon + 1, idx_lon + 1], axis=1)
+    corner_lat = np.stack([idx_lat, idx_lat + 1, idx_lat, idx_lat + 1], axis=1)
+    corner_weight_lon = np.stack([1 - dist_lon, 1 - dist_lon, dist_lon, dist_lon], axis=1)
+    corner_weight_lat = np.stack([1 - dist_lat, dist_lat, 1 - dist_lat, dist_lat], axis=1)
+    nearest_lon = np.where(dist_lon <= .5, idx_lon, idx_lon + 1)
+    nearest_lat = np.where(dist_lat <= .5, idx_lat, idx_lat + 1)
+    
+    # convert indices on flipped descending grids back to the original grid
+    if desc_lon:
+        corner_lon = lonvar_vals.size - 1 - corner_lon
+        nearest_lon = lonvar_vals.size - 1 - nearest_lon
+    if desc_lat:
+        corner_lat = latvar_vals.size - 1 - corner_lat
+        nearest_lat = latvar_vals.size - 1 - nearest_lat
+    
+    # unique cells, corners and nearest cell refer to their position
+    cell_lon = np.concatenate([corner_lon, nearest_lon[:,np.newaxis]], axis=1)
+    cell_lat = np.concatenate([corner_lat, nearest_lat[:,np.newaxis]], axis=1)
+    cell_flat = cell_lat.ravel() * lonvar_vals.size + cell_lon.ravel()
+    cell_unique, cell_position = np.unique(cell_flat, return_inverse=True)
+    cell_position = cell_position.reshape(cell_lon.shape)
     
+    ds_weights = xr.Dataset()
+    ds_weights['cell_longitude_index'] = xr.DataArray(cell_unique % lonvar_vals.size, dims='cell')
+    ds_weights['cell_latitude_index'] = xr.DataArray(cell_unique // lonvar_vals.size, dims='cell')
+    ds_weights['corner_cell'] = xr.DataArray(cell_position[:,:4], dims=(dimn_point,'corner'))
+    ds_weights['corner_weight_longitude'] = xr.DataArray(corner_weight_lon, dims=(dimn_point,'corner'))
+    ds_weights['corner_weight_latitude'] = xr.DataArray(corner_weight_lat, dims=(dimn_point,'corner'))
+    ds_weights['nearest_cell'] = xr.DataArray(cell_position[:,4], dims=dimn_point)
+    ds_weights = ds_weights.assign_coords(da_plipoints.coords)
+    return ds_weights
+
+
+def _get_interp_weights_cache_key(data_xr_reg, da_plipoints) -> str:
+    """
+    Hash of the source longitude/latitude coordinates and the plipoint coordinates. 
+    The weights do not depend on other dimensions like depth or time, so these 
+    are not part of the key to also reuse the weights for other quantities/products on the same grid.
+    """
     ncbnd_construct = get_ncbnd_construct()
     varn_pointx = ncbnd_construct['varn_pointx']
     varn_pointy = ncbnd_construct['varn_pointy']
     
+    hash_obj = hashlib.sha256()
+    for coord in [data_xr_reg['longitude'], data_xr_reg['latitude'], 
+                  da_plipoints[varn_pointx], da_plipoints[varn_pointy]]:
+        coord_vals = np.ascontiguousarray(coord.to_numpy(), dtype=np.float64)
+        hash_obj.update(str(coord_vals.shape).encode())
+        hash_obj.update(coord_vals.tobytes())
+    cache_key = hash_obj.hexdigest()
+    return cache_key
+
+
+def _get_interp_weights_regular_cached(data_xr_reg, da_plipoints, weights_cache=None):
+    """
+    Get the interpolation weights from _get_interp_weights_regular(), 
+    read from or written to a netcdf file in the weights_cache directory 
+    if it is provided. The file is regenerated if the source grid or the 
+    plipoints change. Writing is skipped with a warning in case the 
+    directory is not writable.
+    """
+    if weights_cache is None:
+        ds_weights = _get_interp_weights_regular(data_xr_reg, da_plipoints)
+        return ds_weights
+    
+    cache_key = _get_interp_weights_cache_key(data_xr_reg, da_plipoints)
+    file_cache = os.path.join(weights_cache, f"interp_weights_{cache_key[:16]}.nc")
+    if os.path.exists(file_cache):
+        with xr.open_dataset(file_cache) as ds_cache:
+            if ds_cache.attrs.get("cache_key") == cache_key:
+                print(f'> reading interpolation weights from cache "{file_cache}"')
+                ds_weights = ds_cache.load()
+                ds_weights.attrs = {}
+                ds_weights = ds_weights.assign_coords(da_plipoints.coords)
+                return ds_weights
+    
+    ds_weights = _get_interp_weights_regular(data_xr_reg, da_plipoints)
+    ds_cache = ds_weights.drop_vars(list(ds_weights.coords))
+    ds_cache.attrs["cache_key"] = cache_key
+    ds_cache.attrs["source"] = "dfm_tools.interp_regularnc_to_plipointsDataset()"
+    try:
+        os.makedirs(weights_cache, exist_ok=True)
+        ds_cache.to_netcdf(file_cache)
+    except (PermissionError, OSError) as e:
+        logger.warning(f'writing interpolation weights cache to "{file_cache}" failed, continuing without cache: {e}')
+    return ds_weights
+
+
+def _interp_cells_regular(values, corner_cell, weight_lon, weight_lat, nearest_cell):
+    """
+    Linear interpolation of the gathered cells (last axis of values), 
+    filled with the nearest cell where the linear result is nan.
+    """
+    weight = weight_lon * weight_lat
+    values_lin = 0
+    for icorner in range(corner_cell.shape[1]):
+        values_lin = values_lin + values[..., corner_cell[:,icorner]] * weight[:,icorner]
+    values_near = values[..., nearest_cell]
+    values_interp = np.where(np.isnan(values_lin), values_near, values_lin)
+    return values_interp
+
+
+def _apply_interp_weights_regular(data_xr_reg, ds_weights):
+    """
+    Apply the weights from _get_interp_weights_regular() to all variables 
+    with longitude/latitude dimensions. The needed cells are retrieved with 
+    a single (lazy) gather, after which the linear interpolation is filled 
+    with the nearest values where it is nan in one task per chunk. This gives 
+    the same result (up to floating point rounding) as the combination of 
+    data_xr_reg.interp() with method='linear' and method='nearest' via combine_first(). 
+    The fallback is deliberately the nearest cell and not the nearest valid cell, 
+    since the valid cells depend on the data (e.g. per depth) and can therefore 
+    not be part of the precomputed weights. Points where the nearest cell is also 
+    nan remain nan, like before.
+    """
+    ncbnd_construct = get_ncbnd_construct()
+    dimn_point = ncbnd_construct['dimn_point']
+    
+    ds_cells = data_xr_reg.isel(longitude=ds_weights['cell_longitude_index'].variable,
+                                latitude=ds_weights['cell_latitude_index'].variable)
+    weights_kwargs = dict(corner_cell=ds_weights['corner_cell'].to_numpy(),
+                          weight_lon=ds_weights['corner_weight_longitude'].to_numpy(),
+                          weight_lat=ds_weights['corner_weight_latitude'].to_numpy(),
+                          nearest_cell=ds_weights['nearest_cell'].to_numpy())
+    
+    data_interp = ds_cells.drop_dims('cell').assign_coords(ds_weights.coords)
+    for varname in ds_cells.data_vars:
+        da_cells = ds_cells[varname]
+        if 'cell' not in da_cells.dims:
+            continue
+        if da_cells.chunks is not None:
+            da_cells = da_cells.chunk({'cell':-1})
+        dtype_out = np.result_type(da_cells.dtype, np.float64)
+        da_interp = xr.apply_ufunc(_interp_cells_regular, da_cells.variable,
+                                   kwargs=weights_kwargs,
+                                   input_core_dims=[['cell']],
+                                   output_core_dims=[[dimn_point]],
+                                   dask='parallelized',
+                                   output_dtypes=[dtype_out],
+                                   dask_gufunc_kwargs={'output_sizes':{dimn_point:ds_weights.sizes[dimn_point]}},
+                                   keep_attrs=True)
+        dims_out = [dimn_point if dim=='cell' else dim for dim in da_cells.dims]
+        data_interp[varname] = da_interp.transpose(*dims_out)
+    data_interp = data_interp[list(data_xr_reg.data_vars)]
+    return data_interp
+
+
+def interp_regularnc_to_plipointsDataset(data_xr_reg, gdf_points, load=True, weights_cache=None):
+    """
+    Interpolate a regular grid dataset (with longitude/latitude dimensions) 
+    to the plipoints with linear interpolation, filled with nearest 
+    interpolation where the linear result is nan.
+
+    Parameters
+    ----------
+    data_xr_reg : xr.Dataset
+        Regular grid dataset with longitude/latitude coordinates.
+    gdf_points : geopandas.GeoDataFrame
+        GeoDataFrame with Point geometries, for instance from dfmt.PolyFile_to_geodataframe_points().
+    load : bool, optional
+        Load the interpolated data. The default is True.
+    weights_cache : str, optional
+        Directory to store the interpolation weights in, so they are reused in 
+        subsequent calls for the same source grid (longitude/latitude) and points. 
+        The weights are recomputed if either of these changes. The default is None.
+
+    Returns
+    -------
+    data_interp : xr.Dataset
+        Dataset with the interpolated variables on the plipoints.
+
+    """
+    
     da_plipoints = da_from_gdf_points(gdf_points)
     
     #interpolation to lat/lon combinations
     print('> interp mfdataset to all PolyFile points (lat/lon coordinates)')
     
-    # linear, nearest, combine_first
-    data_interp_lin = data_xr_reg.interp(longitude=da_plipoints[varn_pointx], latitude=da_plipoints[varn_pointy],
-                                         method='linear', 
-                                         kwargs={'bounds_error':True}) #error is only raised upon load(), so when the actual value retrieval happens
-    data_interp_near = data_xr_reg.interp(longitude=da_plipoints[varn_pointx], latitude=da_plipoints[varn_pointy],
-                                          method='nearest', 
-                                          kwargs={'bounds_error':True}) #error is only raised upon load(), so when the actual value retrieval happens
-    data_interp = data_interp_lin.combine_first(data_interp_near)
-    
-    # drop original latitude/longitude vars (lat/lon in da_plipoints)
-    data_interp = data_interp.drop_vars(['latitude','longitude'])
+    # linear with nearest fallback, via precomputed sparse weights so all 
+    # variables/times/depths are retrieved with a single gather
+    ds_weights = _get_interp_weights_regular_cached(data_xr_reg, da_plipoints, weights_cache=weights_cache)
+    data_interp = _apply_interp_weights_regular(data_xr_reg, ds_weights)
     
     if not load:
         return data_interp
     
     print(f'> actual extraction of data from netcdf with .load() (for {len(gdf_points)} plipoints at once, this might take a while)')
     dtstart = dt.datetime.now()
-    try:
-        data_interp_loaded = data_interp.load() #loading data for all points at once is more efficient compared to loading data per point in loop 
-    except ValueError: #generate a proper error with outofbounds requested coordinates, default is "ValueError: One of the requested xi is out of bounds in dimension 0" #TODO: improve error in xarray
-        lonvar_vals = data_xr_reg['longitude'].to_numpy()
-        latvar_vals = data_xr_reg['latitude'].to_numpy()
-        data_pol_pd = data_interp[[varn_pointx,varn_pointy]].to_dataframe()
-        bool_reqlon_outbounds = (data_pol_pd[varn_pointx] <= lonvar_vals.min()) | (data_pol_pd[varn_pointx] >= lonvar_vals.max())
-        bool_reqlat_outbounds = (data_pol_pd[varn_pointy] <= latvar_vals.min()) | (data_pol_pd[varn_pointy] >= latvar_vals.max())
-        reqlatlon_pd = pd.DataFrame({'longitude':data_pol_pd[varn_pointx],'latitude':data_pol_pd[varn_pointy],'lon outbounds':bool_reqlon_outbounds,'lat outbounds':bool_reqlat_outbounds})
-        reqlatlon_pd_outbounds = reqlatlon_pd.loc[bool_reqlon_outbounds | bool_reqlat_outbounds]
-        raise ValueError(f'{len(reqlatlon_pd_outbounds)} of requested pli points are out of bounds (valid longitude range {lonvar_vals.min()} to {lonvar_vals.max()}, valid latitude range {latvar_vals.min()} to {latvar_vals.max()}):\n{reqlatlon_pd_outbounds}')
+    data_interp_loaded = data_interp.load() #loading data for all points at once is more efficient compared to loading data per point in loop 
     time_passed = (dt.datetime.now()-dtstart).total_seconds()
     print(f'>>time passed: {time_passed:.2f} sec')
 
@@ -596,3 +876,177 @@ def plipointsDataset_to_ForcingModel(plipointsDataset):
     
     return ForcingModel_object
 
+
+def _format_datablock(datablock_np):
+    """
+    Format a 2D datablock like the hydrolib-core serializer does: the shortest 
+    representation of floats, left-aligned columns separated by two spaces 
+    and no trailing whitespace. The padding is done on a numpy byte buffer.
+    """
+    nrows, ncols = datablock_np.shape
+    if datablock_np.dtype.kind == 'f':
+        # repr of a list of floats is way faster than formatting them one by one
+        values_str = repr(datablock_np.ravel().tolist())[1:-1].split(', ')
+    else:
+        values_str = [str(x) for x in datablock_np.ravel().tolist()]
+    values_bytes = np.array(values_str, dtype='S').reshape(nrows, ncols)
+    col_widths = np.char.str_len(values_bytes).max(axis=0)
+    row_width = col_widths.sum() + 2 * (ncols - 1)
+    
+    # trailing nulls are stripped upon conversion to bytes, so the last 
+    # column is padded with nulls instead of spaces to avoid trailing whitespace
+    itemsize = values_bytes.dtype.itemsize
+    values_uint8 = values_bytes.view(np.uint8).reshape(nrows, ncols, itemsize)
+    buffer = np.full((nrows, row_width), ord(' '), dtype=np.uint8)
+    offset = 0
+    for icol, col_width in enumerate(col_widths):
+        col_uint8 = values_uint8[:, icol, :col_width]
+        if icol < ncols - 1:
+            col_uint8 = np.where(col_uint8 == 0, ord(' '), col_uint8)
+        buffer[:, offset:offset + col_width] = col_uint8
+        offset += col_width + 2
+    rows_bytes = buffer.view(f'S{row_width}').ravel().tolist()
+    datablock_str = b'\n'.join(rows_bytes).decode()
+    return datablock_str
+
+
+def plipointsDataset_to_bc(plipointsDataset, file_bc, max_memory_mb=1000):
+    """
+    Write a plipointsDataset directly to a bc file, identical to the file 
+    written by plipointsDataset_to_ForcingModel() followed by ForcingModel.save(). 
+    The hydrolib-core objects are only used once to generate the header, the 
+    datablocks are formatted directly from the numpy arrays and written per point. 
+    Lazy data is loaded in chunks of points, so the memory usage is bounded.
+
+    Parameters
+    ----------
+    plipointsDataset : xr.Dataset
+        Dataset with the data on plipoints, for instance from dfmt.interp_regularnc_to_plipointsDataset().
+    file_bc : str or Path
+        Path of the bc file to write.
+    max_memory_mb : int, optional
+        Approximate memory budget for loading a chunk of points, only relevant for lazy 
+        data. The default is 1000.
+
+    Returns
+    -------
+    ForcingModel_object : hcdfm.ForcingModel
+        ForcingModel that refers to file_bc (without the forcings in memory), 
+        to use as forcingfile in a hcdfm.Boundary. Save the ExtModel that contains 
+        it with recurse=False (the default), since saving it recursively would 
+        overwrite file_bc with an empty ForcingModel.
+
+    """
+    
+    ncbnd_construct = get_ncbnd_construct()
+    dimn_point = ncbnd_construct['dimn_point']
+    dimn_depth = ncbnd_construct['dimn_depth']
+    varn_pointname = ncbnd_construct['varn_pointname']
+    
+    plipointsDataset = maybe_convert_fews_to_dfmt(plipointsDataset)
+    
+    quantity_list = list(plipointsDataset.data_vars)
+    npoints = len(plipointsDataset[dimn_point])
+    
+    if dimn_depth in plipointsDataset.dims:
+        Dataset_to_forcing = Dataset_to_T3D
+    elif 'amplitude' in quantity_list:
+        Dataset_to_forcing = Dataset_to_Astronomic
+    else:
+        Dataset_to_forcing = Dataset_to_TimeSeries
+    
+    # relative times are the same for all points
+    if Dataset_to_forcing is not Dataset_to_Astronomic:
+        refdate_str = plipointsDataset.time.encoding['units']
+        timevar_sel_rel = date2num(pd.DatetimeIndex(plipointsDataset.time.to_numpy()).to_pydatetime(),units=refdate_str,calendar='standard')
+    
+    # the header is generated once by saving a ForcingModel with the forcing of the first point 
+    # without datablock. The header does not depend on the data values, only the name differs per point
+    if Dataset_to_forcing is Dataset_to_Astronomic:
+        ds_header = plipointsDataset.isel({dimn_point:0, 'compno':[0]})
+    else:
+        ds_header = plipointsDataset.isel({dimn_point:0, 'time':[0]})
+    ds_header = ds_header.fillna(0)
+    for quan in quantity_list:
+        ds_header[quan].attrs['locationname'] = str(ds_header[varn_pointname].to_numpy())
+    forcing_header = Dataset_to_forcing(ds_header)
+    forcing_header.datablock = []
+    Path(file_bc).parent.mkdir(parents=True, exist_ok=True)
+    hcdfm.ForcingModel(forcing=[forcing_header]).save(file_bc)
+    with open(file_bc, encoding='utf8') as f:
+        lines_header = f.read().splitlines()
+    iline_forcing = [iline for iline, line in enumerate(lines_header) if line.strip().lower() == '[forcing]'][0]
+    file_header_lines = lines_header[:iline_forcing]
+    header_lines = [line for line in lines_header[iline_forcing:] if line.strip() != '']
+    iline_name = [iline for iline, line in enumerate(header_lines) if line.split('=')[0].strip().lower() == 'name'][0]
+    name_prefix = header_lines[iline_name][:header_lines[iline_name].index('=') + 2]
+    
+    # size of the chunk of points that is loaded at once
+    npoints_chunk = npoints
+    if plipointsDataset.chunks:
+        nbytes_onepoint = plipointsDataset.nbytes / max(npoints, 1)
+        npoints_chunk = int(max(1, max_memory_mb * 1024**2 // max(nbytes_onepoint, 1)))
+    
+    print(f'Writing {npoints} plipoints to bc file:',end='')
+    dtstart = dt.datetime.now()
+    with open(file_bc, 'w', encoding='utf8') as f:
+        # file header and [General] block
+        for line in file_header_lines:
+            f.write(line + "\n")
+        
+        for ipoint_start in range(0, npoints, npoints_chunk):
+            ds_chunk = plipointsDataset.isel({dimn_point:slice(ipoint_start, ipoint_start + npoints_chunk)}).load()
+            #ffill/bfill nan data along over depth dimension (corresponds to vertical extrapolation)
+            ds_chunk_filled = ds_chunk
+            if Dataset_to_forcing is Dataset_to_T3D:
+                ds_chunk_filled = ds_chunk.bfill(dim=dimn_depth).ffill(dim=dimn_depth)
+            
+            for iP_chunk in range(ds_chunk.sizes[dimn_point]):
+                iP = ipoint_start + iP_chunk
+                print(f' {iP+1}',end='')
+                
+                datablock_xr_onepoint = ds_chunk.isel({dimn_point:iP_chunk})
+                plipoint_name = str(datablock_xr_onepoint[varn_pointname].to_numpy())
+                plipoint_onlynan = False
+                for quan in quantity_list:
+                    datablock_xr_onepoint[quan].attrs['locationname'] = plipoint_name
+                    if datablock_xr_onepoint[quan].isnull().all(): # check if all values of plipoint are nan (on land)
+                        plipoint_onlynan = True
+                        logger.warning(f'Plipoint "{plipoint_name}" might be on land since it only contain nan values. '
+                                       'This point is skipped to avoid bc-writing errors. Consider altering your PolyFile or extrapolate the data.')
+                
+                # skip this point if quantity has only-nan values
+                if plipoint_onlynan:
+                    continue
+                
+                header_lines[iline_name] = f"{name_prefix}{plipoint_name}"
+                
+                # get datablock, corresponding to Dataset_to_T3D/Dataset_to_TimeSeries/Dataset_to_Astronomic
+                datablock_xr_onepoint = ds_chunk_filled.isel({dimn_point:iP_chunk})
+                if Dataset_to_forcing is Dataset_to_Astronomic:
+                    datablock_np_cna = datablock_xr_onepoint['compno'].to_numpy()[:,np.newaxis]
+                    datablock_np_amp = datablock_xr_onepoint['amplitude'].to_numpy()[:,np.newaxis]
+                    datablock_np_phs = datablock_xr_onepoint['phase_new'].to_numpy()[:,np.newaxis]
+                    datablock_incl = np.concatenate([datablock_np_cna,datablock_np_amp,datablock_np_phs],axis=1)
+                else:
+                    if Dataset_to_forcing is Dataset_to_T3D and len(quantity_list) == 2:
+                        data_xr_var0_np = datablock_xr_onepoint[quantity_list[0]].to_numpy()
+                        data_xr_var1_np = datablock_xr_onepoint[quantity_list[1]].to_numpy()
+                        datablock_np = np.stack((data_xr_var0_np,data_xr_var1_np),2).reshape(data_xr_var0_np.shape[0],-1) #merge data with alternating rows
+                    elif Dataset_to_forcing is Dataset_to_T3D:
+                        datablock_np = datablock_xr_onepoint[quantity_list[0]].to_numpy()
+                    else:
+                        datablock_np = datablock_xr_onepoint[quantity_list[0]].to_numpy()[:,np.newaxis]
+                    datablock_incl = np.concatenate([timevar_sel_rel[:,np.newaxis],datablock_np],axis=1)
+                if datablock_incl.dtype.kind == 'f' and np.isnan(datablock_incl).any():
+                    raise ValueError(f'NaN is not supported in datablocks, but present for plipoint "{plipoint_name}"')
+                
+                f.write("\n".join(header_lines) + "\n")
+                if len(datablock_incl) > 0:
+                    f.write(_format_datablock(datablock_incl) + "\n")
+                f.write("\n")
+    print(f'. >> done in {(dt.datetime.now()-dtstart).total_seconds():.2f} sec')
+    
+    ForcingModel_object = hcdfm.ForcingModel()
+    ForcingModel_object.filepath = Path(file_bc)
+    return ForcingModel_object
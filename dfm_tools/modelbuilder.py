@@ -45,12 +45,17 @@ def get_ncvarname(quantity, conversion_dict):
     return ncvarname
 
     
-def cmems_nc_to_bc(ext_bnd, list_quantities, tstart, tstop, file_pli, dir_pattern, dir_output, conversion_dict=None, refdate_str=None):
+def cmems_nc_to_bc(ext_bnd, list_quantities, tstart, tstop, file_pli, dir_pattern, dir_output, conversion_dict=None, refdate_str=None, weights_cache=None):
     #input examples in https://github.com/Deltares/dfm_tools/blob/main/tests/examples/preprocess_interpolate_nc_to_bc.py
     # TODO: rename ext_bnd to ext_new for consistency
     if conversion_dict is None:
         conversion_dict = dfmt.get_conversion_dict()
     
+    # read polyfile, the bbox of the points is used to subset the source data upon opening
+    polyfile_obj = hcdfm.PolyFile(file_pli)
+    gdf_points = dfmt.PolyFile_to_geodataframe_points(polyfile_object=polyfile_obj)
+    bbox = gdf_points.total_bounds
+    
     for quantity in list_quantities: # loop over salinitybnd/uxuyadvectionvelocitybnd/etc
         print(f'processing quantity: {quantity}')
         
@@ -68,23 +73,21 @@ def cmems_nc_to_bc(ext_bnd, list_quantities, tstart, tstop, file_pli, dir_patter
                                                   quantity=quantity_key,
                                                   tstart=tstart, tstop=tstop,
                                                   conversion_dict=conversion_dict,
-                                                  refdate_str=refdate_str)
+                                                  refdate_str=refdate_str,
+                                                  bbox=bbox)
             if quantity_key == quantity_list[0]:
                 data_xr_vars = data_xr_onevar
             else: # only relevant in case of ux/uy, others all have only one quantity
                 data_xr_vars[quantity_key] = data_xr_onevar[quantity_key]
         
         # interpolate regulargridDataset to plipointsDataset
-        polyfile_obj = hcdfm.PolyFile(file_pli)
-        gdf_points = dfmt.PolyFile_to_geodataframe_points(polyfile_object=polyfile_obj)
-        data_interp = dfmt.interp_regularnc_to_plipointsDataset(data_xr_reg=data_xr_vars, gdf_points=gdf_points, load=True)
+        data_interp = dfmt.interp_regularnc_to_plipointsDataset(data_xr_reg=data_xr_vars, gdf_points=gdf_points, load=True, weights_cache=weights_cache)
         
-        #convert plipointsDataset to hydrolib ForcingModel
-        ForcingModel_object = dfmt.plipointsDataset_to_ForcingModel(plipointsDataset=data_interp)
+        # write plipointsDataset to bc file
+        file_bc_out = os.path.join(dir_output,f'{quantity}_CMEMS.bc')
+        ForcingModel_object = dfmt.plipointsDataset_to_bc(plipointsDataset=data_interp, file_bc=file_bc_out)
         
         # generate boundary object for the ext file (quantity, pli-filename, bc-filename)
-        file_bc_out = os.path.join(dir_output,f'{quantity}_CMEMS.bc')
-        ForcingModel_object.save(filepath=file_bc_out)
         boundary_object = hcdfm.Boundary(quantity=quantity,
                                          locationfile=file_pli, #placeholder, will be replaced later on
                                          forcingfile=ForcingModel_object)
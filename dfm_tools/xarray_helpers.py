@@ -15,11 +15,108 @@ __all__ = [
     "preprocess_woa",
     "merge_meteofiles",
     "Dataset_varswithdim",
+    "get_chunks",
 ]
 
 logger = logging.getLogger(__name__)
 
 
+CHUNKS_ACCESS_PATTERNS = ["map snapshot", "time series", "time reduction"]
+
+
+def get_chunks(file_nc, access_pattern:str = "map snapshot", target_mb:float = 100, time_dim:str = "time") -> dict:
+    """
+    Derive chunks for xr.open_dataset() from the dimension sizes and dtypes in the (first) file, 
+    such that chunks of the time-dependent variables are approximately target_mb or smaller.
+    Only the time dimension and the largest other dimension of each variable (often the face 
+    or edge dimension) are chunked, all other dimensions (like layers) are kept as one chunk.
+
+    Parameters
+    ----------
+    file_nc : str, list or xr.Dataset
+        filename, filepattern or list of files, only the first file is used. Can also be a (lazily loaded) xr.Dataset.
+    access_pattern : str, optional
+        The way the data will be accessed:
+        - "map snapshot": one timestep per chunk, for plotting or selecting individual timesteps.
+        - "time series": all timesteps in one chunk, for extracting timeseries at a few faces.
+        - "time reduction": as much timesteps per chunk as possible, for sum/mean/etc over time.
+        The default is "map snapshot".
+    target_mb : float, optional
+        Target size of the chunks in megabytes. The default is 100.
+    time_dim : str, optional
+        Name of the time dimension. The default is "time".
+
+    Returns
+    -------
+    chunks : dict
+        Chunks per dimension, to pass to xr.open_dataset() or one of the dfm_tools openers.
+
+    """
+    if access_pattern not in CHUNKS_ACCESS_PATTERNS:
+        raise ValueError(f'access_pattern should be one of {CHUNKS_ACCESS_PATTERNS}, received: "{access_pattern}"')
+    
+    if isinstance(file_nc, xr.Dataset):
+        ds = file_nc
+    else:
+        file_nc_one = file_to_list(file_nc)[0]
+        # opened lazily without dask, so only the header is read
+        ds = xr.open_dataset(file_nc_one, decode_times=False, chunks=None)
+    sizes = dict(ds.sizes)
+    # dims and itemsize of time-dependent variables
+    vars_time = [(ds.variables[varn].dims, ds.variables[varn].dtype.itemsize) for varn in ds.data_vars 
+                 if time_dim in ds.variables[varn].dims and ds.variables[varn].ndim > 1]
+    if not isinstance(file_nc, xr.Dataset):
+        ds.close()
+    
+    chunks = {dim:-1 for dim in sizes}
+    if len(vars_time) == 0:
+        # no time-dependent variables, so no chunking
+        return chunks
+    
+    ntimes = sizes[time_dim]
+    target_bytes = target_mb * 1024**2
+    def get_bytes_per_timestep(var_dims, itemsize):
+        return itemsize * np.prod([sizes[dim] for dim in var_dims if dim != time_dim])
+    
+    if access_pattern == "map snapshot":
+        time_chunk = 1
+    elif access_pattern == "time series":
+        time_chunk = ntimes
+    elif access_pattern == "time reduction":
+        bytes_per_timestep = max(get_bytes_per_timestep(*x) for x in vars_time)
+        time_chunk = int(np.clip(target_bytes // bytes_per_timestep, 1, ntimes))
+    # at least one timestep per chunk, also for files without timesteps (like at the start of a running simulation)
+    time_chunk = max(time_chunk, 1)
+    chunks[time_dim] = time_chunk
+    
+    if ntimes == 0:
+        # no timesteps, so the chunksize of the other dimensions cannot be derived
+        logger.info(f'chunks for "{access_pattern}" for file without timesteps: {chunks}')
+        return chunks
+    
+    # chunk the largest other dimension of each variable, the smallest chunksize is used for shared dimensions
+    for var_dims, itemsize in vars_time:
+        other_dims = [dim for dim in var_dims if dim != time_dim]
+        split_dim = max(other_dims, key=sizes.get)
+        bytes_per_split_elem = get_bytes_per_timestep(var_dims, itemsize) / sizes[split_dim]
+        split_chunk = int(np.clip(target_bytes // (bytes_per_split_elem * time_chunk), 1, sizes[split_dim]))
+        if chunks[split_dim] == -1 or split_chunk < chunks[split_dim]:
+            chunks[split_dim] = split_chunk
+    logger.info(f'chunks for "{access_pattern}" with target of {target_mb} MB: {chunks}')
+    return chunks
+
+
+def get_chunks_kwargs(file_nc, kwargs:dict) -> dict:
+    """
+    Used by the dfm_tools openers to set chunks in kwargs with get_chunks(). This is done 
+    if chunks is not provided (access_pattern "map snapshot") or if chunks is one of the access patterns.
+    """
+    chunks = kwargs.get("chunks", "map snapshot")
+    if isinstance(chunks, str) and chunks in CHUNKS_ACCESS_PATTERNS:
+        kwargs["chunks"] = get_chunks(file_nc, access_pattern=chunks)
+    return kwargs
+
+
 def file_to_list(file_nc):
     if isinstance(file_nc,list):
         file_nc_list = file_nc
@@ -39,6 +136,44 @@ def file_to_list(file_nc):
     return file_nc_list
 
 
+def get_hisnc_index(ds):
+    """
+    Get the decoded station/gs/crs/laterals labels per dimension and a boolean of the duplicate labels, 
+    to be used by apply_hisnc_index(). This is separate from preprocess_hisnc(), so the labels can 
+    be reused for multiple datasets from the same hisfile.
+    """
+    #generate dim_coord_dict to set indexes, this will be something like {'stations':'station_name','cross_section':'cross_section_name'} after loop
+    dim_coord_dict = {}
+    for ds_coord in ds.coords.keys():
+        ds_coord_dtype = ds[ds_coord].dtype
+        ds_coord_dim = ds[ds_coord].dims[0] #these vars always have only one dim
+        if ds_coord_dtype.str.startswith('|S'): #these are station/crs/laterals/gs names/ids
+            dim_coord_dict[ds_coord_dim] = ds_coord
+    
+    his_index = {}
+    for dim, coord in dim_coord_dict.items():
+        labels = ds[coord].load().str.decode('utf-8',errors='ignore').str.strip() #.load() is essential to convert not only first letter of string.
+        duplicated_keepfirst = labels.to_series().duplicated(keep='first').to_numpy()
+        his_index[dim] = (coord, labels.variable, duplicated_keepfirst)
+    return his_index
+
+
+def apply_hisnc_index(ds, his_index):
+    """
+    Set the labels from get_hisnc_index() as index and drop the duplicates.
+    """
+    #loop over dimensions and set corresponding coordinates/variables as their index
+    for dim, (coord, labels, duplicated_keepfirst) in his_index.items():
+        ds[coord] = labels
+        ds = ds.set_index({dim:coord})
+        
+        #drop duplicate indices (stations/crs/gs), this avoids "InvalidIndexError: Reindexing only valid with uniquely valued Index objects"
+        if duplicated_keepfirst.sum()>0:
+            print(f'dropping {duplicated_keepfirst.sum()} duplicate "{coord}" labels to avoid InvalidIndexError')
+            ds = ds[{dim:~duplicated_keepfirst}]
+    return ds
+
+
 def preprocess_hisnc(ds):
     """
     Look for dim/coord combination and use this for Dataset.set_index(), to enable station/gs/crs/laterals label based indexing. If duplicate labels are found (like duplicate stations), these are dropped to avoid indexing issues.
@@ -57,25 +192,8 @@ def preprocess_hisnc(ds):
 
     """
     
-    #generate dim_coord_dict to set indexes, this will be something like {'stations':'station_name','cross_section':'cross_section_name'} after loop
-    dim_coord_dict = {}
-    for ds_coord in ds.coords.keys():
-        ds_coord_dtype = ds[ds_coord].dtype
-        ds_coord_dim = ds[ds_coord].dims[0] #these vars always have only one dim
-        if ds_coord_dtype.str.startswith('|S'): #these are station/crs/laterals/gs names/ids
-            dim_coord_dict[ds_coord_dim] = ds_coord
-    
-    #loop over dimensions and set corresponding coordinates/variables from dim_coord_dict as their index
-    for dim in dim_coord_dict.keys():
-        coord = dim_coord_dict[dim]
-        ds[coord] = ds[coord].load().str.decode('utf-8',errors='ignore').str.strip() #.load() is essential to convert not only first letter of string.
-        ds = ds.set_index({dim:coord})
-        
-        #drop duplicate indices (stations/crs/gs), this avoids "InvalidIndexError: Reindexing only valid with uniquely valued Index objects"
-        duplicated_keepfirst = ds[dim].to_series().duplicated(keep='first')
-        if duplicated_keepfirst.sum()>0:
-            print(f'dropping {duplicated_keepfirst.sum()} duplicate "{coord}" labels to avoid InvalidIndexError')
-            ds = ds[{dim:~duplicated_keepfirst}]
+    his_index = get_hisnc_index(ds)
+    ds = apply_hisnc_index(ds, his_index)
 
     #check dflowfm version/date and potentially raise warning about incorrect layers
     try:
@@ -5,12 +5,29 @@ import xarray as xr
 import datetime as dt
 import pandas as pd
 import meshkernel
-from dfm_tools.xarray_helpers import file_to_list
+from dfm_tools.xarray_helpers import (file_to_list, get_chunks_kwargs, get_chunks,
+                                      get_hisnc_index, apply_hisnc_index)
+import netCDF4
 from netCDF4 import default_fillvals
 import warnings
+import logging
+import functools
+import concurrent.futures
+import hashlib
+import json
+import dask
+import dask.array
+import base64
+import zlib
+from xarray.backends.locks import HDF5_LOCK, NETCDFC_LOCK, combine_locks
 
 __all__ = [
     "open_partitioned_dataset",
+    "GhostcellIndex",
+    "AssociatedEdgeIndex",
+    "mapfiles_to_zarr",
+    "mapfiles_to_reference",
+    "OutputFollower",
     "open_dataset_curvilinear",
     "open_dataset_delft3d4",
     "uda_to_faces",
@@ -19,6 +36,10 @@ __all__ = [
     "enrich_rst_with_map",
 ]
 
+logger = logging.getLogger(__name__)
+
+NETCDF4_LOCK = combine_locks([NETCDFC_LOCK, HDF5_LOCK])
+
 
 def get_vertical_dimensions(uds): #TODO: maybe add layer_dimension and interface_dimension properties to xugrid?
     """
@@ -45,12 +66,19 @@ def get_vertical_dimensions(uds): #TODO: maybe add layer_dimension and interface
         return None, None
 
 
-def remove_ghostcells(uds, fname): #TODO: remove ghostcells from output or align values between (non)ghost cells: https://issuetracker.deltares.nl/browse/UNST-6701
+def remove_ghostcells(uds, fname, ghostcell_index=None): #TODO: remove ghostcells from output or align values between (non)ghost cells: https://issuetracker.deltares.nl/browse/UNST-6701
     """
     Dropping ghostcells if there is a domainno variable present and there is a domainno in the filename.
     Not using most-occurring domainno in var, since this is not a valid assumption for merged datasets and might be invalid for a very small partition.
+    If a GhostcellIndex is provided that contains fname, the precomputed owned-face index is used instead.
     
     """
+    if ghostcell_index is not None:
+        idx = ghostcell_index.get(fname)
+        if idx is not None:
+            uds = uds.isel({uds.grid.face_dimension:idx})
+            return uds
+    
     gridname = uds.grid.name
     varn_domain = f'{gridname}_flowelem_domain'
     
@@ -60,78 +88,355 @@ def remove_ghostcells(uds, fname): #TODO: remove ghostcells from output or align
         return uds
     
     #derive domainno from filename, return uds if not present
-    if '_' not in fname: #safety escape in case there is no _ in the filename
-        print('[nodomainfname] ',end='')
-        return uds
-    fname_splitted = fname.split('_')
-    part_domainno_fromfname = fname_splitted[-2] #this is not valid for rstfiles (date follows after partnumber), but they cannot be read with xugrid anyway since they lack topology and node_x/node_y variables: https://issuetracker.deltares.nl/browse/UNST-7176
-    if not part_domainno_fromfname.isnumeric() or len(part_domainno_fromfname)!=4:
+    part_domainno_fromfname = get_partition_domainno(fname)
+    if part_domainno_fromfname is None:
         print('[nodomainfname] ',end='')
         return uds
     
     #drop ghostcells
-    part_domainno_fromfname = int(part_domainno_fromfname)
     da_domainno = uds.variables[varn_domain]
     idx = np.flatnonzero(da_domainno == part_domainno_fromfname)
     uds = uds.isel({uds.grid.face_dimension:idx})
     return uds
 
 
-def remove_unassociated_edges(ds: xr.Dataset) -> xr.Dataset:
+def get_partition_domainno(fname):
+    """
+    derive domainno from partition filename, returns None if not present
+    """
+    fname = os.path.basename(fname)
+    if '_' not in fname: #safety escape in case there is no _ in the filename
+        return None
+    part_domainno_fromfname = fname.split('_')[-2] #this is not valid for rstfiles (date follows after partnumber), but they cannot be read with xugrid anyway since they lack topology and node_x/node_y variables: https://issuetracker.deltares.nl/browse/UNST-7176
+    if not part_domainno_fromfname.isnumeric() or len(part_domainno_fromfname)!=4:
+        return None
+    return int(part_domainno_fromfname)
+
+
+def read_flowelem_domain(file_nc_one):
+    """
+    read the {gridname}_flowelem_domain variable of a 2D topology directly with netCDF4,
+    this is much faster than opening the file with xarray. Returns None if not present.
+    """
+    with netCDF4.Dataset(file_nc_one) as nc:
+        for varn, ncvar in nc.variables.items():
+            if getattr(ncvar, "cf_role", None) != "mesh_topology":
+                continue
+            if getattr(ncvar, "topology_dimension", None) != 2:
+                continue
+            varn_domain = f'{varn}_flowelem_domain'
+            if varn_domain not in nc.variables:
+                return None
+            ncvar_domain = nc.variables[varn_domain]
+            ncvar_domain.set_auto_mask(False)
+            return ncvar_domain[:]
+    return None
+
+
+class PartitionIndex:
+    """
+    Base class for per-partition indexes along a ugrid dimension, which are derived once for all partitions
+    and can be stored in (and restored from) a xr.Dataset. The indexes of all partitions are concatenated 
+    in the dataset, the amount of indexes per partition is stored alongside (-1 for None).
+    The variable names in the dataset are defined by the subclasses.
+    """
+    varn_index = None
+    varn_count = None
+    varn_file = None
+    
+    def __init__(self, file_nc_list:list, indexes:list):
+        if len(file_nc_list) != len(indexes):
+            raise ValueError(f'length of file_nc_list ({len(file_nc_list)}) and indexes ({len(indexes)}) should be equal')
+        self.file_nc_list = list(file_nc_list)
+        self.indexes = list(indexes)
+    
+    def __len__(self):
+        return len(self.indexes)
+    
+    def __getitem__(self, key):
+        """
+        get index by partition number or by filename
+        """
+        if isinstance(key, (str, os.PathLike)):
+            key = self._get_position(key)
+        return self.indexes[key]
+    
+    def _get_position(self, fname):
+        basenames = [os.path.basename(x) for x in self.file_nc_list]
+        return basenames.index(os.path.basename(fname))
+    
+    def get(self, fname, default=None):
+        """
+        get index by filename, returns default if fname is not in the index
+        """
+        try:
+            return self[fname]
+        except ValueError:
+            return default
+    
+    def to_dataset(self) -> xr.Dataset:
+        """
+        convert to xr.Dataset with concatenated indexes and the amount of indexes per partition (-1 for None)
+        """
+        counts = [-1 if idx is None else len(idx) for idx in self.indexes]
+        indexes_valid = [idx for idx in self.indexes if idx is not None] + [np.array([], dtype=int)]
+        ds = xr.Dataset()
+        ds[self.varn_index] = xr.DataArray(np.concatenate(indexes_valid), dims=self.varn_index)
+        ds[self.varn_count] = xr.DataArray(counts, dims="partition")
+        ds[self.varn_file] = xr.DataArray([os.path.basename(x) for x in self.file_nc_list], dims="partition")
+        return ds
+    
+    @classmethod
+    def from_dataset(cls, ds:xr.Dataset, file_nc_list:list = None):
+        """
+        restore from a xr.Dataset created with to_dataset(), optionally with full paths in file_nc_list
+        """
+        if file_nc_list is None:
+            file_nc_list = ds[cls.varn_file].to_numpy().tolist()
+        counts = ds[cls.varn_count].to_numpy()
+        index = ds[cls.varn_index].to_numpy()
+        sections = np.cumsum(counts.clip(min=0))[:-1]
+        indexes = np.split(index, sections)
+        indexes = [None if count==-1 else idx for idx, count in zip(indexes, counts)]
+        return cls(file_nc_list, indexes)
+
+
+class GhostcellIndex(PartitionIndex):
+    """
+    Owned-face (non-ghostcell) indexes for all partitions of a D-Flow FM model, for instance to
+    remove ghostcells with `dfmt.open_partitioned_dataset()`. The domain variables of all partitions 
+    are read in one pass and the indexes are derived with a single vectorised comparison. 
+    The indexes can be reused and stored in (and restored from) a xr.Dataset, this is done
+    in the topology cache of `dfmt.open_partitioned_dataset()`.
+    
+    Partitions without domain variable or without domain number in the filename get None as index.
+    """
+    varn_index = "ghostcell_owned_index"
+    varn_count = "ghostcell_owned_count"
+    varn_file = "ghostcell_partition_file"
+    
+    @classmethod
+    def from_files(cls, file_nc_list:list):
+        """
+        read the domain variables of all partitions and derive the owned faces for each partition
+        """
+        domains = [read_flowelem_domain(x) for x in file_nc_list]
+        domainnos = [get_partition_domainno(x) for x in file_nc_list]
+        valid = [(dom is not None) and (no is not None) for dom, no in zip(domains, domainnos)]
+        
+        indexes = [None] * len(file_nc_list)
+        if not any(valid):
+            return cls(file_nc_list, indexes)
+        
+        # concatenate all domain arrays and compare with the repeated partition domainno in one go
+        domains_valid = [dom for dom, val in zip(domains, valid) if val]
+        domainnos_valid = np.array([no for no, val in zip(domainnos, valid) if val])
+        sizes = np.array([len(dom) for dom in domains_valid])
+        offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        partition_id = np.repeat(np.arange(len(domains_valid)), sizes)
+        owned = np.concatenate(domains_valid) == domainnos_valid[partition_id]
+        
+        # convert to local face numbers and split per partition
+        owned_global = np.flatnonzero(owned)
+        owned_local = owned_global - offsets[partition_id[owned_global]]
+        sections = np.cumsum(np.bincount(partition_id[owned_global], minlength=len(domains_valid)))[:-1]
+        indexes_valid = iter(np.split(owned_local, sections))
+        for i, val in enumerate(valid):
+            if val:
+                indexes[i] = next(indexes_valid)
+        return cls(file_nc_list, indexes)
+
+
+def get_topology_varn_2d(variables) -> str:
+    """
+    get the name of the 2D mesh topology variable from the variables of a xr.Dataset or netCDF4.Dataset, 
+    returns None if not present.
+    """
+    for varn, var in variables.items():
+        attrs = var.attrs if hasattr(var, "attrs") else var.__dict__
+        if attrs.get("cf_role", None) != "mesh_topology":
+            continue
+        if attrs.get("topology_dimension", None) != 2:
+            continue
+        return varn
+    return None
+
+
+def connectivity_to_numpy(values:np.ndarray, fill_value=None, start_index:int = 0) -> np.ndarray:
+    """
+    convert raw or decoded connectivity values to a zero-based integer array with -1 as fill value.
+    Decoded connectivities are floats with nan as fill value.
+    """
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.floating):
+        isfill = np.isnan(values)
+    else:
+        isfill = values < start_index
+        if fill_value is not None:
+            isfill |= values == fill_value
+    connectivity = np.where(isfill, 0, values).astype(np.int64) - start_index
+    connectivity[isfill] = -1
+    return connectivity
+
+
+def get_associated_edges(face_node_connectivity:np.ndarray, edge_node_connectivity:np.ndarray) -> np.ndarray:
+    """
+    Vectorised equivalent of xu.Ugrid2d.validate_edge_node_connectivity(), derived from the zero-based
+    connectivity arrays (with -1 as fill value) without constructing a grid. An edge is associated if it is 
+    part of a face and it is not a duplicate of a previous edge. Returns a boolean mask for all edges.
+    """
+    face_node_connectivity = np.asarray(face_node_connectivity)
+    edge_node_connectivity = np.asarray(edge_node_connectivity)
+    nnodes = max(face_node_connectivity.max(), edge_node_connectivity.max()) + 1
+    
+    # close the polygons: each valid node is connected to the next valid node or to the first node
+    nfaces, nmax = face_node_connectivity.shape
+    isvalid = face_node_connectivity != -1
+    nnodes_per_face = isvalid.sum(axis=1)
+    column = np.arange(nmax)
+    column_next = np.where(column + 1 < nnodes_per_face[:, np.newaxis], column + 1, 0)
+    node_next = np.take_along_axis(face_node_connectivity, column_next, axis=1)
+    face_node_a = face_node_connectivity[isvalid]
+    face_node_b = node_next[isvalid]
+    
+    # unique key per undirected edge, invalid edges (same node to same node) are dropped
+    face_edge_keys = (np.minimum(face_node_a, face_node_b) * nnodes + np.maximum(face_node_a, face_node_b))
+    face_edge_keys = face_edge_keys[face_node_a != face_node_b]
+    edge_keys = (edge_node_connectivity.min(axis=1).astype(np.int64) * nnodes + 
+                 edge_node_connectivity.max(axis=1))
+    
+    # first occurrence of each edge, the duplicates are not associated
+    _, index_first = np.unique(edge_keys, return_index=True)
+    isfirst = np.zeros(len(edge_keys), dtype=bool)
+    isfirst[index_first] = True
+    associated = np.isin(edge_keys, face_edge_keys) & isfirst
+    return associated
+
+
+def read_associated_edges(file_nc_one:str) -> np.ndarray:
+    """
+    read the face_node and edge_node connectivities of a 2D topology directly with netCDF4 and derive 
+    the indexes of the associated edges with get_associated_edges(). This is much faster than opening 
+    the file with xarray. Returns None if there is no 2D topology with edges.
+    """
+    with netCDF4.Dataset(file_nc_one) as nc:
+        varn_topo = get_topology_varn_2d(nc.variables)
+        if varn_topo is None:
+            return None
+        ncvar_topo = nc.variables[varn_topo]
+        connectivities = []
+        for attr in ["face_node_connectivity", "edge_node_connectivity"]:
+            varn_conn = getattr(ncvar_topo, attr, None)
+            if varn_conn not in nc.variables:
+                return None
+            ncvar_conn = nc.variables[varn_conn]
+            ncvar_conn.set_auto_maskandscale(False)
+            fill_value = getattr(ncvar_conn, "_FillValue", default_fillvals.get(ncvar_conn.dtype.str[1:]))
+            start_index = getattr(ncvar_conn, "start_index", 0)
+            connectivities.append(connectivity_to_numpy(ncvar_conn[:], fill_value=fill_value, start_index=start_index))
+    associated = get_associated_edges(*connectivities)
+    return np.flatnonzero(associated)
+
+
+def remove_unassociated_edges(ds: xr.Dataset, associated_index:np.ndarray = None) -> xr.Dataset:
     """
     Removes edges that are not associated to any of the faces, usecase in https://github.com/Deltares/xugrid/issues/68
+    The associated edges are derived from the connectivity arrays with get_associated_edges(), 
+    so no xu.UgridDataset has to be constructed.
 
     Parameters
     ----------
     ds : xr.Dataset
-        DESCRIPTION.
-    topology : str, optional
-        DESCRIPTION. The default is None.
+        dataset with a 2D ugrid topology, other datasets (like 1D networks) are returned as is.
+    associated_index : np.ndarray, optional
+        precomputed indexes of the associated edges, for instance from dfmt.AssociatedEdgeIndex. 
+        The default is None, in that case the associated edges are derived from the connectivities in ds.
 
     Returns
     -------
     ds : xr.Dataset
-        DESCRIPTION.
+        dataset without the unassociated edges.
 
     """
     
-    uds = xu.core.wrap.UgridDataset(ds)
-    
     # escape for 1D networks
-    if isinstance(uds.grid,xu.Ugrid1d):
+    varn_topo = get_topology_varn_2d(ds.variables)
+    if varn_topo is None:
         return ds
     
-    associated = uds.grid.validate_edge_node_connectivity()
-    edge_dimension = uds.grid.edge_dimension
-    
-    if not associated.all():
-         print(f"[{(~associated).sum()} unassociated edges removed] ",end='')
-         ds = ds.sel({edge_dimension: associated})
+    topo_attrs = ds[varn_topo].attrs
+    varn_fnc = topo_attrs.get("face_node_connectivity")
+    varn_enc = topo_attrs.get("edge_node_connectivity")
+    if varn_fnc not in ds.variables or varn_enc not in ds.variables:
+        return ds
+    edge_dimension = topo_attrs.get("edge_dimension", ds[varn_enc].dims[0])
+    
+    if associated_index is None:
+        connectivities = []
+        for varn_conn in [varn_fnc, varn_enc]:
+            da_conn = ds[varn_conn]
+            fill_value = da_conn.encoding.get("_FillValue", da_conn.attrs.get("_FillValue"))
+            start_index = da_conn.attrs.get("start_index", 0)
+            connectivities.append(connectivity_to_numpy(da_conn.to_numpy(), fill_value=fill_value, start_index=start_index))
+        associated_index = np.flatnonzero(get_associated_edges(*connectivities))
+    
+    nunassociated = ds.sizes[edge_dimension] - len(associated_index)
+    if nunassociated > 0:
+         print(f"[{nunassociated} unassociated edges removed] ",end='')
+         ds = ds.isel({edge_dimension: associated_index})
     return ds
 
 
+class AssociatedEdgeIndex(PartitionIndex):
+    """
+    Indexes of the edges that are associated to faces for all partitions of a D-Flow FM model, for instance to
+    remove unassociated (hanging) edges with `dfmt.open_partitioned_dataset()`. The connectivities are read 
+    directly with netCDF4 and the associated edges are derived with vectorised numpy operations. 
+    The indexes can be reused and stored in (and restored from) a xr.Dataset, this is done
+    in the topology cache of `dfmt.open_partitioned_dataset()`.
+    
+    Partitions without 2D topology or without edges get None as index.
+    """
+    varn_index = "edge_associated_index"
+    varn_count = "edge_associated_count"
+    varn_file = "edge_partition_file"
+    
+    @classmethod
+    def from_files(cls, file_nc_list:list):
+        """
+        read the connectivities of all partitions and derive the associated edges for each partition
+        """
+        indexes = [read_associated_edges(x) for x in file_nc_list]
+        return cls(file_nc_list, indexes)
+
+
 def decode_default_fillvals(ds):
     """
     xarray only supports explicitly set _FillValue attrs, and therefore ignores the default netCDF4 fillvalue
-    This function adds the default fillvalue as _FillValue attribute and decodes the dataset again.
+    This function adds the default fillvalue as _FillValue attribute and decodes only these variables again.
+    The other variables are not touched, so their lazy arrays are not rebuilt.
     """
     # TODO: this function can be removed when xarray does it automatically: https://github.com/Deltares/dfm_tools/issues/490
     
-    nfillattrs_added = 0
-    for varn in ds.variables.keys():
+    variables_decoded = {}
+    for varn, var in ds.variables.items():
         # TODO: possible to get always_mask boolean with `netCDF4.Dataset(file_nc).variables[varn].always_mask`, but this seems to be always True for FM mapfiles
-        if '_FillValue' in ds.variables[varn].encoding:
+        if '_FillValue' in var.encoding:
             continue
-        dtype_str = ds.variables[varn].dtype.str[1:]
+        dtype_str = var.dtype.str[1:]
         if dtype_str not in default_fillvals.keys():
             continue
-        varn_fillval = default_fillvals[dtype_str]
-        ds[varn] = ds[varn].assign_attrs({'_FillValue':varn_fillval})
-        nfillattrs_added += 1
-    print(f'[default_fillvals decoded for {nfillattrs_added} variables] ',end='')
-    
-    #decode the dataset with newly added _FillValue attrs again
-    ds = xr.decode_cf(ds)
+        var_fillval = var.copy(deep=False)
+        var_fillval.attrs = {**var.attrs, '_FillValue':default_fillvals[dtype_str]}
+        var_decoded = xr.conventions.decode_cf_variable(varn, var_fillval)
+        var_decoded.encoding = {**var.encoding, **var_decoded.encoding}
+        variables_decoded[varn] = var_decoded
+    print(f'[default_fillvals decoded for {len(variables_decoded)} variables] ',end='')
+    
+    #replace only the variables with newly added _FillValue attrs
+    ds = ds.copy()
+    for varn, var in variables_decoded.items():
+        ds[varn] = var
     return ds
 
 
@@ -171,7 +476,758 @@ def uds_auto_set_crs(uds : xu.UgridDataset):
         return
 
 
-def open_partitioned_dataset(file_nc:str, decode_fillvals:bool = False, remove_edges:bool = False, remove_ghost:bool = True, **kwargs): 
+def open_one_partition(file_nc_one:str, decode_fillvals:bool = False, remove_edges:bool = False, remove_ghost:bool = True, 
+                       ghostcell_index:GhostcellIndex = None, edge_index:AssociatedEdgeIndex = None, 
+                       time_slice:slice = None, add_source_index:bool = False, **kwargs):
+    """
+    Open and prepare a single partition for merging with xu.merge_partitions().
+    This is a separate function so it can be submitted to a thread pool
+    by open_partitioned_dataset(). Returns the UgridDataset and the time it took in seconds.
+    With add_source_index=True, source_index_{dim} variables with the original positions
+    along the ugrid dimensions are added, these are used by mapfiles_to_reference().
+    """
+    dtstart = dt.datetime.now()
+    ds = xr.open_mfdataset(file_nc_one, **kwargs)
+    ds_close = ds.close
+    if add_source_index:
+        for grid in xu.UgridDataset(ds).grids:
+            for dim, size in grid.sizes.items():
+                ds[f"source_index_{dim}"] = xr.DataArray(np.arange(size), dims=dim)
+    if time_slice is not None and 'time' in ds.dims:
+        ds = ds.sel(time=time_slice)
+        # cull the dask graph, so it only contains the chunks within time_slice
+        (ds,) = dask.optimize(ds)
+    if decode_fillvals:
+        ds = decode_default_fillvals(ds)
+    if remove_edges:
+        associated_index = None if edge_index is None else edge_index.get(file_nc_one)
+        ds = remove_unassociated_edges(ds, associated_index=associated_index)
+    if 'nFlowElem' in ds.dims and 'nNetElem' in ds.dims:
+        print('[mapformat1] ',end='')
+        #for mapformat1 mapfiles: merge different face dimensions (rename nFlowElem to nNetElem) to make sure the dataset topology is correct
+        ds = ds.rename({'nFlowElem':'nNetElem'})
+    remove_nan_fillvalue_attrs(ds)
+    uds = xu.core.wrap.UgridDataset(ds)
+    if remove_ghost: #TODO: this makes it way slower (at least for GTSM, although merging seems faster), but is necessary since values on overlapping cells are not always identical (eg in case of Venice ucmag)
+        uds = remove_ghostcells(uds, file_nc_one, ghostcell_index=ghostcell_index)
+    uds_auto_set_crs(uds)
+    # closing the prepared dataset also closes the file
+    uds.obj.set_close(ds_close)
+    time_passed = (dt.datetime.now()-dtstart).total_seconds()
+    return uds, time_passed
+
+
+def open_partitions_parallel(file_nc_list:list, parallel:(bool,str) = True, max_workers:int = None, **kwargs):
+    """
+    Open and prepare partitions with open_one_partition() in a thread pool.
+    The results are returned in the order of file_nc_list.
+    """
+    if parallel not in [True, "thread"]:
+        raise ValueError(f'parallel should be True/False or "thread", received: {parallel}')
+    
+    func = functools.partial(open_one_partition, **kwargs)
+    print('[thread pool] ',end='')
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = []
+        # executor.map() preserves the order of file_nc_list
+        for iF, result in enumerate(executor.map(func, file_nc_list)):
+            print(iF+1,end=' ')
+            results.append(result)
+    return results
+
+
+def get_drop_variables(file_nc_one:str, variables:list, remove_ghost:bool = True) -> list:
+    """
+    Get the variables to drop upon opening, such that only the requested variables are read. 
+    The topology variables, the crs variables, the dimension variables and the coordinates/bounds
+    of the requested variables are always kept, as is the domain variable if remove_ghost=True. 
+    The variables are derived from the netcdf header of one partition, which is fast.
+    """
+    if isinstance(variables, str):
+        variables = [variables]
+    with netCDF4.Dataset(file_nc_one) as nc:
+        nc_vars = nc.variables
+        varns_missing = [varn for varn in variables if varn not in nc_vars]
+        if varns_missing:
+            raise KeyError(f'requested variables not present in {os.path.basename(file_nc_one)}: {varns_missing}')
+        
+        def get_varns_from_attrs(ncvar):
+            # topology and coordinates/bounds/grid_mapping attributes contain whitespace separated variable names
+            varns = []
+            for attr_value in ncvar.__dict__.values():
+                if not isinstance(attr_value, str):
+                    continue
+                varns.extend([x for x in attr_value.split() if x in nc_vars])
+            return varns
+        
+        varns_keep = set(variables)
+        for varn in variables:
+            varns_keep.update(get_varns_from_attrs(nc_vars[varn]))
+        for varn, ncvar in nc_vars.items():
+            if varn in nc.dimensions:
+                varns_keep.add(varn)
+            ncvar_attrs = ncvar.ncattrs()
+            if 'epsg' in ncvar_attrs or 'grid_mapping_name' in ncvar_attrs:
+                varns_keep.add(varn)
+            if getattr(ncvar, 'cf_role', None) == 'mesh_topology':
+                varns_keep.add(varn)
+                varns_keep.update(get_varns_from_attrs(ncvar))
+                if remove_ghost:
+                    varns_keep.add(f'{varn}_flowelem_domain')
+        drop_variables = [varn for varn in nc_vars if varn not in varns_keep]
+    return drop_variables
+
+
+def get_partitions_cache_key(file_nc_list:list, **kwargs) -> str:
+    """
+    Hash of the absolute paths, sizes and modification times of the partitions, 
+    combined with options (kwargs) that influence the topology of the prepared partitions.
+    """
+    file_stats = []
+    for file_nc_one in file_nc_list:
+        file_stat = os.stat(file_nc_one)
+        file_stats.append([os.path.abspath(file_nc_one), file_stat.st_size, file_stat.st_mtime_ns])
+    key_dict = {"files":file_stats, "options":kwargs}
+    key_str = json.dumps(key_dict, sort_keys=True, default=str)
+    cache_key = hashlib.sha256(key_str.encode()).hexdigest()
+    return cache_key
+
+
+def get_topology_cache_file(file_nc_list:list, topology_cache:(bool,str) = True) -> str:
+    """
+    Get the filename of the merged topology cache. If topology_cache is a string it is used as filename,
+    otherwise the file is placed next to the partitions with the common part of the partition filenames
+    as prefix (e.g. Grevelingen-FM_0000_map.nc results in Grevelingen-FM_topology_cache.nc).
+    """
+    if isinstance(topology_cache, (str, os.PathLike)):
+        return str(topology_cache)
+    dir_output = os.path.dirname(os.path.abspath(file_nc_list[0]))
+    basenames = [os.path.basename(x) for x in file_nc_list]
+    prefix = os.path.commonprefix(basenames).rstrip("0123456789_")
+    if prefix == "":
+        prefix = "partitions"
+    file_cache = os.path.join(dir_output, f"{prefix}_topology_cache.nc")
+    return file_cache
+
+
+def read_topology_cache(file_cache:str, cache_key:str) -> xr.Dataset:
+    """
+    Read the topology cache file into memory. Returns None if it does not exist or 
+    if it was generated for other (or modified) partition files.
+    """
+    if not os.path.exists(file_cache):
+        return None
+    with xr.open_dataset(file_cache) as ds_cache:
+        if ds_cache.attrs.get("cache_key") != cache_key:
+            print('[topology cache outdated] ',end='')
+            return None
+        ds_cache = ds_cache.load()
+    return ds_cache
+
+
+def write_topology_cache(file_cache:str, cache_key:str, merged_grid, indexes:dict, partition_sizes:dict,
+                         ghostcell_index:GhostcellIndex = None, edge_index:AssociatedEdgeIndex = None):
+    """
+    Write the merged topology and the per-partition indexes to a netcdf file. The indexes of all partitions
+    are concatenated per ugrid dimension, the amount of indexes per partition is stored alongside.
+    The ghostcell index and associated edge index are also stored if provided.
+    Writing is skipped with a warning in case the directory is not writable.
+    """
+    ds_cache = merged_grid.to_dataset()
+    for partition_index in [ghostcell_index, edge_index]:
+        if partition_index is not None:
+            ds_cache = ds_cache.merge(partition_index.to_dataset())
+    for dim, dim_indexes in indexes.items():
+        ds_cache[f"{dim}_index"] = xr.DataArray(np.concatenate(dim_indexes), dims=f"{dim}_index")
+        ds_cache[f"{dim}_index_count"] = xr.DataArray([len(x) for x in dim_indexes], dims="partition")
+        ds_cache[f"{dim}_partition_size"] = xr.DataArray(partition_sizes[dim], dims="partition")
+    ds_cache.attrs["cache_key"] = cache_key
+    ds_cache.attrs["topology"] = merged_grid.name
+    ds_cache.attrs["source"] = "dfm_tools.open_partitioned_dataset()"
+    try:
+        ds_cache.to_netcdf(file_cache)
+    except (PermissionError, OSError) as e:
+        logger.warning(f'writing topology cache to "{file_cache}" failed, continuing without cache: {e}')
+
+
+def topology_cache_to_grid_indexes(ds_cache:xr.Dataset):
+    """
+    Convert the contents of the topology cache back to a xu.Ugrid2d and a dictionary 
+    with a list of indexes per partition for each ugrid dimension.
+    """
+    merged_grid = xu.Ugrid2d.from_dataset(ds_cache, topology=ds_cache.attrs["topology"])
+    indexes = {}
+    for dim in merged_grid.dims:
+        varn_index = f"{dim}_index"
+        if varn_index not in ds_cache.variables:
+            continue
+        dim_index = ds_cache[varn_index].to_numpy()
+        sections = np.cumsum(ds_cache[f"{dim}_index_count"].to_numpy())[:-1]
+        indexes[dim] = np.split(dim_index, sections)
+    return merged_grid, indexes
+
+
+def get_partition_sizes(partitions:list) -> dict:
+    grid = partitions[0].grid
+    partition_sizes = {}
+    for dim in grid.dims:
+        partition_sizes[dim] = [uds.grid.sizes[dim] for uds in partitions]
+    return partition_sizes
+
+
+def merge_partitions_with_indexes(partitions:list, merged_grid, indexes:dict) -> xu.UgridDataset:
+    """
+    Merge the data of the partitions with known (cached) topology indexes. This is
+    comparable to the data merging part of xu.merge_partitions(), but skips the merging of
+    the topologies. Variables are concatenated along their ugrid dimension, other 
+    variables are taken from the first partition. Variables with non-ugrid dimensions
+    that differ in size between the partitions are dropped, except for connectivity dimensions
+    like the max_face_nodes dimension, these are padded.
+    """
+    data_objects = [uds.obj for uds in partitions]
+    ugrid_dims = set(indexes.keys())
+    ds_first = data_objects[0]
+    # max_connectivity_sizes is not available in older xugrid versions
+    max_sizes = getattr(merged_grid, "max_connectivity_sizes", {})
+    
+    vars_by_dim = {dim:[] for dim in ugrid_dims}
+    other_vars = []
+    for varn, var in ds_first.variables.items():
+        if not all(varn in ds.variables for ds in data_objects):
+            continue
+        var_ugrid_dims = ugrid_dims.intersection(var.dims)
+        if len(var_ugrid_dims) > 1:
+            continue
+        elif len(var_ugrid_dims) == 0:
+            other_vars.append(varn)
+            continue
+        dim = var_ugrid_dims.pop()
+        shapes = set()
+        for ds in data_objects:
+            var_sizes = {k:v for k,v in ds.variables[varn].sizes.items() if k!=dim and k not in max_sizes}
+            shapes.add(tuple(var_sizes.items()))
+        if len(shapes) == 1:
+            vars_by_dim[dim].append(varn)
+    
+    merged = ds_first[other_vars]
+    # global attributes are not merged, in line with xu.merge_partitions()
+    merged.attrs = {}
+    for dim, dim_vars in vars_by_dim.items():
+        if len(dim_vars) == 0:
+            continue
+        to_merge = []
+        for ds, index in zip(data_objects, indexes[dim]):
+            selection = ds[dim_vars].isel({dim:index})
+            pad_width = {k:(0, max_sizes[k]-v) for k,v in selection.sizes.items() if k in max_sizes and v!=max_sizes[k]}
+            if pad_width:
+                selection = selection.pad(pad_width=pad_width)
+            to_merge.append(selection)
+        merged_dim = xr.concat(to_merge, dim=dim, data_vars="minimal", coords="minimal", compat="override")
+        # single chunk along ugrid dimension, otherwise the dask graph becomes complex
+        # this is skipped if the partitions were chunked along the ugrid dimension (e.g. for time series access)
+        partitions_chunked = any(len(ds_first[varn].chunksizes.get(dim, [])) > 1 for varn in dim_vars)
+        if not partitions_chunked:
+            merged_dim = merged_dim.chunk({dim:-1})
+        merged = merged.merge(merged_dim, compat="override", join="override")
+    
+    merged_grid.set_crs(partitions[0].grid.crs)
+    uds_merged = xu.UgridDataset(merged, grids=[merged_grid])
+    return uds_merged
+
+
+def merge_partitions_topology_cache(partitions:list, file_cache:str, cache_key:str, ds_cache:xr.Dataset = None, 
+                                    ghostcell_index:GhostcellIndex = None, 
+                                    edge_index:AssociatedEdgeIndex = None) -> xu.UgridDataset:
+    """
+    Merge partitions and use an on-disk cache for the merged topology and the per-partition indexes. 
+    The cache is keyed by the partition paths, sizes, modification times and the options that 
+    influence the partition topologies (see get_partitions_cache_key()), so it is regenerated if any of these change.
+    ds_cache is the already read cache (see read_topology_cache()), it is None if there is no valid cache.
+    """
+    if len(partitions[0].grids) != 1 or not isinstance(partitions[0].grid, xu.Ugrid2d):
+        print('[topology cache only supported for one Ugrid2d] ',end='')
+        return xu.merge_partitions(partitions)
+    
+    partition_sizes = get_partition_sizes(partitions)
+    
+    if ds_cache is not None:
+        merged_grid, indexes = topology_cache_to_grid_indexes(ds_cache)
+        for dim, sizes in partition_sizes.items():
+            if f"{dim}_partition_size" not in ds_cache.variables:
+                continue
+            if ds_cache[f"{dim}_partition_size"].to_numpy().tolist() != sizes:
+                print('[topology cache does not match partitions] ',end='')
+                ds_cache = None
+                break
+    
+    if ds_cache is None:
+        print('[writing topology cache] ',end='')
+        grids = [uds.grid for uds in partitions]
+        merged_grid, indexes = grids[0].merge_partitions(grids)
+        write_topology_cache(file_cache, cache_key=cache_key, merged_grid=merged_grid, 
+                             indexes=indexes, partition_sizes=partition_sizes,
+                             ghostcell_index=ghostcell_index, edge_index=edge_index)
+    else:
+        print('[using topology cache] ',end='')
+    
+    uds_merged = merge_partitions_with_indexes(partitions, merged_grid=merged_grid, indexes=indexes)
+    return uds_merged
+
+
+class NetCDF4VariableArray:
+    """
+    Lazy array for a variable in a netcdf file, to be wrapped with dask.array.from_array(). 
+    The raw data is read without masking and scaling, the file is only opened upon indexing.
+    """
+    def __init__(self, file_nc:str, varn:str, shape:tuple, dtype):
+        self.file_nc = file_nc
+        self.varn = varn
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+    
+    @property
+    def ndim(self):
+        return len(self.shape)
+    
+    def __getitem__(self, key):
+        # netCDF4/HDF5 are not threadsafe, so use the same locks as xarray
+        with NETCDF4_LOCK:
+            with netCDF4.Dataset(self.file_nc) as nc:
+                ncvar = nc.variables[self.varn]
+                ncvar.set_auto_maskandscale(False)
+                ncvar.set_auto_chartostring(False)
+                if self.ndim == 0:
+                    data = ncvar.getValue()
+                else:
+                    data = ncvar[key]
+        return np.asarray(data, dtype=self.dtype)
+
+
+def encode_reference_array(data:np.ndarray) -> dict:
+    data = np.asarray(data)
+    data_bytes = base64.b64encode(zlib.compress(data.tobytes(order="C"))).decode("ascii")
+    return {"dtype":data.dtype.str, "shape":list(data.shape), "zlib_base64":data_bytes}
+
+
+def decode_reference_array(data_dict:dict) -> np.ndarray:
+    data_bytes = zlib.decompress(base64.b64decode(data_dict["zlib_base64"]))
+    data = np.frombuffer(data_bytes, dtype=data_dict["dtype"]).reshape(tuple(data_dict["shape"]))
+    return data.copy()
+
+
+def encode_reference_attrs(attrs:dict) -> dict:
+    """
+    numpy attributes are stored including dtype, so the attributes are identical after decoding
+    """
+    attrs_enc = {}
+    for key, value in attrs.items():
+        if isinstance(value, (np.ndarray, np.generic)):
+            value = {"attr_values":np.asarray(value).tolist(), "dtype":np.asarray(value).dtype.str, "ndim":np.ndim(value)}
+        attrs_enc[key] = value
+    return attrs_enc
+
+
+def decode_reference_attrs(attrs_enc:dict) -> dict:
+    attrs = {}
+    for key, value in attrs_enc.items():
+        if isinstance(value, dict) and "attr_values" in value:
+            value_arr = np.array(value["attr_values"], dtype=value["dtype"])
+            value = value_arr if value["ndim"] > 0 else value_arr[()]
+        attrs[key] = value
+    return attrs
+
+
+def get_reference_variable(ncvar, dims:list, decode_fillvals:bool = False, ugrid_dim:str = None) -> dict:
+    """
+    metadata of a raw netcdf variable for a reference, the shape is derived from the files upon opening
+    """
+    attrs = {key:ncvar.getncattr(key) for key in ncvar.ncattrs()}
+    dtype_str = ncvar.dtype.str[1:]
+    if decode_fillvals and '_FillValue' not in attrs and dtype_str in default_fillvals.keys():
+        attrs['_FillValue'] = np.array(default_fillvals[dtype_str], dtype=ncvar.dtype)
+    var_ref = {"dims":list(dims), "dtype":ncvar.dtype.str, "ugrid_dim":ugrid_dim, 
+               "attrs":encode_reference_attrs(attrs)}
+    return var_ref
+
+
+def get_mapfiles_reference(file_nc_list:list, decode_fillvals:bool = False, 
+                           remove_edges:bool = True, remove_ghost:bool = True) -> dict:
+    """
+    Merge the partitions once and derive the reference (a dictionary) with the merged topology, the 
+    partition and original position of each merged face/edge and the metadata of the raw variables.
+    """
+    ghostcell_index = None
+    if remove_ghost:
+        ghostcell_index = GhostcellIndex.from_files(file_nc_list)
+    edge_index = None
+    if remove_edges:
+        edge_index = AssociatedEdgeIndex.from_files(file_nc_list)
+    
+    partitions = []
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=UserWarning)
+        for iP, file_nc_one in enumerate(file_nc_list):
+            print(iP+1,end=' ')
+            uds, _ = open_one_partition(file_nc_one, decode_fillvals=decode_fillvals, remove_edges=remove_edges, 
+                                        remove_ghost=remove_ghost, ghostcell_index=ghostcell_index, 
+                                        edge_index=edge_index, add_source_index=True)
+            for varn in uds.obj.data_vars:
+                if varn.startswith("source_index_"):
+                    dim = uds[varn].dims[0]
+                    uds[f"source_partition_{dim}"] = xr.DataArray(np.full(uds.sizes[dim], iP, dtype=np.int32), dims=dim)
+            partitions.append(uds)
+    if len(partitions) == 1:
+        uds_merged = partitions[0]
+    else:
+        uds_merged = xu.merge_partitions(partitions)
+    ds_merged = uds_merged.obj
+    grid = uds_merged.grid
+    ds_topology = grid.to_dataset()
+    
+    # positions of the merged faces/edges in the original partitions
+    ref_dims = {}
+    for varn in ds_merged.data_vars:
+        if not varn.startswith("source_index_"):
+            continue
+        dim = ds_merged[varn].dims[0]
+        ref_dims[dim] = {"partition":encode_reference_array(ds_merged[f"source_partition_{dim}"].to_numpy()),
+                         "index":encode_reference_array(ds_merged[varn].to_numpy())}
+    
+    # metadata of the raw variables in the first partition
+    rename_dims = {}
+    ref_vars = {}
+    varns_skipped = []
+    with netCDF4.Dataset(file_nc_list[0]) as nc:
+        if 'nFlowElem' in nc.dimensions and 'nNetElem' in nc.dimensions:
+            rename_dims = {'nFlowElem':'nNetElem'}
+        for varn in ds_merged.variables:
+            if varn.startswith("source_") or varn in ds_topology.variables:
+                continue
+            var_merged = ds_merged.variables[varn]
+            if varn not in nc.variables and var_merged.dims == (varn,):
+                # dimension coordinates generated by xugrid upon merging
+                ref_vars[varn] = {"dims":[varn], "dtype":var_merged.dtype.str, "ugrid_dim":None, 
+                                  "attrs":encode_reference_attrs(var_merged.attrs), "arange":var_merged.size}
+                continue
+            if varn not in nc.variables or nc.variables[varn].dtype == str:
+                varns_skipped.append(varn)
+                continue
+            ncvar = nc.variables[varn]
+            dims = [rename_dims.get(dim, dim) for dim in ncvar.dimensions]
+            ugrid_dims = [dim for dim in dims if dim in ref_dims]
+            sizes_raw = [len(nc.dimensions[dim]) for dim in ncvar.dimensions]
+            sizes_merged = [ds_merged.sizes[dim] for dim in dims]
+            sizes_equal = [s1==s2 for dim, s1, s2 in zip(dims, sizes_raw, sizes_merged) if dim not in ref_dims]
+            if list(ds_merged[varn].dims) != dims or len(ugrid_dims) > 1 or not all(sizes_equal):
+                varns_skipped.append(varn)
+                continue
+            ref_vars[varn] = get_reference_variable(ncvar, dims=dims, decode_fillvals=decode_fillvals,
+                                                    ugrid_dim=ugrid_dims[0] if ugrid_dims else None)
+    if varns_skipped:
+        print(f'[some variables not referenced: {varns_skipped}] ',end='')
+    
+    ref_topology = {}
+    for varn, var in ds_topology.variables.items():
+        ref_topology[varn] = {"dims":list(var.dims), "attrs":encode_reference_attrs(var.attrs),
+                              "data":encode_reference_array(var.to_numpy()), 
+                              "coordinate":varn in ds_topology.coords}
+    
+    reference = {"source":"dfm_tools.mapfiles_to_reference()",
+                 "files":list(file_nc_list),
+                 "cache_key":get_partitions_cache_key(file_nc_list, decode_fillvals=decode_fillvals, 
+                                                      remove_edges=remove_edges, remove_ghost=remove_ghost),
+                 "topology":grid.name,
+                 "crs":None if grid.crs is None else grid.crs.to_wkt(),
+                 "attrs":encode_reference_attrs(ds_merged.attrs),
+                 "grid":ref_topology,
+                 "dims":ref_dims,
+                 "variables":ref_vars,
+                 "coords":list(ds_merged.coords),
+                 }
+    # close the partitions, the data is read via the reference
+    for uds in partitions:
+        uds.obj.close()
+    return reference
+
+
+def mapfiles_to_reference(file_nc:str, file_ref:str, decode_fillvals:bool = False, 
+                          remove_edges:bool = True, remove_ghost:bool = True) -> str:
+    """
+    Create a small reference file (json) that maps the data in the partitions of a D-Flow FM mapfile
+    to one merged dataset, comparable to kerchunk. The merged topology and the positions of all 
+    (non-ghost) faces/edges in the original partitions are stored, the data itself is not copied.
+    The reference file can be opened with dfmt.open_partitioned_dataset(file_ref), which reads 
+    the data lazily from the partitions without opening them with xarray first.
+    
+    The partition filenames are stored relative to the reference file, so the reference file 
+    should be moved together with the partitions.
+
+    Parameters
+    ----------
+    file_nc : str
+        filename, filepattern or list of files of the partitioned mapfiles.
+    file_ref : str
+        filename of the json reference file.
+    decode_fillvals : bool, optional
+        see dfmt.open_partitioned_dataset(). The default is False.
+    remove_edges : bool, optional
+        see dfmt.open_partitioned_dataset(). The default is True.
+    remove_ghost : bool, optional
+        see dfmt.open_partitioned_dataset(). The default is True.
+
+    Returns
+    -------
+    file_ref : str
+        filename of the json reference file.
+
+    """
+    file_nc_list = file_to_list(file_nc)
+    print(f'>> dfmt.mapfiles_to_reference() with {len(file_nc_list)} partition(s): ',end='')
+    dtstart = dt.datetime.now()
+    reference = get_mapfiles_reference(file_nc_list, decode_fillvals=decode_fillvals, 
+                                       remove_edges=remove_edges, remove_ghost=remove_ghost)
+    dir_ref = os.path.dirname(os.path.abspath(file_ref))
+    reference["files"] = [os.path.relpath(os.path.abspath(x), dir_ref) for x in file_nc_list]
+    with open(file_ref, "w") as f:
+        json.dump(reference, f)
+    print(f': {(dt.datetime.now()-dtstart).total_seconds():.2f} sec')
+    return file_ref
+
+
+def reference_to_dataset(reference:dict, file_nc_list:list, chunks:dict, time_index:slice = None, 
+                         ds_topology:xr.Dataset = None) -> xr.Dataset:
+    """
+    Convert a reference to a lazy xr.Dataset, the data is read from the files with netCDF4 and
+    decoded with xr.decode_cf(). Variables on ugrid dimensions are gathered from all partitions.
+    With time_index, only these timesteps are read, the shapes are read from the files so this
+    also works for files that are still being written.
+    """
+    # current shapes of the variables in all files
+    shapes = []
+    for file_nc_one in file_nc_list:
+        with netCDF4.Dataset(file_nc_one) as nc:
+            shapes.append({varn:ncvar.shape for varn, ncvar in nc.variables.items()})
+    
+    ref_dims = {}
+    for dim, dim_ref in reference["dims"].items():
+        partition = decode_reference_array(dim_ref["partition"])
+        index = decode_reference_array(dim_ref["index"])
+        ipartitions = np.unique(partition)
+        positions = [np.flatnonzero(partition==iP) for iP in ipartitions]
+        order = np.concatenate(positions)
+        reorder = None
+        if not np.array_equal(order, np.arange(len(order))):
+            reorder = np.argsort(order)
+        ref_dims[dim] = (ipartitions, [index[x] for x in positions], reorder)
+    
+    def get_lazy_array(iP, varn, dtype, dims, ugrid_dim=None):
+        file_nc_one = file_nc_list[iP]
+        array = NetCDF4VariableArray(file_nc_one, varn, shapes[iP][varn], dtype)
+        var_chunks = tuple(-1 if dim==ugrid_dim else chunks.get(dim, -1) for dim in dims)
+        name = f"{varn}-{hashlib.md5(file_nc_one.encode()).hexdigest()}-{reference['cache_key'][:16]}-{array.shape}"
+        data = dask.array.from_array(array, chunks=var_chunks, name=name, meta=np.array((), dtype=dtype))
+        if time_index is not None and "time" in dims:
+            data = data[(slice(None),) * dims.index("time") + (time_index,)]
+            # cull the dask graph, so it only contains the chunks within time_index
+            (data,) = dask.optimize(data)
+        return data
+    
+    variables = {}
+    for varn, var_ref in reference["variables"].items():
+        dims = var_ref["dims"]
+        dtype = np.dtype(var_ref["dtype"])
+        attrs = decode_reference_attrs(var_ref["attrs"])
+        ugrid_dim = var_ref["ugrid_dim"]
+        if "arange" in var_ref:
+            data = np.arange(var_ref["arange"], dtype=dtype)
+        elif ugrid_dim is None:
+            if dims == [varn]:
+                # dimension coordinates are loaded
+                data = get_lazy_array(0, varn, dtype, dims).compute()
+            else:
+                data = get_lazy_array(0, varn, dtype, dims)
+        else:
+            axis = dims.index(ugrid_dim)
+            ipartitions, indexes, reorder = ref_dims[ugrid_dim]
+            data_parts = []
+            for iP, index in zip(ipartitions, indexes):
+                data_part = get_lazy_array(iP, varn, dtype, dims, ugrid_dim=ugrid_dim)
+                data_parts.append(dask.array.take(data_part, index, axis=axis))
+            data = dask.array.concatenate(data_parts, axis=axis)
+            if reorder is not None:
+                data = dask.array.take(data, reorder, axis=axis)
+        variables[varn] = xr.Variable(dims, data, attrs=attrs)
+    
+    ds_raw = xr.Dataset(variables, attrs=decode_reference_attrs(reference["attrs"]))
+    ds = xr.decode_cf(ds_raw)
+    if ds_topology is not None:
+        # coordinates like node_x/node_y are part of the topology
+        coords_topology = {varn:ds_topology[varn] for varn in reference["coords"] 
+                           if varn in ds_topology.variables and varn not in ds.variables}
+        ds = ds.assign_coords(coords_topology)
+    ds = ds.set_coords([varn for varn in reference["coords"] if varn in ds.variables])
+    remove_nan_fillvalue_attrs(ds)
+    return ds
+
+
+def reference_to_grid(reference:dict):
+    """
+    Convert the topology in the reference to a xu.Ugrid2d and the topology dataset
+    """
+    ds_topology = xr.Dataset()
+    for varn, var_ref in reference["grid"].items():
+        ds_topology[varn] = xr.Variable(var_ref["dims"], decode_reference_array(var_ref["data"]), 
+                                        attrs=decode_reference_attrs(var_ref["attrs"]))
+        if var_ref["coordinate"]:
+            ds_topology = ds_topology.set_coords(varn)
+    grid = xu.Ugrid2d.from_dataset(ds_topology, topology=reference["topology"])
+    if reference["crs"] is not None:
+        grid.set_crs(reference["crs"])
+    return grid, ds_topology
+
+
+def open_mapfiles_reference(file_ref:str, chunks:(str,dict) = None) -> xu.UgridDataset:
+    """
+    Open a reference file created with dfmt.mapfiles_to_reference() as merged xu.UgridDataset. The data is 
+    read lazily from the partitions with netCDF4 and decoded with xr.decode_cf(). The chunks are derived 
+    like in dfmt.open_partitioned_dataset(), the ugrid dimensions are read as one chunk per partition.
+    """
+    with open(file_ref) as f:
+        reference = json.load(f)
+    dir_ref = os.path.dirname(os.path.abspath(file_ref))
+    file_nc_list = [os.path.join(dir_ref, x) for x in reference["files"]]
+    
+    if chunks is None or isinstance(chunks, str):
+        chunks = get_chunks_kwargs(file_nc_list[0], {} if chunks is None else {"chunks":chunks})["chunks"]
+    grid, ds_topology = reference_to_grid(reference)
+    ds = reference_to_dataset(reference, file_nc_list, chunks=chunks, ds_topology=ds_topology)
+    uds = xu.UgridDataset(ds, grids=[grid])
+    return uds
+
+
+def get_hisfile_reference(file_nc:str) -> dict:
+    """
+    Derive a reference (a dictionary) with the metadata of the raw variables in a hisfile
+    """
+    with netCDF4.Dataset(file_nc) as nc:
+        ref_vars = {varn:get_reference_variable(ncvar, dims=ncvar.dimensions) 
+                    for varn, ncvar in nc.variables.items() if ncvar.dtype != str}
+        attrs = {key:nc.getncattr(key) for key in nc.ncattrs()}
+    reference = {"source":"dfm_tools.OutputFollower()",
+                 "files":[file_nc],
+                 "cache_key":get_partitions_cache_key([file_nc]),
+                 "attrs":encode_reference_attrs(attrs),
+                 "dims":{},
+                 "variables":ref_vars,
+                 "coords":[],
+                 }
+    return reference
+
+
+def has_mesh2d(file_nc:str) -> bool:
+    with netCDF4.Dataset(file_nc) as nc:
+        for ncvar in nc.variables.values():
+            if getattr(ncvar, "cf_role", None) == "mesh_topology" and getattr(ncvar, "topology_dimension", None) == 2:
+                return True
+    return False
+
+
+class OutputFollower:
+    """
+    Follow the map or his output of a running D-Flow FM simulation. The merged topology (mapfiles) 
+    or the station/crs/gs index (hisfiles) is derived once, upon each refresh() only the timesteps 
+    that were added since the previous refresh are read. For partitioned mapfiles, the timesteps that are
+    present in all partitions are returned. D-Flow FM extends the time dimension before all variables 
+    of the new timestep are written, so the last timestep is only returned once a next timestep is 
+    present or with refresh(final=True) after the simulation has finished.
+    
+    Example:
+        follower = dfmt.OutputFollower(file_nc)
+        ds_new = follower.refresh() # all timesteps written so far, except for the last one
+        ds_new = follower.refresh() # only the timesteps written since the previous refresh
+        ds_new = follower.refresh(final=True) # after the simulation finished, including the last timestep
+    """
+    def __init__(self, file_nc:str, chunks:(str,dict) = None, decode_fillvals:bool = False, 
+                 remove_edges:bool = True, remove_ghost:bool = True):
+        """
+        Parameters
+        ----------
+        file_nc : str
+            filename, filepattern or list of files of a (partitioned) mapfile or of a hisfile.
+        chunks : str or dict, optional
+            dictionary with chunks or access pattern of dfmt.get_chunks(), the default is "map snapshot".
+        decode_fillvals, remove_edges, remove_ghost : bool, optional
+            see dfmt.open_partitioned_dataset(), only used for mapfiles.
+        """
+        self.file_nc_list = file_to_list(file_nc)
+        self.chunks = chunks
+        self.options = dict(decode_fillvals=decode_fillvals, remove_edges=remove_edges, remove_ghost=remove_ghost)
+        self.is_map = has_mesh2d(self.file_nc_list[0])
+        self.ntimes_read = 0
+        self.reference = None
+        self.grid = None
+        self.ds_topology = None
+        self.his_index = None
+    
+    def get_ntimes(self) -> int:
+        """
+        the amount of timesteps that is present in all files
+        """
+        ntimes_list = []
+        for file_nc_one in self.file_nc_list:
+            with netCDF4.Dataset(file_nc_one) as nc:
+                ntimes_list.append(len(nc.dimensions["time"]))
+        return min(ntimes_list)
+    
+    def initialize(self):
+        """
+        derive the reference with merged topology (mapfiles) or variable metadata (hisfiles)
+        """
+        if self.is_map:
+            print(f'>> dfmt.OutputFollower() merging topology of {len(self.file_nc_list)} partition(s): ',end='')
+            self.reference = get_mapfiles_reference(self.file_nc_list, **self.options)
+            self.grid, self.ds_topology = reference_to_grid(self.reference)
+            print('')
+        else:
+            if len(self.file_nc_list) > 1:
+                raise ValueError(f'OutputFollower supports only one hisfile, received {len(self.file_nc_list)}')
+            self.reference = get_hisfile_reference(self.file_nc_list[0])
+        if self.chunks is None or isinstance(self.chunks, str):
+            kwargs = {} if self.chunks is None else {"chunks":self.chunks}
+            self.chunks = get_chunks_kwargs(self.file_nc_list[0], kwargs)["chunks"]
+    
+    def refresh(self, final:bool = False):
+        """
+        Read the timesteps that were added since the previous refresh (or all timesteps upon the first refresh).
+        Returns a xu.UgridDataset for mapfiles and a xr.Dataset for hisfiles, with zero timesteps if there is no new data.
+        
+        Parameters
+        ----------
+        final : bool, optional
+            Whether the simulation has finished. If False, the last timestep is not read since 
+            it might not be written completely yet, it is read upon a later refresh. The default is False.
+        """
+        if self.reference is None:
+            self.initialize()
+        ntimes = self.get_ntimes()
+        if not final:
+            # the last timestep might be partly written
+            ntimes = max(ntimes - 1, self.ntimes_read)
+        time_index = slice(self.ntimes_read, ntimes)
+        ds = reference_to_dataset(self.reference, self.file_nc_list, chunks=self.chunks, 
+                                  time_index=time_index, ds_topology=self.ds_topology)
+        self.ntimes_read = ntimes
+        if self.is_map:
+            return xu.UgridDataset(ds, grids=[self.grid])
+        if self.his_index is None:
+            self.his_index = get_hisnc_index(ds)
+        ds = apply_hisnc_index(ds, self.his_index)
+        return ds
+
+
+def open_partitioned_dataset(file_nc:str, decode_fillvals:bool = False, remove_edges:bool = True, remove_ghost:bool = True, 
+                             parallel:(bool,str) = False, max_workers:int = None, topology_cache:(bool,str) = False, 
+                             time_slice:slice = None, variables:list = None, **kwargs): 
     """
     using xugrid to read and merge partitions, including support for delft3dfm mapformat1 
     by renaming old layerdim. Furthermore some optional extensions like removal of hanging
@@ -180,21 +1236,48 @@ def open_partitioned_dataset(file_nc:str, decode_fillvals:bool = False, remove_e
     Parameters
     ----------
     file_nc : str
-        DESCRIPTION.
+        filename, filepattern or list of files of the partitions. Can also be a json reference file 
+        created with dfmt.mapfiles_to_reference(), in that case only the time_slice, variables and chunks 
+        arguments are used.
     decode_fillvals : bool, optional
         DESCRIPTION. The default is False.
     remove_edges : bool, optional
         Remove hanging edges from the mapfile, necessary to generate contour and contourf plots 
-        with xugrid. Can be enabled always, but takes some additional computation time. The default is False.
+        with xugrid. The associated edges of all partitions are derived once up front from the connectivities
+        and converted to an AssociatedEdgeIndex, which is also stored in the topology cache if enabled. 
+        The default is True.
     remove_ghost : bool, optional
         Remove ghostcells from the partitions. This is also done by xugrid automatically 
         upon merging, but then the domain numbers are not taken into account so 
-        the result will be different. The default is True.
-    file_nc : TYPE
-        DESCRIPTION.
+        the result will be different. The domain variables of all partitions are read
+        once up front and converted to a GhostcellIndex, which is also stored in the 
+        topology cache if enabled. The default is True.
+    parallel : bool or str, optional
+        Open and prepare the partitions in a thread pool instead of one after another, 
+        use True or "thread". The partitions are merged in the original order. The default is False.
+    max_workers : int, optional
+        Maximum amount of workers of the thread pool, only used if parallel is not False. 
+        The default is None, which lets concurrent.futures decide.
+    topology_cache : bool or str, optional
+        Store the merged topology and the per-partition face/edge/node indexes in a netcdf file, 
+        so merging the topologies can be skipped in subsequent calls. Use True for a file next to 
+        the partitions (like Grevelingen-FM_topology_cache.nc) or provide a filename. The cache
+        is regenerated if the paths, sizes or modification times of the partitions change. The default is False.
+    time_slice : slice, optional
+        Time selection like slice("2014-01-01","2014-01-02"), applied with .sel(time=time_slice) on
+        each partition before merging. This is equivalent to .sel() after merging, but the dask graph 
+        and merge time scale with the selected window instead of the full run. The default is None.
+    variables : list of str, optional
+        Variables to read, all others are dropped upon opening via drop_variables (appended to 
+        drop_variables if also provided). Topology, crs, dimension and coordinate variables are kept. 
+        Note that for instance dfmt.reconstruct_zw_zcc() requires additional variables like 
+        mesh2d_flowelem_bl and mesh2d_s1. The default is None.
     kwargs : TYPE, optional
-        arguments that are passed to xr.open_dataset. The chunks argument is set if not provided
-        chunks={'time':1} increases performance significantly upon reading, but causes memory overloads when performing sum/mean/etc actions over time dimension (in that case 100/200 is better). The default is {'time':1}.
+        arguments that are passed to xr.open_dataset. The chunks argument can also be one of the access
+        patterns of dfmt.get_chunks(): "map snapshot", "time series" or "time reduction". In that case the chunks are
+        derived from the dimension sizes and dtypes in the first partition. Use "time reduction" when performing
+        sum/mean/etc over the time dimension, since one timestep per chunk causes memory overloads in that case. 
+        The default is "map snapshot", which results in chunks={'time':1} unless a timestep does not fit in 100 MB.
 
     Raises
     ------
@@ -223,44 +1306,93 @@ def open_partitioned_dataset(file_nc:str, decode_fillvals:bool = False, remove_e
     #TODO: add support for multiple grids via keyword? https://github.com/Deltares/dfm_tools/issues/497
     #TODO: speed up open_dataset https://github.com/Deltares/dfm_tools/issues/225 (also remove_ghost)
     
-    if 'chunks' not in kwargs:
-        kwargs['chunks'] = {'time':1}
-    
     dtstart_all = dt.datetime.now()
+    if isinstance(file_nc, (str, os.PathLike)) and str(file_nc).endswith(".json"):
+        print('>> opening reference file created with dfmt.mapfiles_to_reference(): ',end='')
+        uds = open_mapfiles_reference(file_nc, chunks=kwargs.get("chunks"))
+        if variables is not None:
+            varns_drop = [varn for varn in uds.data_vars if varn not in variables]
+            uds = uds.drop_vars(varns_drop)
+        if time_slice is not None:
+            uds = uds.sel(time=time_slice)
+        print(f'{(dt.datetime.now()-dtstart_all).total_seconds():.2f} sec')
+        return uds
+    
     file_nc_list = file_to_list(file_nc)
+    kwargs = get_chunks_kwargs(file_nc_list, kwargs)
+    
+    ds_cache = None
+    if topology_cache and len(file_nc_list) > 1:
+        file_cache = get_topology_cache_file(file_nc_list, topology_cache=topology_cache)
+        cache_key = get_partitions_cache_key(file_nc_list, remove_edges=remove_edges, remove_ghost=remove_ghost)
+        ds_cache = read_topology_cache(file_cache, cache_key=cache_key)
+    
+    # derive the owned faces of all partitions at once instead of per partition after opening
+    ghostcell_index = None
+    if remove_ghost:
+        if ds_cache is not None and "ghostcell_owned_index" in ds_cache.variables:
+            ghostcell_index = GhostcellIndex.from_dataset(ds_cache, file_nc_list=file_nc_list)
+        else:
+            ghostcell_index = GhostcellIndex.from_files(file_nc_list)
+    
+    # derive the associated edges of all partitions at once from the connectivities
+    edge_index = None
+    if remove_edges:
+        if ds_cache is not None and AssociatedEdgeIndex.varn_index in ds_cache.variables:
+            edge_index = AssociatedEdgeIndex.from_dataset(ds_cache, file_nc_list=file_nc_list)
+        else:
+            edge_index = AssociatedEdgeIndex.from_files(file_nc_list)
+    
+    if variables is not None:
+        drop_variables = get_drop_variables(file_nc_list[0], variables=variables, remove_ghost=remove_ghost)
+        drop_variables_user = kwargs.get('drop_variables', [])
+        if isinstance(drop_variables_user, str):
+            drop_variables_user = [drop_variables_user]
+        kwargs['drop_variables'] = list(drop_variables_user) + [x for x in drop_variables if x not in drop_variables_user]
+    
+    partition_kwargs = dict(decode_fillvals=decode_fillvals, 
+                            remove_edges=remove_edges, 
+                            remove_ghost=remove_ghost,
+                            ghostcell_index=ghostcell_index,
+                            edge_index=edge_index,
+                            time_slice=time_slice)
+    partition_kwargs.update(kwargs)
     
     print(f'>> xu.open_dataset() with {len(file_nc_list)} partition(s): ',end='')
     dtstart = dt.datetime.now()
-    partitions = []
-    for iF, file_nc_one in enumerate(file_nc_list):
-        print(iF+1,end=' ')
-        # suppress chunking warning: https://github.com/Deltares/dfm_tools/issues/947
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore", category=UserWarning)
-            ds = xr.open_mfdataset(file_nc_one, **kwargs)
-        if decode_fillvals:
-            ds = decode_default_fillvals(ds)
-        if remove_edges:
-            ds = remove_unassociated_edges(ds)
-        if 'nFlowElem' in ds.dims and 'nNetElem' in ds.dims:
-            print('[mapformat1] ',end='')
-            #for mapformat1 mapfiles: merge different face dimensions (rename nFlowElem to nNetElem) to make sure the dataset topology is correct
-            ds = ds.rename({'nFlowElem':'nNetElem'})
-        remove_nan_fillvalue_attrs(ds)
-        uds = xu.core.wrap.UgridDataset(ds)
-        if remove_ghost: #TODO: this makes it way slower (at least for GTSM, although merging seems faster), but is necessary since values on overlapping cells are not always identical (eg in case of Venice ucmag)
-            uds = remove_ghostcells(uds, file_nc_one)
-        uds_auto_set_crs(uds)
-        partitions.append(uds)
+    # suppress chunking warning: https://github.com/Deltares/dfm_tools/issues/947
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=UserWarning)
+        if parallel:
+            results = open_partitions_parallel(file_nc_list, parallel=parallel, 
+                                               max_workers=max_workers, **partition_kwargs)
+        else:
+            results = []
+            for iF, file_nc_one in enumerate(file_nc_list):
+                print(iF+1,end=' ')
+                results.append(open_one_partition(file_nc_one, **partition_kwargs))
+    partitions = [uds for uds, _ in results]
     print(': ',end='')
     print(f'{(dt.datetime.now()-dtstart).total_seconds():.2f} sec')
     
+    if len(partitions) > 1:
+        partition_timings = pd.Series([time_passed for _, time_passed in results],
+                                      index=[os.path.basename(x) for x in file_nc_list])
+        print(f'>> timings per partition: min {partition_timings.min():.2f} sec, '
+              f'max {partition_timings.max():.2f} sec ({partition_timings.idxmax()})')
+        logger.info(f'timings per partition in seconds:\n{partition_timings.round(2).to_string()}')
+    
     if len(partitions) == 1: #do not merge in case of 1 partition
         return partitions[0]
     
     print(f'>> xu.merge_partitions() with {len(file_nc_list)} partition(s): ',end='')
     dtstart = dt.datetime.now()
-    ds_merged_xu = xu.merge_partitions(partitions)
+    if topology_cache:
+        ds_merged_xu = merge_partitions_topology_cache(partitions, file_cache=file_cache, cache_key=cache_key,
+                                                       ds_cache=ds_cache, ghostcell_index=ghostcell_index,
+                                                       edge_index=edge_index)
+    else:
+        ds_merged_xu = xu.merge_partitions(partitions)
     print(f'{(dt.datetime.now()-dtstart).total_seconds():.2f} sec')
     
     #print variables that are dropped in merging procedure. Often only ['mesh2d_face_x_bnd', 'mesh2d_face_y_bnd'], which can be derived by combining node_coordinates (mesh2d_node_x mesh2d_node_y) and face_node_connectivity (mesh2d_face_nodes). >> can be removed from FM-mapfiles (email of 16-1-2023)
@@ -275,6 +1407,105 @@ def open_partitioned_dataset(file_nc:str, decode_fillvals:bool = False, remove_e
     return ds_merged_xu
 
 
+def mapfiles_to_zarr(file_nc:str, file_zarr:str, chunks:(str,dict) = "time series", max_memory_mb:float = 1000, 
+                     overwrite:bool = False, **kwargs) -> xu.UgridDataset:
+    """
+    Merge the partitions of a D-Flow FM mapfile with dfmt.open_partitioned_dataset() (which also removes the ghostcells)
+    and write the result to a zarr store with another chunking layout. For instance "time series" results 
+    in face-major chunks, so timeseries at a few faces can be retrieved without reading all data.
+    
+    The data is written in batches of timesteps, so the memory usage is bounded by max_memory_mb.
+    The progress is stored in the attributes of the zarr store, so an interrupted conversion 
+    continues where it stopped when calling this function again with the same arguments.
+
+    Parameters
+    ----------
+    file_nc : str
+        filename, filepattern or list of files of the partitioned mapfiles.
+    file_zarr : str
+        path of the zarr store.
+    chunks : str or dict, optional
+        Chunks of the zarr store, an access pattern of dfmt.get_chunks() or a dictionary with chunks 
+        per dimension. The time chunks are reduced if they exceed max_memory_mb. The default is "time series".
+    max_memory_mb : float, optional
+        Approximate maximum size of the timestep batches that are read and written at once, in megabytes. The default is 1000.
+    overwrite : bool, optional
+        Overwrite an existing zarr store. If False, an existing store is completed if it was 
+        created with the same files and arguments, otherwise a FileExistsError is raised. The default is False.
+    **kwargs : optional
+        arguments that are passed to dfmt.open_partitioned_dataset().
+
+    Returns
+    -------
+    uds : xu.UgridDataset
+        The zarr store opened with xu.open_zarr().
+
+    """
+    import zarr
+    
+    file_nc_list = file_to_list(file_nc)
+    cache_key = get_partitions_cache_key(file_nc_list, chunks=chunks, max_memory_mb=max_memory_mb, **kwargs)
+    
+    # check existing zarr store
+    resume = os.path.exists(file_zarr) and not overwrite
+    itime_start = 0
+    if resume:
+        attrs = zarr.open_group(file_zarr, mode="r").attrs
+        if attrs.get("cache_key") != cache_key:
+            raise FileExistsError(f'zarr store "{file_zarr}" already exists and was created from other files or with other arguments, use overwrite=True to replace it')
+        itime_start = attrs.get("ntimes_written", 0)
+    
+    uds = open_partitioned_dataset(file_nc_list, **kwargs)
+    ds = uds.ugrid.to_dataset()
+    time_dim = "time"
+    ntimes = ds.sizes[time_dim]
+    time_vars = [varn for varn in ds.data_vars if time_dim in ds[varn].dims]
+    
+    if isinstance(chunks, str):
+        chunks = get_chunks(ds, access_pattern=chunks)
+    chunks = {k:v for k,v in chunks.items() if k in ds.dims}
+    
+    # limit the amount of timesteps per batch (and per chunk) to the memory budget
+    bytes_per_timestep = sum(ds[varn].nbytes for varn in time_vars) / ntimes
+    ntimes_budget = int(np.clip(max_memory_mb * 1024**2 // bytes_per_timestep, 1, ntimes))
+    time_chunk = chunks.get(time_dim, -1)
+    if time_chunk == -1 or time_chunk > ntimes_budget:
+        time_chunk = ntimes_budget
+    chunks[time_dim] = time_chunk
+    ds = ds.chunk(chunks)
+    for varn in ds.variables:
+        # the netcdf chunks conflict with the zarr chunks
+        ds[varn].encoding.pop("chunks", None)
+        ds[varn].encoding.pop("preferred_chunks", None)
+        # xugrid sets _FillValue attrs on the connectivity variables, move them to the encoding
+        if "_FillValue" in ds[varn].attrs:
+            ds[varn].encoding["_FillValue"] = ds[varn].attrs.pop("_FillValue")
+    
+    if resume:
+        print(f'>> resuming conversion to zarr at timestep {itime_start} of {ntimes}')
+    else:
+        # write the metadata, the time-independent variables and the coordinates
+        ds.attrs["cache_key"] = cache_key
+        ds.attrs["ntimes_written"] = 0
+        ds.to_zarr(file_zarr, mode="w", compute=False, consolidated=False)
+        ds.drop_vars(time_vars).to_zarr(file_zarr, mode="r+", consolidated=False)
+    
+    print(f'>> writing {len(time_vars)} time-dependent variables to zarr in batches of {time_chunk} timesteps: ',end='')
+    dtstart = dt.datetime.now()
+    ds_time = ds[time_vars]
+    ds_time = ds_time.drop_vars([varn for varn in ds_time.coords if time_dim not in ds_time[varn].dims])
+    for itime in range(itime_start, ntimes, time_chunk):
+        print(itime//time_chunk+1,end=' ')
+        region = {time_dim: slice(itime, min(itime + time_chunk, ntimes))}
+        ds_time.isel(region).to_zarr(file_zarr, region=region, consolidated=False)
+        zarr.open_group(file_zarr, mode="r+").attrs["ntimes_written"] = region[time_dim].stop
+    print(f': {(dt.datetime.now()-dtstart).total_seconds():.2f} sec')
+    zarr.consolidate_metadata(file_zarr)
+    
+    uds_zarr = xu.open_zarr(file_zarr)
+    return uds_zarr
+
+
 def open_dataset_curvilinear(file_nc,
                              varn_lon='longitude',
                              varn_lat='latitude',
@@ -286,11 +1517,11 @@ def open_dataset_curvilinear(file_nc,
     """
     This is a first version of a function that creates a xugrid UgridDataset from a curvilinear dataset like CMCC. Curvilinear means in this case 2D lat/lon variables and i/j indexing. The CMCC dataset does contain vertices, which is essential for conversion to ugrid.
     It also works for WAQUA files that are converted with getdata
+    The chunks argument in kwargs can also be one of the access patterns of dfmt.get_chunks(), the default is "map snapshot".
     """
     # TODO: maybe get varn_lon/varn_lat automatically with cf-xarray (https://github.com/xarray-contrib/cf-xarray)
     
-    if 'chunks' not in kwargs:
-        kwargs['chunks'] = {'time':1}
+    kwargs = get_chunks_kwargs(file_nc, kwargs)
     
     # data_vars='minimal' to avoid time dimension on vertices_latitude and others when opening multiple files at once
     ds = xr.open_mfdataset(file_nc, data_vars="minimal", **kwargs)
@@ -379,9 +1610,12 @@ def get_delft3d4_nanmask(x,y):
 
 
 def open_dataset_delft3d4(file_nc, **kwargs):
+    """
+    Open a Delft3D4 trim file as xu.UgridDataset. The chunks argument in kwargs can also be 
+    one of the access patterns of dfmt.get_chunks(), the default is "map snapshot".
+    """
     
-    if 'chunks' not in kwargs:
-        kwargs['chunks'] = {'time':1}
+    kwargs = get_chunks_kwargs(file_nc, kwargs)
     
     ds = xr.open_dataset(file_nc, **kwargs)
     
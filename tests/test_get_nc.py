@@ -46,3 +46,423 @@ def test_get_dataset_atdepths_hisfile():
     assert np.isclose(data_xr_selzt.temperature.sum(), 1295.56826688)
 
 
+def get_uds_structured_2d():
+    """
+    small 2D dataset on a structured grid with waterlevel and bedlevel, so no data download is required
+    """
+    import xugrid as xu
+    import pandas as pd
+    grid = xu.Ugrid2d.from_structured_intervals1d(np.linspace(0,4000,41), np.linspace(0,3000,31))
+    times = pd.date_range("2020-01-01", periods=3, freq="h")
+    ds = xr.Dataset()
+    ds["mesh2d_s1"] = (("time", grid.face_dimension), 
+                       np.sin(np.arange(3)[:,np.newaxis] + grid.face_x[np.newaxis,:]/1000))
+    ds["mesh2d_flowelem_bl"] = ((grid.face_dimension,), -5 - 10*grid.face_y/3000)
+    ds["time"] = times
+    uds = xu.UgridDataset(ds, grids=[grid])
+    return uds
+
+
+def get_uds_structured_3d_sigma():
+    """
+    small 3D sigma-layer dataset on a structured grid, so no data download is required
+    """
+    import xugrid as xu
+    uds = get_uds_structured_2d()
+    grid = uds.grid
+    ds = uds.ugrid.to_dataset()
+    ds["mesh2d"] = ds["mesh2d"].assign_attrs(layer_dimension="mesh2d_nLayers", interface_dimension="mesh2d_nInterfaces")
+    sigma_interface = np.linspace(-1, 0, 6)
+    sigma_layer = (sigma_interface[1:] + sigma_interface[:-1]) / 2
+    ds["mesh2d_layer_sigma"] = (("mesh2d_nLayers",), sigma_layer, 
+                                {"standard_name":"ocean_sigma_coordinate", 
+                                 "formula_terms":"sigma: mesh2d_layer_sigma eta: mesh2d_s1 depth: mesh2d_bldepth"})
+    ds["mesh2d_interface_sigma"] = (("mesh2d_nInterfaces",), sigma_interface, 
+                                    {"standard_name":"ocean_sigma_coordinate", 
+                                     "formula_terms":"sigma: mesh2d_interface_sigma eta: mesh2d_s1 depth: mesh2d_bldepth"})
+    ds["mesh2d_bldepth"] = -ds["mesh2d_flowelem_bl"].assign_attrs(standard_name="sea_floor_depth_below_geoid")
+    ds["mesh2d_sa1"] = 30 + ds["mesh2d_s1"] * xr.DataArray(sigma_layer, dims="mesh2d_nLayers")
+    ds["mesh2d_sa1"] = ds["mesh2d_sa1"].transpose("time", grid.face_dimension, "mesh2d_nLayers")
+    uds = xu.UgridDataset(ds)
+    return uds
+
+
+@pytest.mark.unittest
+def test_transect():
+    uds = get_uds_structured_2d()
+    line_array = np.array([[ 400, 600],
+                           [2000, 1800],
+                           [3600,  900]])
+    
+    # intersection with bounding box prefilter is equal to intersection with full grid
+    edges = np.stack([line_array[:-1],line_array[1:]],axis=1)
+    edge_index, face_index, intersections = dfmt.get_nc.intersect_edges_withsort(uds.grid, edges)
+    edge_index_full, face_index_full, intersections_full = uds.grid.intersect_edges(edges)
+    _, _, intersections_full = dfmt.get_nc.sort_intersections(edges, edge_index_full, face_index_full, intersections_full)
+    assert len(face_index) < uds.grid.n_face
+    assert np.array_equal(np.sort(face_index), np.sort(face_index_full))
+    assert np.allclose(intersections, intersections_full)
+    
+    transect = dfmt.Transect(uds.grid, line_array)
+    assert len(transect) == len(face_index)
+    for timestep in range(3):
+        uds_crs = transect.slice(uds.isel(time=timestep))
+        uds_crs_expected = dfmt.polyline_mapslice(uds.isel(time=timestep), line_array)
+        assert np.allclose(uds_crs.grid.node_x, uds_crs_expected.grid.node_x)
+        assert np.allclose(uds_crs.grid.node_y, uds_crs_expected.grid.node_y)
+        assert np.array_equal(uds_crs.mesh2d_s1.to_numpy(), uds_crs_expected.mesh2d_s1.to_numpy())
+    assert np.isclose(uds_crs.grid.node_x.max(), np.linalg.norm(np.diff(line_array,axis=0),axis=1).sum())
+
+
+@pytest.mark.unittest
+def test_transect_nocrossing():
+    uds = get_uds_structured_2d()
+    line_array = np.array([[5000, 5000],
+                           [6000, 6000]])
+    with pytest.raises(ValueError) as e:
+        dfmt.Transect(uds.grid, line_array)
+    assert "polyline does not cross mapdata" in str(e.value)
+
+
+@pytest.mark.unittest
+def test_transect_slice_time():
+    line_array = np.array([[ 400, 600],
+                           [2000, 1800],
+                           [3600,  900]])
+    for uds in [get_uds_structured_2d(), get_uds_structured_3d_sigma()]:
+        transect = dfmt.Transect(uds.grid, line_array)
+        ds_crs = transect.slice_time(uds.chunk({"time":1}))
+        if "mesh2d_nLayers" in uds.dims:
+            varn = "mesh2d_sa1"
+            assert ds_crs[varn].dims == ("time", "mesh2d_nLayers", "ncrossed_faces")
+        else:
+            varn = "mesh2d_s1"
+            assert ds_crs[varn].dims == ("time", "ncrossed_faces")
+        assert ds_crs.crs_z_top.dims == ds_crs[varn].dims
+        assert ds_crs[varn].chunks is not None
+        ds_crs = ds_crs.compute()
+        
+        for timestep in range(3):
+            uds_crs = transect.to_ugrid(ds_crs.isel(time=timestep))
+            uds_crs_expected = transect.slice(uds.isel(time=timestep))
+            assert np.allclose(uds_crs.grid.node_x, uds_crs_expected.grid.node_x)
+            assert np.allclose(uds_crs.grid.node_y, uds_crs_expected.grid.node_y)
+            assert np.array_equal(uds_crs[varn].to_numpy(), uds_crs_expected[varn].to_numpy())
+
+
+@pytest.mark.unittest
+def test_get_dataset_atdepths_gather():
+    """
+    compare the gathered values with a straightforward comparison of all layers, also for depths
+    exactly on an interface (maximum of both layers) and depths below bed or above waterlevel (nan)
+    """
+    import warnings
+    uds = get_uds_structured_3d_sigma()
+    uds_zw = dfmt.reconstruct_zw_zcc(uds.copy())
+    zw = uds_zw.mesh2d_flowelem_zw.to_numpy() # (time, face, interface)
+    sa1 = uds_zw.mesh2d_sa1.to_numpy() # (time, face, layer)
+    depth_interface = zw[1, 10, 2]
+    depths = [-20, -4, depth_interface, -1, 5]
+    
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        uds_atdepths = dfmt.get_Dataset_atdepths(uds, depths=depths, reference='z0')
+        sa1_atdepths = uds_atdepths.mesh2d_sa1.to_numpy()
+    
+    assert uds_atdepths.mesh2d_sa1.dims == ("time", uds.grid.face_dimension, "depth_from_z0")
+    depths_sorted = np.unique(depths)
+    for idepth, depth in enumerate(depths_sorted):
+        bool_layer = (zw[:,:,1:] >= depth) & (zw[:,:,:-1] <= depth)
+        sa1_expected = np.where(bool_layer, sa1, -np.inf).max(axis=-1)
+        sa1_expected[~bool_layer.any(axis=-1)] = np.nan
+        assert np.array_equal(sa1_atdepths[:,:,idepth], sa1_expected, equal_nan=True)
+    assert np.isnan(sa1_atdepths[:,:,depths_sorted==-20]).all()
+    assert np.isnan(sa1_atdepths[:,:,depths_sorted==5]).all()
+    
+    # single depth results in no depth dimension
+    uds_atdepth = dfmt.get_Dataset_atdepths(uds, depths=-4, reference='z0')
+    assert uds_atdepth.mesh2d_sa1.dims == ("time", uds.grid.face_dimension)
+    assert np.array_equal(uds_atdepth.mesh2d_sa1.to_numpy(), sa1_atdepths[:,:,depths_sorted==-4][:,:,0], equal_nan=True)
+
+
+@pytest.mark.unittest
+def test_get_dataset_atdepths_linear():
+    """
+    compare the linear interpolation between the layer centers with np.interp per column,
+    with the nearest center value between bed and lowest center and nans below bed or above waterlevel
+    """
+    uds = get_uds_structured_3d_sigma()
+    uds_zw = dfmt.reconstruct_zw_zcc(uds.copy())
+    zw = uds_zw.mesh2d_flowelem_zw.to_numpy() # (time, face, interface)
+    zcc = uds_zw.mesh2d_flowelem_zcc.to_numpy() # (time, face, layer)
+    sa1 = uds_zw.mesh2d_sa1.to_numpy() # (time, face, layer)
+    depths = [-20, -14, -4, -1, 5]
+    
+    uds_atdepths = dfmt.get_Dataset_atdepths(uds, depths=depths, reference='z0', method='linear')
+    sa1_atdepths = uds_atdepths.mesh2d_sa1.to_numpy()
+    assert uds_atdepths.mesh2d_sa1.dims == ("time", uds.grid.face_dimension, "depth_from_z0")
+    
+    sa1_expected = np.full(sa1_atdepths.shape, np.nan)
+    for itime in range(zw.shape[0]):
+        for iface in range(zw.shape[1]):
+            for idepth, depth in enumerate(depths):
+                if zw[itime,iface,0] <= depth <= zw[itime,iface,-1]:
+                    sa1_expected[itime,iface,idepth] = np.interp(depth, zcc[itime,iface], sa1[itime,iface])
+    assert np.allclose(sa1_atdepths, sa1_expected, equal_nan=True)
+    assert np.isnan(sa1_atdepths[:,:,0]).all()
+    assert np.isnan(sa1_atdepths[:,:,-1]).all()
+    assert not np.isnan(sa1_atdepths[:,:,2]).any()
+    
+    with pytest.raises(ValueError) as e:
+        dfmt.get_Dataset_atdepths(uds, depths=depths, method='cubic')
+    assert 'unknown method "cubic"' in str(e.value)
+
+
+def get_uds_structured_3d_z():
+    """
+    small 3D z-layer dataset on a structured grid, so no data download is required
+    """
+    import xugrid as xu
+    uds = get_uds_structured_2d()
+    ds = uds.ugrid.to_dataset()
+    ds["mesh2d"] = ds["mesh2d"].assign_attrs(layer_dimension="mesh2d_nLayers", interface_dimension="mesh2d_nInterfaces")
+    z_interface = np.array([-15, -10, -5, 0, 0.5])
+    z_layer = (z_interface[1:] + z_interface[:-1]) / 2
+    ds["mesh2d_layer_z"] = (("mesh2d_nLayers",), z_layer)
+    ds["mesh2d_interface_z"] = (("mesh2d_nInterfaces",), z_interface)
+    uds = xu.UgridDataset(ds)
+    return uds
+
+
+@pytest.mark.unittest
+@pytest.mark.parametrize("chunked", [pytest.param(False, id='numpy'), pytest.param(True, id='dask')])
+def test_reconstruct_zw_zcc_fromz_input_unmodified(chunked):
+    from dfm_tools.get_nc import _ZW_ZCC_CACHE
+    dfmt.clear_zw_zcc_cache()
+    uds = get_uds_structured_3d_z()
+    if chunked:
+        uds = uds.chunk({'time':1})
+    interface_z_input = uds["mesh2d_interface_z"].to_numpy().copy()
+    
+    # the top interface is raised to the maximum waterlevel in the reconstruction only
+    uds_zw = dfmt.reconstruct_zw_zcc(uds)
+    assert "mesh2d_flowelem_zw" not in uds.variables
+    assert np.array_equal(uds["mesh2d_interface_z"].to_numpy(), interface_z_input)
+    zw_top = uds_zw.mesh2d_flowelem_zw.max(dim="mesh2d_nInterfaces")
+    assert np.allclose(zw_top, uds.mesh2d_s1)
+    assert id(uds.obj) in _ZW_ZCC_CACHE
+    
+    # the input is unchanged, so the second call is retrieved from the cache
+    uds_zw_cached = dfmt.reconstruct_zw_zcc(uds)
+    assert uds_zw_cached.mesh2d_flowelem_zw.data is uds_zw.mesh2d_flowelem_zw.data
+    assert np.array_equal(uds["mesh2d_interface_z"].to_numpy(), interface_z_input)
+
+
+@pytest.mark.unittest
+def test_reconstruct_zw_zcc_cache():
+    import gc
+    from dfm_tools.get_nc import _ZW_ZCC_CACHE
+    dfmt.clear_zw_zcc_cache()
+    uds = get_uds_structured_3d_sigma()
+    
+    uds_zw = dfmt.reconstruct_zw_zcc(uds)
+    assert "mesh2d_flowelem_zw" in uds_zw.variables
+    assert "mesh2d_flowelem_zw" not in uds.variables
+    assert id(uds.obj) in _ZW_ZCC_CACHE
+    
+    # retrieved from cache
+    uds_zw_cached = dfmt.reconstruct_zw_zcc(uds)
+    assert uds_zw_cached.mesh2d_flowelem_zw.data is uds_zw.mesh2d_flowelem_zw.data
+    xr.testing.assert_identical(uds_zw_cached.obj, uds_zw.obj)
+    
+    # invalidate after modifying the input dataset in place
+    uds["mesh2d_s1"] = uds["mesh2d_s1"] + 1
+    dfmt.clear_zw_zcc_cache(uds)
+    assert id(uds.obj) not in _ZW_ZCC_CACHE
+    uds_zw_new = dfmt.reconstruct_zw_zcc(uds)
+    assert np.allclose(uds_zw_new.mesh2d_flowelem_zw.isel(mesh2d_nInterfaces=-1), uds_zw.mesh2d_flowelem_zw.isel(mesh2d_nInterfaces=-1) + 1)
+    
+    # cache entry is removed when the input dataset is garbage collected
+    del uds
+    gc.collect()
+    assert len(_ZW_ZCC_CACHE) == 0
+
+
+@pytest.mark.unittest
+@pytest.mark.parametrize("chunked", [pytest.param(False, id='numpy'), pytest.param(True, id='dask')])
+def test_reconstruct_zw_zcc_cache_modified_inplace(chunked):
+    dfmt.clear_zw_zcc_cache()
+    uds = get_uds_structured_3d_sigma()
+    if chunked:
+        uds = uds.chunk({'time':1})
+    uds_atdepth = dfmt.get_Dataset_atdepths(uds, depths=-2)
+    assert not (uds_atdepth['mesh2d_sa1'].fillna(0) == 0).all()
+    
+    # modifying the input dataset invalidates the cached zw/zcc values without clearing the cache
+    uds['mesh2d_s1'] += 3
+    uds['mesh2d_sa1'] *= 0
+    uds_atdepth_new = dfmt.get_Dataset_atdepths(uds, depths=-2)
+    assert (uds_atdepth_new['mesh2d_sa1'].fillna(0) == 0).all()
+    uds_zw = dfmt.reconstruct_zw_zcc(uds)
+    assert np.allclose(uds_zw.mesh2d_flowelem_zw.isel(mesh2d_nInterfaces=-1), uds.mesh2d_s1)
+    
+    # only modifying a variable that zw/zcc are not derived from reuses the cached zw/zcc
+    uds['mesh2d_sa1'] += 1
+    uds_zw_cached = dfmt.reconstruct_zw_zcc(uds)
+    assert uds_zw_cached.mesh2d_flowelem_zw.data is uds_zw.mesh2d_flowelem_zw.data
+    assert (uds_zw_cached['mesh2d_sa1'] == 1).all()
+
+
+@pytest.mark.unittest
+def test_rasterizer(tmp_path):
+    uds = get_uds_structured_3d_sigma()
+    rasterizer = dfmt.Rasterizer(uds.grid, resolution=37)
+    ds_expected = dfmt.rasterize_ugrid(uds, resolution=37)
+    
+    # lazy for time-chunked datasets and equal to rasterize_ugrid
+    ds_raster = rasterizer.rasterize(uds.chunk({"time":1}))
+    assert ds_raster.mesh2d_sa1.chunks is not None
+    assert "mesh2d_nNodes" not in ds_raster.dims
+    assert rasterizer.shape == (81, 108)
+    for varn in ["mesh2d_s1", "mesh2d_flowelem_bl", "mesh2d_sa1"]:
+        assert ds_raster[varn].dims == ds_expected[varn].dims
+        assert np.array_equal(ds_raster[varn].to_numpy(), ds_expected[varn].to_numpy(), equal_nan=True)
+    
+    # reuse from disk for a dataarray
+    file_nc = tmp_path / "rasterizer.nc"
+    rasterizer.to_netcdf(file_nc)
+    rasterizer_fromfile = dfmt.Rasterizer.from_netcdf(file_nc)
+    da_raster = rasterizer_fromfile.rasterize(uds["mesh2d_s1"])
+    assert np.array_equal(da_raster.to_numpy(), ds_expected["mesh2d_s1"].to_numpy(), equal_nan=True)
+    
+    with pytest.raises(ValueError) as e:
+        rasterizer.rasterize(get_uds_structured_2d().ugrid.sel(x=slice(0,2000)))
+    assert "but the rasterizer was derived for a grid with 1200 faces" in str(e.value)
+
+
+@pytest.mark.unittest
+def test_rasterize_ugrid_tiled(tmp_path):
+    uds = get_uds_structured_3d_sigma()
+    ds_expected = dfmt.Rasterizer(uds.grid, resolution=37).rasterize(uds)
+    for file_out in [tmp_path / "raster.zarr", tmp_path / "raster.nc"]:
+        # small tiles and memory budget, so multiple tiles and timestep batches are written 
+        # and the face index of the tiles is derived again for each batch
+        ds_raster = dfmt.rasterize_ugrid_tiled(uds, file_out, resolution=37, tile_size=32, max_memory_mb=0.01)
+        assert ds_raster.mesh2d_sa1.chunks[1] == (32, 32, 17)
+        for varn in ["mesh2d_s1", "mesh2d_flowelem_bl", "mesh2d_sa1"]:
+            assert ds_raster[varn].dims == ds_expected[varn].dims
+            assert np.array_equal(ds_raster[varn].to_numpy(), ds_expected[varn].to_numpy(), equal_nan=True)
+        
+        with pytest.raises(FileExistsError):
+            dfmt.rasterize_ugrid_tiled(uds, file_out, resolution=37)
+
+
+@pytest.mark.unittest
+def test_rasterize_ugrid_tiled_reads_once(tmp_path):
+    """
+    merged datasets have one chunk along the face dimension, each chunk 
+    should be read once per batch of timesteps instead of once per tile
+    """
+    uds = get_uds_structured_2d().chunk({"time":1, "mesh2d_nFaces":-1})
+    nreads = {"count":0}
+    def count_reads(block):
+        nreads["count"] += 1
+        return block
+    uds["mesh2d_s1"] = uds["mesh2d_s1"].copy(data=uds["mesh2d_s1"].data.map_blocks(count_reads))
+    ds_expected = dfmt.Rasterizer(uds.grid, resolution=37).rasterize(uds.compute())
+    nreads["count"] = 0
+    
+    ds_raster = dfmt.rasterize_ugrid_tiled(uds, tmp_path / "raster.zarr", resolution=37, tile_size=32)
+    assert ds_raster.mesh2d_s1.chunks[1:] == ((32, 32, 17), (32, 32, 32, 12))
+    assert nreads["count"] == uds.sizes["time"]
+    assert np.array_equal(ds_raster.mesh2d_s1.to_numpy(), ds_expected.mesh2d_s1.to_numpy(), equal_nan=True)
+
+
+@pytest.mark.unittest
+def test_conservative_regridder(tmp_path):
+    uds = get_uds_structured_3d_sigma()
+    # raster cells of 500x500m cover exactly 5x5 faces of 100x100m
+    ds_like = xr.Dataset(coords={"x":np.arange(250,4000,500), "y":np.arange(250,3000,500)})
+    regridder = dfmt.ConservativeRegridder(uds.grid, ds_like=ds_like)
+    ds_regrid = regridder.regrid(uds.chunk({"time":1}))
+    assert ds_regrid.mesh2d_s1.chunks is not None
+    assert ds_regrid.mesh2d_sa1.dims == ("time", "y", "x", "mesh2d_nLayers")
+    
+    s1_expected = uds.mesh2d_s1.to_numpy().reshape(3,6,5,8,5).mean(axis=(2,4))
+    assert np.allclose(ds_regrid.mesh2d_s1.to_numpy(), s1_expected)
+    # the total is conserved
+    assert np.allclose(ds_regrid.mesh2d_s1.sum(dim=["x","y"]) * 25, uds.mesh2d_s1.sum(dim=uds.grid.face_dimension))
+    
+    # reuse from disk for a dataarray
+    file_nc = tmp_path / "weights.nc"
+    regridder.to_netcdf(file_nc)
+    regridder_fromfile = dfmt.ConservativeRegridder.from_netcdf(file_nc)
+    assert regridder.shape == (6, 8)
+    assert regridder_fromfile.shape == (6, 8)
+    assert np.array_equal(regridder_fromfile.x, ds_like.x.to_numpy())
+    assert np.array_equal(regridder_fromfile.y, ds_like.y.to_numpy())
+    da_regrid = regridder_fromfile.regrid(uds["mesh2d_sa1"])
+    assert np.allclose(da_regrid.to_numpy(), ds_regrid.mesh2d_sa1.to_numpy())
+
+
+@pytest.mark.unittest
+def test_slice_transects():
+    import geopandas as gpd
+    from shapely.geometry import LineString
+    lines = {"crs1":np.array([[400, 600], [2000, 1800], [3600, 900]]),
+             "crs2":np.array([[100, 2900], [3900, 100]]),
+             "outside":np.array([[5000, 5000], [6000, 6000]])}
+    gdf = gpd.GeoDataFrame({"name":list(lines.keys())}, geometry=[LineString(x) for x in lines.values()])
+    for uds in [get_uds_structured_2d(), get_uds_structured_3d_sigma()]:
+        transects = dfmt.get_transects(uds.grid, gdf)
+        assert list(transects.keys()) == ["crs1", "crs2"]
+        ds_crs_all = dfmt.slice_transects(uds, transects)
+        assert ds_crs_all.sizes["ncrossed_faces"] == len(transects["crs1"]) + len(transects["crs2"])
+        for name in ["crs1", "crs2"]:
+            transect = dfmt.Transect(uds.grid, lines[name])
+            assert np.array_equal(transects[name].face_index, transect.face_index)
+            ds_crs = ds_crs_all.sel(transect=name).drop_vars("transect")
+            ds_crs_expected = transect.slice_time(uds)
+            xr.testing.assert_identical(ds_crs, ds_crs_expected)
+            uds_crs = transects[name].to_ugrid(ds_crs.isel(time=0))
+            assert uds_crs.grid.n_face == ds_crs_expected.isel(time=0).crs_z_top.size
+    
+    with pytest.raises(ValueError) as e:
+        dfmt.get_transects(uds.grid, {"outside":lines["outside"]})
+    assert "none of the polylines cross mapdata" in str(e.value)
+
+
+@pytest.mark.unittest
+def test_pointextractor():
+    uds = get_uds_structured_3d_sigma()
+    x = np.array([150, 2050, 3990, 5000])
+    y = np.array([150, 1050, 2990, 5000])
+    extractor = dfmt.PointExtractor(uds.grid, x=x, y=y, names=["stat1", "stat2", "stat3", "outside"])
+    assert len(extractor) == 4
+    ds_his = extractor.extract(uds.chunk({"time":1}), time_chunk=3)
+    assert ds_his.waterlevel.dims == ("time", "stations")
+    assert ds_his.mesh2d_sa1.dims == ("time", "stations", "laydim")
+    assert ds_his.zcoordinate_w.dims == ("time", "stations", "laydimw")
+    assert ds_his.waterlevel.chunks == ((3,), (4,))
+    assert ds_his.station_name.to_numpy().tolist() == ["stat1", "stat2", "stat3", "outside"]
+    
+    ds_expected = uds.ugrid.sel_points(x=x[:3], y=y[:3])
+    assert np.array_equal(ds_his.waterlevel.isel(stations=slice(0,3)).to_numpy(), ds_expected.mesh2d_s1.to_numpy())
+    assert np.array_equal(ds_his.mesh2d_sa1.isel(stations=slice(0,3)).to_numpy(), ds_expected.mesh2d_sa1.to_numpy())
+    assert ds_his.waterlevel.isel(stations=-1).isnull().all()
+    
+    # his-like dataset can be sliced at depths
+    ds_atdepths = dfmt.get_Dataset_atdepths(ds_his, depths=[-4,-1])
+    assert ds_atdepths.mesh2d_sa1.dims == ("time", "stations", "depth_from_z0")
+
+
+@pytest.mark.unittest
+def test_pointextractor_unknown_layertype(caplog):
+    uds = get_uds_structured_3d_sigma()
+    uds = uds.drop_vars(["mesh2d_layer_sigma", "mesh2d_interface_sigma"])
+    extractor = dfmt.PointExtractor(uds.grid, x=np.array([150]), y=np.array([150]))
+    with caplog.at_level("WARNING"):
+        ds_his = extractor.extract(uds)
+    assert "zcoordinates could not be reconstructed, continuing without them" in caplog.text
+    assert "zcoordinate_w" not in ds_his.variables
+    assert ds_his.mesh2d_sa1.dims == ("time", "stations", "laydim")
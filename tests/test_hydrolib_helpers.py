@@ -8,6 +8,8 @@ Created on Fri Oct 20 16:09:20 2023
 import os
 import pytest
 import numpy as np
+import pandas as pd
+import xarray as xr
 import geopandas as gpd
 import dfm_tools as dfmt
 import hydrolib.core.dflowfm as hcdfm
@@ -189,3 +191,60 @@ def test_read_polyfile_as_gdf_points_linestrings(tmp_path):
     assert np.allclose(line0_geom.xy[1], reference_y)
     assert 'name' in gdf_lines.columns
     assert gdf_lines['name'].tolist() == reference_names
+
+
+@pytest.mark.unittest
+def test_ForcingFileIndex(tmp_path):
+    """
+    reading a bc file directly with ForcingFileIndex should result in the 
+    same dataset as parsing it with hydrolib-core
+    """
+    ncbnd_construct = get_ncbnd_construct()
+    dimn_point = ncbnd_construct['dimn_point']
+    dimn_depth = ncbnd_construct['dimn_depth']
+    varn_depth = ncbnd_construct['varn_depth']
+    varn_pointname = ncbnd_construct['varn_pointname']
+    
+    npoints, ntimes, ndepths = 3, 5, 4
+    times = pd.date_range('2020-01-01', periods=ntimes, freq='h')
+    data = np.random.default_rng(0).random((npoints, ntimes, ndepths))
+    data[:,:,-1] = np.nan # deepest layer is bfilled/ffilled and converted back with convertnan
+    ds = xr.Dataset()
+    ds['salinitybnd'] = xr.DataArray(data, dims=(dimn_point, 'time', dimn_depth), attrs={'units':'1e-3'})
+    ds = ds.assign_coords({'time':times, varn_depth:([dimn_depth], [0., -1., -2., -3.]),
+                           varn_pointname:([dimn_point], [f'bnd_{i+1:04d}' for i in range(npoints)])})
+    ds.time.encoding['units'] = 'minutes since 2020-01-01 00:00:00'
+    file_bc = tmp_path / "salinity.bc"
+    dfmt.plipointsDataset_to_bc(ds, file_bc)
+    
+    forcingmodel = hcdfm.ForcingModel(file_bc)
+    forcingfile_index = dfmt.ForcingFileIndex(file_bc)
+    assert len(forcingfile_index) == npoints
+    assert forcingfile_index.names == ['bnd_0001', 'bnd_0002', 'bnd_0003']
+    for convertnan in [False, True]:
+        ds_hydrolib = dfmt.ForcingModel_to_plipointsDataset(forcingmodel, convertnan=convertnan)
+        ds_index = dfmt.ForcingModel_to_plipointsDataset(file_bc, convertnan=convertnan)
+        xr.testing.assert_identical(ds_hydrolib, ds_index)
+        assert ds_hydrolib.time.encoding['units'] == ds_index.time.encoding['units']
+    assert ds_index['salinitybnd'].isel({dimn_depth:-1}).isnull().all()
+    
+    # lazy access of a single block
+    ds_onepoint = forcingfile_index.get_Dataset(1)
+    ds_onepoint_hydrolib = dfmt.forcinglike_to_Dataset(forcingmodel.forcing[1])
+    xr.testing.assert_identical(ds_onepoint, ds_onepoint_hydrolib)
+    
+    ds_index_sub = dfmt.ForcingModel_to_plipointsDataset(file_bc, npoints=2)
+    assert ds_index_sub.sizes[dimn_point] == 2
+    
+    # different times per block falls back to concatenating a dataset per point
+    file_bc_othertimes = tmp_path / "salinity_othertimes.bc"
+    ds_othertimes = ds.isel({dimn_point:[2]}).assign_coords(time=times + pd.Timedelta(minutes=30))
+    ds_othertimes.time.encoding['units'] = 'minutes since 2020-01-01 00:00:00'
+    forcingmodel_othertimes = hcdfm.ForcingModel()
+    forcingmodel_othertimes.forcing = dfmt.plipointsDataset_to_ForcingModel(ds.isel({dimn_point:[0]})).forcing
+    forcingmodel_othertimes.forcing += dfmt.plipointsDataset_to_ForcingModel(ds_othertimes).forcing
+    forcingmodel_othertimes.save(file_bc_othertimes)
+    ds_hydrolib = dfmt.ForcingModel_to_plipointsDataset(hcdfm.ForcingModel(file_bc_othertimes))
+    ds_index = dfmt.ForcingModel_to_plipointsDataset(file_bc_othertimes)
+    xr.testing.assert_identical(ds_hydrolib, ds_index)
+    assert ds_index.sizes['time'] == 2 * ntimes
@@ -23,7 +23,7 @@ from dfm_tools.interpolate_grid2bnd import (tidemodel_componentlist,
                                             ds_apply_conversion_dict,
                                             open_prepare_dataset,
                                             )
-from dfm_tools.hydrolib_helpers import get_ncbnd_construct
+from dfm_tools.hydrolib_helpers import get_ncbnd_construct, da_from_gdf_points
 import hydrolib.core.dflowfm as hcdfm
 from dfm_tools.errors import OutOfRangeError
 import warnings
@@ -248,6 +248,79 @@ def test_plipointsDataset_to_ForcingModel_drop_allnan_points():
     assert forcingmodel_object.forcing[1].name == 'abc_bnd_0004'
 
 
+@pytest.mark.unittest
+def test_plipointsDataset_to_bc(tmp_path):
+    """
+    the streaming bc writer should result in exactly the same file as 
+    plipointsDataset_to_ForcingModel() followed by ForcingModel.save()
+    """
+    ncbnd_construct = get_ncbnd_construct()
+    dimn_point = ncbnd_construct['dimn_point']
+    varn_pointname = ncbnd_construct['varn_pointname']
+    
+    ds = cmems_dataset_4times().isel(longitude=0)
+    ds = ds.rename({'latitude':dimn_point, 'depth':'z'})
+    ds[varn_pointname] = xr.DataArray([f'bnd_{i+1:04d}' for i in range(ds.sizes[dimn_point])], dims=dimn_point)
+    ds = ds.set_coords(varn_pointname).drop_vars(dimn_point)
+    ds['so'] = ds['so'].assign_attrs({'units':'1e-3'})
+    ds['so'][{dimn_point:1}] = np.nan # all-nan point is skipped
+    ds.time.encoding['units'] = 'hours since 2020-01-01 00:00:00'
+    
+    for ds_one in [ds, ds.chunk({dimn_point:1}), ds[['so']].isel(z=0, drop=True)]:
+        file_bc_hydrolib = tmp_path / "hydrolib.bc"
+        file_bc_dfmt = tmp_path / "dfmt.bc"
+        ForcingModel_object = dfmt.plipointsDataset_to_ForcingModel(ds_one)
+        ForcingModel_object.save(file_bc_hydrolib)
+        dfmt.plipointsDataset_to_bc(ds_one, file_bc_dfmt, max_memory_mb=1e-6)
+        with open(file_bc_hydrolib) as f:
+            bc_hydrolib = f.read()
+        with open(file_bc_dfmt) as f:
+            bc_dfmt = f.read()
+        assert bc_hydrolib == bc_dfmt
+        assert "bnd_0002" not in bc_dfmt
+
+
+@pytest.mark.unittest
+def test_plipointsDataset_to_bc_extmodel_roundtrip(tmp_path):
+    """
+    saving an ExtModel (with the default recurse=False) should not overwrite the bc file 
+    written by plipointsDataset_to_bc and the bc file should be readable via the ext file
+    """
+    ncbnd_construct = get_ncbnd_construct()
+    dimn_point = ncbnd_construct['dimn_point']
+    varn_pointname = ncbnd_construct['varn_pointname']
+    
+    ds = cmems_dataset_4times().isel(longitude=0)
+    ds = ds.rename({'latitude':dimn_point, 'depth':'z'})
+    ds[varn_pointname] = xr.DataArray([f'bnd_{i+1:04d}' for i in range(ds.sizes[dimn_point])], dims=dimn_point)
+    ds = ds.set_coords(varn_pointname).drop_vars(dimn_point)
+    ds['so'] = ds['so'].assign_attrs({'units':'1e-3'})
+    ds.time.encoding['units'] = 'hours since 2020-01-01 00:00:00'
+    
+    file_bc = tmp_path / "bnd.bc"
+    ForcingModel_ondisk = dfmt.plipointsDataset_to_bc(ds, file_bc)
+    assert len(ForcingModel_ondisk.forcing) == 0
+    with open(file_bc) as f:
+        bc_written = f.read()
+    
+    boundary_object = hcdfm.Boundary(quantity='salinitybnd', locationfile='bnd.pli', forcingfile=ForcingModel_ondisk)
+    ext_new = hcdfm.ExtModel(boundary=[boundary_object])
+    file_ext = tmp_path / "bnd.ext"
+    ext_new.save(file_ext)
+    with open(file_bc) as f:
+        assert f.read() == bc_written
+    
+    with open(file_ext) as f:
+        ext_written = f.read()
+    assert "bnd.bc" in ext_written
+    
+    # reload the ext file, this also parses the bc file
+    ext_reloaded = hcdfm.ExtModel(file_ext)
+    forcing_reloaded = ext_reloaded.boundary[0].forcingfile.forcing
+    assert len(forcing_reloaded) == ds.sizes[dimn_point]
+    assert [forcing.name for forcing in forcing_reloaded] == ds[varn_pointname].to_numpy().tolist()
+
+
 @pytest.mark.systemtest
 def test_open_prepare_dataset_correctdepths(tmp_path):
     """
@@ -262,6 +335,40 @@ def test_open_prepare_dataset_correctdepths(tmp_path):
     assert len(ds_moretime_import.time) == 2
 
 
+@pytest.mark.unittest
+def test_open_prepare_dataset_bbox(tmp_path):
+    """
+    subsetting to the bbox of the points upon opening should give the same 
+    interpolation results, also for 0 to 360 sources with points around 0
+    """
+    ds_notime = xr.Dataset()
+    lons = np.arange(0, 360, 1.)
+    lats = np.arange(-60, 61, 1.)
+    so_np = np.random.default_rng(0).random((len(lats), len(lons))) * 35
+    so_np[::7, ::5] = np.nan
+    ds_notime['so'] = xr.DataArray(so_np, dims=('latitude','longitude'), coords={'latitude':lats, 'longitude':lons})
+    for itime in range(2):
+        ds_onetime = ds_notime.expand_dims(time=[pd.Timestamp('2020-01-01') + pd.Timedelta(days=itime)])
+        ds_onetime.to_netcdf(tmp_path / f'temp_global360_{itime}.nc')
+    file_nc = tmp_path / 'temp_global360_*.nc'
+    
+    pointx = np.array([-2.5, -1, 0, 0.3, 3])
+    pointy = np.array([50, 50.5, 51, 52.7, 53])
+    gdf_points = gpd.GeoDataFrame({'station_id':[f'point{i}' for i in range(len(pointx))]},
+                                  geometry=gpd.points_from_xy(pointx, pointy), crs='EPSG:4326')
+    
+    kwargs = dict(dir_pattern=file_nc, quantity='salinitybnd', tstart='2020-01-01', tstop='2020-01-02')
+    data_xr_full = open_prepare_dataset(**kwargs)
+    data_xr_bbox = open_prepare_dataset(**kwargs, bbox=gdf_points.total_bounds)
+    assert data_xr_bbox.sizes['longitude'] == 8
+    assert data_xr_bbox.sizes['latitude'] == 6
+    assert (data_xr_bbox.longitude.to_numpy() == np.arange(-3, 5, 1.)).all()
+    
+    data_interp_full = dfmt.interp_regularnc_to_plipointsDataset(data_xr_reg=data_xr_full, gdf_points=gdf_points)
+    data_interp_bbox = dfmt.interp_regularnc_to_plipointsDataset(data_xr_reg=data_xr_bbox, gdf_points=gdf_points)
+    xr.testing.assert_identical(data_interp_full, data_interp_bbox)
+
+
 @pytest.mark.unittest
 def test_ds_apply_conventions():
     # generate datset with depths defined positive down
@@ -439,6 +546,77 @@ def test_interp_regularnc_to_plipointsDataset_checkvardimnames():
     assert dimn_inda == dimn_expected
 
 
+@pytest.mark.unittest
+def test_interp_regularnc_to_plipointsDataset_weights():
+    """
+    the precomputed sparse weights should give the same result as the 
+    combination of linear and nearest xarray interpolation, also for points 
+    on grid nodes/edges, descending latitudes and dask arrays
+    """
+    ncbnd_construct = get_ncbnd_construct()
+    varn_pointx = ncbnd_construct['varn_pointx']
+    varn_pointy = ncbnd_construct['varn_pointy']
+    varn_pointname = ncbnd_construct['varn_pointname']
+    
+    ds = cmems_dataset_notime()
+    ds['zos'] = ds['so'].isel(depth=1, drop=True)
+    ds = ds.isel(latitude=slice(None,None,-1)).chunk({'depth':2})
+    
+    xpoints = [-9.6, -9.55, -9.5, -9.43, -9.4, -9.48]
+    ypoints = [42.9, 43.05, 43.0, 42.98, 43.1, 43.07]
+    geom = shapely.points(xpoints, ypoints)
+    gdf = gpd.GeoDataFrame(data={varn_pointname:[f'name_{i+1:04d}' for i in range(len(xpoints))]}, geometry=geom)
+    da_plipoints = da_from_gdf_points(gdf)
+    
+    data_interp = dfmt.interp_regularnc_to_plipointsDataset(ds, gdf, load=False)
+    assert data_interp['so'].chunks is not None
+    
+    interp_kwargs = dict(longitude=da_plipoints[varn_pointx], latitude=da_plipoints[varn_pointy])
+    data_interp_lin = ds.interp(**interp_kwargs, method='linear')
+    data_interp_near = ds.interp(**interp_kwargs, method='nearest')
+    data_interp_expected = data_interp_lin.combine_first(data_interp_near).drop_vars(['latitude','longitude'])
+    xr.testing.assert_allclose(data_interp.load(), data_interp_expected.load())
+    for varname in data_interp.data_vars:
+        np.testing.assert_allclose(data_interp[varname], data_interp_expected[varname])
+        assert data_interp[varname].attrs == data_interp_expected[varname].attrs
+    
+    gdf_outbounds = gpd.GeoDataFrame(data={varn_pointname:['name_0001']}, geometry=shapely.points([-9.7], [43]))
+    with pytest.raises(ValueError) as e:
+        dfmt.interp_regularnc_to_plipointsDataset(ds, gdf_outbounds, load=False)
+    assert "1 of requested pli points are out of bounds" in str(e.value)
+
+
+@pytest.mark.unittest
+def test_interp_regularnc_to_plipointsDataset_weights_cache(tmp_path):
+    ncbnd_construct = get_ncbnd_construct()
+    varn_pointname = ncbnd_construct['varn_pointname']
+    
+    ds = cmems_dataset_notime()
+    geom = shapely.points([-9.55, -9.43], [43.05, 42.98])
+    gdf = gpd.GeoDataFrame(data={varn_pointname:['name_0001','name_0002']}, geometry=geom)
+    
+    data_interp_nocache = dfmt.interp_regularnc_to_plipointsDataset(ds, gdf)
+    data_interp = dfmt.interp_regularnc_to_plipointsDataset(ds, gdf, weights_cache=tmp_path)
+    file_list_cache = list(tmp_path.glob("interp_weights_*.nc"))
+    assert len(file_list_cache) == 1
+    
+    # second call reads the weights from the cache, also for other variables/depths and point names
+    ds_other = ds.isel(depth=slice(0,3)).rename({'so':'thetao'})
+    gdf_other = gdf.copy()
+    gdf_other[varn_pointname] = ['other_0001','other_0002']
+    data_interp_other = dfmt.interp_regularnc_to_plipointsDataset(ds_other, gdf_other, weights_cache=tmp_path)
+    assert len(list(tmp_path.glob("interp_weights_*.nc"))) == 1
+    assert (data_interp_other[varn_pointname] == ['other_0001','other_0002']).all()
+    xr.testing.assert_identical(data_interp, data_interp_nocache)
+    xr.testing.assert_identical(data_interp_other['thetao'].drop_vars(varn_pointname), 
+                                data_interp['so'].isel(depth=slice(0,3)).drop_vars(varn_pointname).rename('thetao'))
+    
+    # other points result in a new cache file
+    gdf_moved = gdf.set_geometry(shapely.points([-9.56, -9.43], [43.05, 42.98]))
+    dfmt.interp_regularnc_to_plipointsDataset(ds, gdf_moved, weights_cache=tmp_path)
+    assert len(list(tmp_path.glob("interp_weights_*.nc"))) == 2
+
+
 @pytest.mark.systemtest
 @pytest.mark.requireslocaldata
 def test_interpolate_tide_to_plipoints():
@@ -6,8 +6,12 @@ Created on Tue Jan 23 17:12:48 2024
 """
 
 import pytest
+import warnings
 import dfm_tools as dfmt
 import pandas as pd
+import numpy as np
+import xarray as xr
+import os
 
 #TODO: many xarray_helpers tests are still in test_dfm_tools.py
 
@@ -26,3 +30,42 @@ def test_merge_meteofiles(file_nc_era5_pattern):
     assert ds.time.to_pandas().iloc[0] == pd.Timestamp('2010-01-30')
     assert ds.time.to_pandas().iloc[-1] == pd.Timestamp('2010-02-01 23:00')
     assert "msl" in ds.data_vars
+
+
+@pytest.mark.unittest
+def test_get_chunks(tmp_path):
+    ds = xr.Dataset()
+    ds["var"] = xr.DataArray(np.zeros((100, 1000, 5), dtype="float64"), dims=("time","face","layer"))
+    ds["bl"] = xr.DataArray(np.zeros((1000), dtype="float64"), dims=("face"))
+    file_nc = os.path.join(tmp_path, "chunks.nc")
+    ds.to_netcdf(file_nc)
+    # 40000 bytes per timestep, 0.2 MB
+    target_mb = 0.2
+    
+    chunks_snapshot = dfmt.get_chunks(file_nc, access_pattern="map snapshot", target_mb=target_mb)
+    assert chunks_snapshot == {"time":1, "face":1000, "layer":-1}
+    chunks_reduction = dfmt.get_chunks(file_nc, access_pattern="time reduction", target_mb=target_mb)
+    assert chunks_reduction == {"time":5, "face":1000, "layer":-1}
+    chunks_series = dfmt.get_chunks(file_nc, access_pattern="time series", target_mb=target_mb)
+    assert chunks_series == {"time":100, "face":52, "layer":-1}
+    
+    with pytest.raises(ValueError) as e:
+        dfmt.get_chunks(file_nc, access_pattern="nonexistent")
+    assert "access_pattern should be one of" in str(e.value)
+
+
+@pytest.mark.unittest
+@pytest.mark.parametrize("access_pattern", ["map snapshot", "time series", "time reduction"])
+def test_get_chunks_notimes(tmp_path, access_pattern):
+    """
+    a file without timesteps, like at the start of a running simulation
+    """
+    ds = xr.Dataset()
+    ds["var"] = xr.DataArray(np.zeros((0, 10), dtype="float64"), dims=("time","face"))
+    file_nc = os.path.join(tmp_path, "chunks_notimes.nc")
+    ds.to_netcdf(file_nc, unlimited_dims=["time"])
+    
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", category=RuntimeWarning)
+        chunks = dfmt.get_chunks(file_nc, access_pattern=access_pattern)
+    assert chunks == {"time":1, "face":-1}
@@ -11,8 +11,12 @@ import xarray as xr
 import xugrid as xu
 import dfm_tools as dfmt
 import numpy as np
+import netCDF4
 from dfm_tools.xugrid_helpers import (remove_unassociated_edges,
-                                      get_vertical_dimensions
+                                      get_vertical_dimensions,
+                                      decode_default_fillvals,
+                                      get_associated_edges,
+                                      connectivity_to_numpy,
                                       )
 
 #TODO: many xugrid_helpers tests are still in test_dfm_tools.py
@@ -30,6 +34,30 @@ def test_remove_unassociated_edges():
     assert ds2_edgedimsize == ds_edgedimsize-1
 
 
+@pytest.mark.unittest
+def test_get_associated_edges():
+    # one quad and one triangle, with a hanging edge and a duplicate (reversed) edge
+    face_node_connectivity = np.array([[0, 1, 4, 3],
+                                       [1, 2, 4, -1]])
+    edge_node_connectivity = np.array([[0, 1], [1, 4], [4, 3], [3, 0],
+                                       [1, 2], [2, 4], [3, 5], [4, 1]])
+    associated = get_associated_edges(face_node_connectivity, edge_node_connectivity)
+
+    grid = xu.Ugrid2d(node_x=np.array([0, 1, 2, 0, 1, 0.5]), node_y=np.array([0, 0, 0, 1, 1, 2]),
+                      fill_value=-1, face_node_connectivity=face_node_connectivity,
+                      edge_node_connectivity=edge_node_connectivity)
+    associated_xu = grid.validate_edge_node_connectivity()
+
+    assert associated.tolist() == [True, True, True, True, True, True, False, False]
+    assert np.array_equal(associated, associated_xu)
+
+    # one-based raw connectivity with fill value, and decoded connectivity with nan
+    fnc_raw = np.where(face_node_connectivity==-1, -999, face_node_connectivity + 1)
+    fnc_decoded = np.where(face_node_connectivity==-1, np.nan, face_node_connectivity)
+    assert np.array_equal(connectivity_to_numpy(fnc_raw, fill_value=-999, start_index=1), face_node_connectivity)
+    assert np.array_equal(connectivity_to_numpy(fnc_decoded), face_node_connectivity)
+
+
 @pytest.mark.unittest
 def test_remove_nan_fillvalue_attrs(tmp_path):
     """
@@ -66,6 +94,37 @@ def test_remove_nan_fillvalue_attrs(tmp_path):
     assert count_dfmt == 0
 
 
+@pytest.mark.unittest
+def test_decode_default_fillvals(tmp_path):
+    """
+    only the variables without _FillValue attribute should be decoded again,
+    the other variables should be kept as they are
+    """
+    from netCDF4 import Dataset, default_fillvals
+    file_nc = os.path.join(tmp_path, "temp_default_fillvals.nc")
+    with Dataset(file_nc, "w") as ncfile:
+        ncfile.createDimension("face", 4)
+        var_default = ncfile.createVariable("var_default", "f8", ("face",), fill_value=False)
+        var_default[:] = [1, 2, default_fillvals["f8"], 4]
+        var_int = ncfile.createVariable("var_int", "i4", ("face",), fill_value=False)
+        var_int[:] = [1, default_fillvals["i4"], 3, 4]
+        var_explicit = ncfile.createVariable("var_explicit", "f8", ("face",), fill_value=-999.)
+        var_explicit[:] = [1, -999., 3, 4]
+
+    ds = xr.open_dataset(file_nc, chunks={})
+    ds_decoded = decode_default_fillvals(ds)
+
+    assert ds_decoded["var_default"].isnull().values.tolist() == [False, False, True, False]
+    assert ds_decoded["var_int"].isnull().values.tolist() == [False, True, False, False]
+    assert ds_decoded["var_default"].encoding["_FillValue"] == default_fillvals["f8"]
+    assert ds_decoded["var_int"].encoding["_FillValue"] == default_fillvals["i4"]
+    # the variable with an explicit _FillValue is not decoded again
+    assert ds_decoded["var_explicit"].variable._data is ds["var_explicit"].variable._data
+    assert ds_decoded["var_explicit"].isnull().values.tolist() == [False, True, False, False]
+    # the input dataset is not altered
+    assert "_FillValue" not in ds["var_default"].encoding
+
+
 @pytest.mark.unittest
 def test_uds_auto_set_crs_cartesian():
     file_nc = dfmt.data.fm_grevelingen_map(return_filepath=True).replace('0*','0002')
@@ -220,3 +279,234 @@ def test_open_dataset_curvilinear():
     
     # check if all zero-sized cells were dropped: https://github.com/Deltares/dfm_tools/issues/926
     assert (uds.grid.area > 0).all()
+
+
+@pytest.mark.unittest
+def test_open_partitioned_dataset_parallel():
+    file_nc = dfmt.data.fm_grevelingen_map(return_filepath=True)
+    uds_serial = dfmt.open_partitioned_dataset(file_nc)
+    uds_thread = dfmt.open_partitioned_dataset(file_nc, parallel=True, max_workers=2)
+    
+    assert uds_serial.grid.n_face == uds_thread.grid.n_face
+    assert list(uds_serial.variables) == list(uds_thread.variables)
+    s1_serial = uds_serial.mesh2d_s1.isel(time=-1).to_numpy()
+    s1_thread = uds_thread.mesh2d_s1.isel(time=-1).to_numpy()
+    assert np.array_equal(s1_serial, s1_thread, equal_nan=True)
+
+
+@pytest.mark.unittest
+def test_open_partitioned_dataset_parallel_invalid():
+    file_nc = dfmt.data.fm_grevelingen_map(return_filepath=True)
+    with pytest.raises(ValueError) as e:
+        dfmt.open_partitioned_dataset(file_nc, parallel="nonexistent")
+    assert 'parallel should be True/False' in str(e.value)
+
+
+@pytest.mark.unittest
+def test_open_partitioned_dataset_parallel_synthetic(tmp_path):
+    """
+    opening partitions in a thread pool gives the same merged dataset as opening them one after another
+    """
+    grid = xu.Ugrid2d.from_structured_intervals1d(np.linspace(0,4000,41), np.linspace(0,3000,31))
+    ds = xr.Dataset()
+    ds["mesh2d_s1"] = (("time", grid.face_dimension), np.random.default_rng(0).random((3, grid.n_face)))
+    ds["time"] = xr.DataArray([0., 3600., 7200.], dims="time", attrs={"units":"seconds since 2020-01-01"})
+    uds = xu.UgridDataset(ds, grids=[grid])
+    for ipart in range(3):
+        face_index = np.flatnonzero((grid.face_x >= ipart*4000/3) & (grid.face_x < (ipart+1)*4000/3))
+        uds_part = uds.isel({grid.face_dimension:face_index})
+        uds_part["mesh2d_flowelem_domain"] = xr.DataArray(np.full(uds_part.grid.n_face, ipart), dims=grid.face_dimension)
+        uds_part.ugrid.to_netcdf(os.path.join(tmp_path, f"synthetic_{ipart:04d}_map.nc"))
+    file_nc = os.path.join(tmp_path, "synthetic_0*_map.nc")
+    
+    uds_serial = dfmt.open_partitioned_dataset(file_nc)
+    uds_thread = dfmt.open_partitioned_dataset(file_nc, parallel="thread", max_workers=2)
+    assert uds_thread.grid.n_face == grid.n_face
+    assert list(uds_serial.variables) == list(uds_thread.variables)
+    assert np.array_equal(uds_serial.mesh2d_s1.to_numpy(), uds_thread.mesh2d_s1.to_numpy())
+    assert np.allclose(np.sort(uds_thread.mesh2d_s1.to_numpy(), axis=None), np.sort(ds.mesh2d_s1.to_numpy(), axis=None))
+    
+    with pytest.raises(ValueError) as e:
+        dfmt.open_partitioned_dataset(file_nc, parallel="process")
+    assert 'parallel should be True/False or "thread"' in str(e.value)
+
+
+@pytest.mark.unittest
+def test_open_partitioned_dataset_topology_cache(tmp_path):
+    file_nc = dfmt.data.fm_grevelingen_map(return_filepath=True)
+    file_cache = os.path.join(tmp_path, "Grevelingen-FM_topology_cache.nc")
+    uds_nocache = dfmt.open_partitioned_dataset(file_nc)
+    
+    # first call writes the cache, second call reads it
+    uds_write = dfmt.open_partitioned_dataset(file_nc, topology_cache=file_cache)
+    assert os.path.exists(file_cache)
+    uds_read = dfmt.open_partitioned_dataset(file_nc, topology_cache=file_cache)
+    
+    s1_nocache = uds_nocache.mesh2d_s1.isel(time=-1).to_numpy()
+    for uds in [uds_write, uds_read]:
+        assert set(uds.variables) == set(uds_nocache.variables)
+        assert np.array_equal(uds.grid.face_node_connectivity, uds_nocache.grid.face_node_connectivity)
+        assert np.array_equal(uds.grid.edge_node_connectivity, uds_nocache.grid.edge_node_connectivity)
+        s1 = uds.mesh2d_s1.isel(time=-1).to_numpy()
+        assert np.array_equal(s1, s1_nocache, equal_nan=True)
+    
+    # cache is not valid for other options that alter the partition topology
+    file_list = dfmt.xugrid_helpers.file_to_list(file_nc)
+    cache_key = dfmt.xugrid_helpers.get_partitions_cache_key(file_list, remove_edges=False, remove_ghost=False)
+    assert dfmt.xugrid_helpers.read_topology_cache(file_cache, cache_key=cache_key) is None
+
+
+@pytest.mark.unittest
+def test_ghostcellindex(tmp_path):
+    file_nc = dfmt.data.fm_grevelingen_map(return_filepath=True)
+    file_list = dfmt.xugrid_helpers.file_to_list(file_nc)
+    ghostcell_index = dfmt.GhostcellIndex.from_files(file_list)
+    assert len(ghostcell_index) == len(file_list)
+    
+    # compare to domain numbers per partition
+    for iF, file_nc_one in enumerate(file_list):
+        uds = xu.open_dataset(file_nc_one)
+        domainno = int(os.path.basename(file_nc_one).split('_')[-2])
+        idx_expected = np.flatnonzero(uds["mesh2d_flowelem_domain"].to_numpy() == domainno)
+        assert np.array_equal(ghostcell_index[iF], idx_expected)
+        assert np.array_equal(ghostcell_index[file_nc_one], idx_expected)
+    
+    # roundtrip via dataset
+    ghostcell_index_ds = dfmt.GhostcellIndex.from_dataset(ghostcell_index.to_dataset())
+    for idx1, idx2 in zip(ghostcell_index.indexes, ghostcell_index_ds.indexes):
+        assert np.array_equal(idx1, idx2)
+    
+    # ghostcell index is stored in the topology cache
+    file_cache = os.path.join(tmp_path, "Grevelingen-FM_topology_cache.nc")
+    dfmt.open_partitioned_dataset(file_nc, topology_cache=file_cache)
+    ds_cache = xr.open_dataset(file_cache)
+    assert "ghostcell_owned_index" in ds_cache.variables
+    assert ds_cache.sizes["ghostcell_owned_index"] == sum(len(x) for x in ghostcell_index.indexes)
+
+
+@pytest.mark.unittest
+def test_open_partitioned_dataset_time_slice_variables():
+    file_nc = dfmt.data.fm_grevelingen_map(return_filepath=True)
+    uds_full = dfmt.open_partitioned_dataset(file_nc)
+    time_slice = slice(uds_full.time.to_numpy()[2], uds_full.time.to_numpy()[5])
+    uds_sel = dfmt.open_partitioned_dataset(file_nc, time_slice=time_slice, variables=["mesh2d_s1"])
+    
+    assert uds_sel.sizes["time"] == 4
+    assert "mesh2d_s1" in uds_sel.data_vars
+    assert "mesh2d_sa1" not in uds_sel.data_vars
+    assert uds_sel.grid.n_face == uds_full.grid.n_face
+    s1_full = uds_full.mesh2d_s1.sel(time=time_slice).to_numpy()
+    s1_sel = uds_sel.mesh2d_s1.to_numpy()
+    assert np.array_equal(s1_full, s1_sel, equal_nan=True)
+
+
+@pytest.mark.unittest
+def test_open_partitioned_dataset_variables_missing():
+    file_nc = dfmt.data.fm_grevelingen_map(return_filepath=True)
+    with pytest.raises(KeyError) as e:
+        dfmt.open_partitioned_dataset(file_nc, variables=["nonexistent"])
+    assert "requested variables not present" in str(e.value)
+
+
+@pytest.mark.unittest
+def test_mapfiles_to_zarr(tmp_path):
+    file_nc = dfmt.data.fm_grevelingen_map(return_filepath=True)
+    file_zarr = os.path.join(tmp_path, "Grevelingen-FM_map.zarr")
+    uds_nc = dfmt.open_partitioned_dataset(file_nc)
+    uds_zarr = dfmt.mapfiles_to_zarr(file_nc, file_zarr, chunks="time series", max_memory_mb=1)
+    
+    assert isinstance(uds_zarr, xu.UgridDataset)
+    assert uds_zarr.grid.n_face == uds_nc.grid.n_face
+    assert uds_zarr.attrs["ntimes_written"] == uds_nc.sizes["time"]
+    s1_nc = uds_nc.mesh2d_s1.isel(mesh2d_nFaces=100).to_numpy()
+    s1_zarr = uds_zarr.mesh2d_s1.isel(mesh2d_nFaces=100).to_numpy()
+    assert np.array_equal(s1_nc, s1_zarr, equal_nan=True)
+    
+    # existing store with other arguments
+    with pytest.raises(FileExistsError):
+        dfmt.mapfiles_to_zarr(file_nc, file_zarr, chunks="map snapshot")
+
+
+@pytest.mark.unittest
+def test_mapfiles_to_reference(tmp_path):
+    file_nc = dfmt.data.fm_grevelingen_map(return_filepath=True)
+    file_ref = os.path.join(tmp_path, "Grevelingen-FM_map_reference.json")
+    uds_nc = dfmt.open_partitioned_dataset(file_nc)
+    dfmt.mapfiles_to_reference(file_nc, file_ref)
+    uds_ref = dfmt.open_partitioned_dataset(file_ref)
+    
+    assert isinstance(uds_ref, xu.UgridDataset)
+    assert uds_ref.grid.n_face == uds_nc.grid.n_face
+    assert np.array_equal(uds_ref.grid.face_node_connectivity, uds_nc.grid.face_node_connectivity)
+    assert set(uds_ref.data_vars) == set(uds_nc.data_vars)
+    s1_nc = uds_nc.mesh2d_s1.isel(time=-1).to_numpy()
+    s1_ref = uds_ref.mesh2d_s1.isel(time=-1).to_numpy()
+    assert np.array_equal(s1_nc, s1_ref, equal_nan=True)
+
+
+@pytest.mark.unittest
+def test_outputfollower_map():
+    file_nc = dfmt.data.fm_grevelingen_map(return_filepath=True)
+    uds_nc = dfmt.open_partitioned_dataset(file_nc)
+    follower = dfmt.OutputFollower(file_nc)
+    uds_first = follower.refresh()
+    uds_final = follower.refresh(final=True)
+    uds_second = follower.refresh(final=True)
+    
+    assert isinstance(uds_first, xu.UgridDataset)
+    assert uds_first.grid.n_face == uds_nc.grid.n_face
+    # the last timestep is only read upon the final refresh
+    assert uds_first.sizes["time"] == uds_nc.sizes["time"] - 1
+    assert uds_final.sizes["time"] == 1
+    assert follower.ntimes_read == uds_nc.sizes["time"]
+    # no new timesteps in a finished simulation
+    assert uds_second.sizes["time"] == 0
+    s1_nc = uds_nc.mesh2d_s1.isel(time=-1).to_numpy()
+    s1_final = uds_final.mesh2d_s1.isel(time=-1).to_numpy()
+    assert np.array_equal(s1_nc, s1_final, equal_nan=True)
+
+
+@pytest.mark.unittest
+def test_outputfollower_his():
+    file_nc = dfmt.data.fm_grevelingen_his(return_filepath=True)
+    ds_his = xr.open_mfdataset(file_nc, preprocess=dfmt.preprocess_hisnc)
+    follower = dfmt.OutputFollower(file_nc)
+    ds_first = follower.refresh(final=True)
+    ds_second = follower.refresh(final=True)
+    
+    assert ds_first.sizes == ds_his.sizes
+    assert (ds_first.stations == ds_his.stations).all()
+    assert ds_second.sizes["time"] == 0
+
+
+@pytest.mark.unittest
+def test_outputfollower_partly_written_timestep(tmp_path):
+    """
+    D-Flow FM extends the time dimension before the variables of the new timestep 
+    are written, so the last timestep should only be read once it is complete
+    """
+    grid = xu.Ugrid2d.from_structured_intervals1d(np.linspace(0,400,5), np.linspace(0,300,4))
+    ds = xr.Dataset()
+    ds["mesh2d_s1"] = (("time", grid.face_dimension), np.zeros((2, grid.n_face)))
+    ds["time"] = xr.DataArray([0., 3600.], dims="time", attrs={"units":"seconds since 2020-01-01"})
+    file_nc = os.path.join(tmp_path, "follower_map.nc")
+    xu.UgridDataset(ds, grids=[grid]).ugrid.to_netcdf(file_nc, unlimited_dims=["time"])
+    
+    follower = dfmt.OutputFollower(file_nc)
+    uds_first = follower.refresh()
+    assert uds_first.sizes["time"] == 1
+    
+    # first stage of writing timestep 3: only the time dimension is extended
+    with netCDF4.Dataset(file_nc, "a") as nc:
+        nc.variables["time"][2] = 7200.
+    uds_second = follower.refresh()
+    assert uds_second.sizes["time"] == 1
+    assert (uds_second.mesh2d_s1 == 0).all()
+    
+    # second stage: the values of timestep 3 are written
+    with netCDF4.Dataset(file_nc, "a") as nc:
+        nc.variables["mesh2d_s1"][2,:] = 2
+    uds_third = follower.refresh(final=True)
+    assert uds_third.sizes["time"] == 1
+    assert (uds_third.mesh2d_s1 == 2).all()
+    assert follower.ntimes_read == 3